@@ -61,6 +61,8 @@ CONN_MAX_AGE = 60
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
+    'bhushan_web_app.middleware.RequestInstrumentationMiddleware',
+    'bhushan_web_app.middleware.InvalidationCoalescingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -120,7 +122,7 @@ else:
 
 CACHES = {
     "default": {
-        "BACKEND": "django_redis.cache.RedisCache",
+        "BACKEND": "bhushan_web_app.cache_utils.InstrumentedRedisCache",
         "LOCATION": REDIS_URL,
         "OPTIONS": {
             "CLIENT_CLASS": "django_redis.client.DefaultClient",
@@ -138,10 +140,83 @@ CACHES = {
 
 CELERY_RESULT_BACKEND = CELERY_BROKER_URL
 CELERY_BROKER_TRANSPORT_OPTIONS = {'visibility_timeout': 3600, 'socket_keepalive': True, 'socket_connect_timeout': 5}
+CELERY_BEAT_SCHEDULE = {
+    # Safety net for stats changed outside model signals (queryset.update, raw SQL)
+    'refresh-catalog-stats': {
+        'task': 'bhushan_web_app.tasks.refresh_catalog_stats',
+        'schedule': 15 * 60,
+    },
+    'build-recommendations': {
+        'task': 'bhushan_web_app.tasks.build_recommendations',
+        'schedule': 6 * 60 * 60,
+    },
+    'materialize-trending': {
+        'task': 'bhushan_web_app.tasks.materialize_trending',
+        'schedule': 10 * 60,
+    },
+    # Order changes rebuild their day within seconds; this catches
+    # queryset.update() / raw SQL on recent orders
+    'backfill-sales-rollups': {
+        'task': 'bhushan_web_app.tasks.backfill_sales_rollups',
+        'schedule': 60 * 60,
+        'kwargs': {'days': 2},
+    },
+    'archive-orders': {
+        'task': 'bhushan_web_app.tasks.archive_orders',
+        'schedule': 24 * 60 * 60,
+    },
+    # Safety net for inbox events whose queued task was lost
+    'process-payment-events': {
+        'task': 'bhushan_web_app.tasks.process_payment_events',
+        'schedule': 60,
+    },
+    'purge-idempotency-keys': {
+        'task': 'bhushan_web_app.tasks.purge_idempotency_keys',
+        'schedule': 60 * 60,
+    },
+    # Refreshes entries well before CACHE_TIMEOUT; invalidations re-warm sooner
+    'warm-caches': {
+        'task': 'bhushan_web_app.tasks.warm_caches',
+        'schedule': 15 * 60,
+    },
+}
 
 CACHE_TIMEOUT = 3600
 CACHE_MIDDLEWARE_SECONDS = 600
 CACHE_MIDDLEWARE_KEY_PREFIX = 'bhushan_web_app'
+# Storefront page cache (bhushan_web_app.page_cache); entries live for
+# CACHE_MIDDLEWARE_SECONDS and are keyed on the catalog generations
+PAGE_CACHE_ENABLED = os.getenv('PAGE_CACHE_ENABLED', 'True') == 'True'
+# Re-warm cached computations shortly after they are invalidated
+# (bhushan_web_app.warming); the periodic warm_caches task runs regardless
+CACHE_WARMING_ENABLED = os.getenv('CACHE_WARMING_ENABLED', 'True') == 'True'
+
+# Finished orders older than this move to the archive tables
+# (bhushan_web_app.order_archive); reads by id fall back to the archive
+ORDER_ARCHIVE_AFTER_MONTHS = int(os.getenv('ORDER_ARCHIVE_AFTER_MONTHS', 12))
+
+# Seconds a checkout/payment response is replayed for retries with the same
+# Idempotency-Key header (bhushan_web_app.idempotency)
+IDEMPOTENCY_TTL = int(os.getenv('IDEMPOTENCY_TTL', 24 * 60 * 60))
+
+# Shared secret of the payment gateway's webhook signatures
+# (bhushan_web_app.payment_events); webhooks are rejected while it is unset
+PAYMENT_WEBHOOK_SECRET = os.getenv('PAYMENT_WEBHOOK_SECRET', '')
+
+# Request instrumentation (bhushan_web_app.middleware.RequestInstrumentationMiddleware)
+INSTRUMENTATION_ENABLED = os.getenv('INSTRUMENTATION_ENABLED', 'True') == 'True'
+INSTRUMENTATION_SERVER_TIMING = True
+# Pickles every cached value to count its size; off unless debugging
+INSTRUMENTATION_CACHE_BYTES = os.getenv('INSTRUMENTATION_CACHE_BYTES', str(DEBUG)) == 'True'
+INSTRUMENTATION_SLOW_REQUEST_MS = int(os.getenv('INSTRUMENTATION_SLOW_REQUEST_MS', 500))
+INSTRUMENTATION_SLOW_SAMPLE_RATE = float(os.getenv('INSTRUMENTATION_SLOW_SAMPLE_RATE', 1.0))
+INSTRUMENTATION_TOP_SQL = 5
+
+# Prometheus metrics (bhushan_web_app.metrics), scraped from /metrics
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'True') == 'True'
+METRICS_ALLOWED_IPS = [ip for ip in os.getenv('METRICS_ALLOWED_IPS', '127.0.0.1').split(',') if ip]
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+METRICS_CELERY_QUEUES = ['celery']
 
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
@@ -255,14 +330,20 @@ LOGGING = {
     'disable_existing_loggers': False,
     'handlers': {
         'file': {
-            'level': 'INFO',
+            'level': 'DEBUG',
             'class': 'logging.FileHandler',
             'filename': os.path.join(LOG_DIR, 'debug.log'),
         },
-        'console': {'level': 'INFO','class': 'logging.StreamHandler',},
+        'console': {'level': 'DEBUG','class': 'logging.StreamHandler',},
     },
     'loggers': {
         'django': {'handlers': ['file', 'console'], 'level': 'INFO', 'propagate': True,},
         'bhushan_app': {'handlers': ['file', 'console'], 'level': 'INFO', 'propagate': False,},
+        # The per-request lines are DEBUG; slow requests are WARNING
+        'bhushan_web_app.instrumentation': {
+            'handlers': ['file', 'console'],
+            'level': os.getenv('INSTRUMENTATION_LOG_LEVEL', 'DEBUG' if DEBUG else 'INFO'),
+            'propagate': False,
+        },
     },
 }
@@ -1,12 +1,14 @@
 
 from django.contrib import admin
+from .images import rendition_url
 from django.utils.html import format_html
+from . import exports, order_status
 from .models import (
     Category, Brand, Product, ProductImage, 
     ProductVariation, Order, OrderItem, 
     Review, User, Address, Cart, Payment,
     OTP, CartItem, OrderTracking, Wishlist,
-    RecentlyViewed,ContactMessage
+    RecentlyViewed,ContactMessage, ArchivedOrder, ArchivedOrderItem, PaymentEvent
 )
 
 
@@ -29,6 +31,27 @@ class OrderItemInline(admin.TabularInline):
     can_delete = False
 
 
+class ArchivedOrderItemInline(admin.TabularInline):
+    model = ArchivedOrderItem
+    extra = 0
+    readonly_fields = ['product', 'product_name', 'quantity', 'unit_price', 'total_price']
+    can_delete = False
+
+
+# ============ EXPORT ACTIONS (Reusable) ============
+class ExportActionsMixin:
+    """CSV / JSON lines download of the selected rows (exports.py)"""
+    export_name = None
+
+    def export_csv(self, request, queryset):
+        return exports.streaming_response(self.export_name, queryset, 'csv')
+    export_csv.short_description = 'Export selected as CSV'
+
+    def export_jsonl(self, request, queryset):
+        return exports.streaming_response(self.export_name, queryset, 'jsonl')
+    export_jsonl.short_description = 'Export selected as JSON lines'
+
+
 # ============ ADMIN CLASSES ============
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
@@ -45,16 +68,20 @@ class BrandAdmin(admin.ModelAdmin):
 
 
 @admin.register(Product)
-class ProductAdmin(admin.ModelAdmin):
+class ProductAdmin(ExportActionsMixin, admin.ModelAdmin):
     list_display = ['name', 'sku', 'category', 'price', 'stock', 'is_active', 'image_tag']
     list_filter = ['is_active', 'is_featured', 'category', 'brand']
     search_fields = ['name', 'sku']
     prepopulated_fields = {'slug': ('name',)}
     inlines = [ProductImageInline, ProductVariationInline]
+    actions = ['export_csv', 'export_jsonl']
+    export_name = 'products'
     
     def image_tag(self, obj):
         img = obj.images.filter(is_primary=True).first()
-        return format_html('<img src="{}" width="50"/>', img.image.url) if img else "—"
+        if not img:
+            return "—"
+        return format_html('<img src="{}" width="50"/>', rendition_url(img.image, img.renditions, 'thumb'))
     image_tag.short_description = 'Image'
 
 
@@ -63,19 +90,54 @@ class ProductImageAdmin(admin.ModelAdmin):
     list_display = ['product', 'preview', 'is_primary']
     
     def preview(self, obj):
-        return format_html('<img src="{}" width="75"/>', obj.image.url) if obj.image else "—"
+        if not obj.image:
+            return "—"
+        return format_html('<img src="{}" width="75"/>', rendition_url(obj.image, obj.renditions, 'thumb'))
 
 
 
 
 
 @admin.register(Order)
-class OrderAdmin(admin.ModelAdmin):
+class OrderAdmin(ExportActionsMixin, admin.ModelAdmin):
     list_display = ['order_number', 'user', 'status', 'total_amount', 'created_at']
     list_filter = ['status', 'created_at']
     search_fields = ['order_number', 'user__mobile']
     inlines = [OrderItemInline]
-    readonly_fields = ['order_number', 'created_at']
+    # Status only changes through the actions below (the state machine)
+    readonly_fields = ['order_number', 'status', 'created_at']
+    actions = ['mark_processing', 'mark_shipped', 'mark_delivered', 'export_csv', 'export_jsonl']
+    export_name = 'orders'
+
+    def _transition(self, request, queryset, status):
+        # Through the state machine, so tracking and events follow
+        selected = queryset.count()
+        moved = order_status.bulk_transition(queryset, status, message=f'Order {status}')
+        self.message_user(request, f"{len(moved)} orders marked {status}, {selected - len(moved)} skipped")
+
+    def mark_processing(self, request, queryset):
+        self._transition(request, queryset, 'processing')
+
+    def mark_shipped(self, request, queryset):
+        self._transition(request, queryset, 'shipped')
+
+    def mark_delivered(self, request, queryset):
+        self._transition(request, queryset, 'delivered')
+
+
+@admin.register(ArchivedOrder)
+class ArchivedOrderAdmin(admin.ModelAdmin):
+    list_display = ['order_number', 'user', 'status', 'total_amount', 'created_at', 'archived_at']
+    list_filter = ['status', 'created_at']
+    search_fields = ['order_number', 'user__mobile']
+    inlines = [ArchivedOrderItemInline]
+
+    # Archived orders are final; they are only looked up here
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
 
 
 @admin.register(Review)
@@ -115,15 +177,29 @@ class PaymentAdmin(admin.ModelAdmin):
     list_filter = ['status', 'payment_method']
 
 
+@admin.register(PaymentEvent)
+class PaymentEventAdmin(admin.ModelAdmin):
+    list_display = ['event_type', 'transaction_id', 'amount', 'source', 'status', 'received_at']
+    list_filter = ['status', 'event_type', 'source']
+    search_fields = ['transaction_id', 'payment_ref']
+    readonly_fields = ['event_type', 'transaction_id', 'payment_ref', 'amount', 'source',
+                       'payload', 'status', 'error', 'received_at', 'processed_at']
+
+    # The inbox is append-only; the consumer sets the outcome
+    def has_add_permission(self, request):
+        return False
+
+
 
 
 @admin.register(ContactMessage)
-class ContactMessageAdmin(admin.ModelAdmin):
+class ContactMessageAdmin(ExportActionsMixin, admin.ModelAdmin):
     list_display = ['name', 'email', 'phone', 'subject', 'created_at', 'is_read']
     list_filter = ['is_read', 'created_at']
     search_fields = ['name', 'email', 'phone', 'subject', 'message']
     readonly_fields = ['created_at']
     date_hierarchy = 'created_at'
+    export_name = 'contact_messages'
     
     fieldsets = (
         ('Contact Information', {
@@ -145,7 +221,7 @@ class ContactMessageAdmin(admin.ModelAdmin):
         queryset.update(is_read=False)
     mark_as_unread.short_description = "Mark selected messages as unread"
     
-    actions = [mark_as_read, mark_as_unread]
+    actions = [mark_as_read, mark_as_unread, 'export_csv', 'export_jsonl']
 
 
 
@@ -157,28 +233,11 @@ class EcommerceAdminSite(admin.AdminSite):
     def index(self, request, extra_context=None):
         extra_context = extra_context or {}
         
-        # Add statistics
-        from django.db.models import Sum, Count
-        from datetime import timedelta
-        from django.utils import timezone
-        
-        today = timezone.now().date()
-        week_ago = today - timedelta(days=7)
-        month_ago = today - timedelta(days=30)
-        
-        extra_context['total_users'] = User.objects.count()
+        # Order and user numbers come from the daily sales rollups
+        from .sales_rollups import dashboard_stats
+
+        extra_context.update(dashboard_stats())
         extra_context['total_products'] = Product.objects.filter(is_active=True).count()
-        extra_context['total_orders'] = Order.objects.count()
-        extra_context['orders_today'] = Order.objects.filter(created_at__date=today).count()
-        extra_context['orders_this_week'] = Order.objects.filter(created_at__date__gte=week_ago).count()
-        extra_context['revenue_today'] = Order.objects.filter(
-            created_at__date=today, 
-            status='delivered'
-        ).aggregate(total=Sum('total_amount'))['total'] or 0
-        extra_context['revenue_this_month'] = Order.objects.filter(
-            created_at__date__gte=month_ago,
-            status='delivered'
-        ).aggregate(total=Sum('total_amount'))['total'] or 0
         
         return super().index(request, extra_context)
 
@@ -8,4 +8,5 @@ class BhushanWebAppConfig(AppConfig):
 
     def ready(self):
         import bhushan_web_app.signals  
+        import bhushan_web_app.warming  # registers the re-warm flush hook
             
\ No newline at end of file
@@ -0,0 +1,400 @@
+# benchmarks.py
+# Synthetic catalog seeding and latency / query-count measurement for the
+# storefront's hot endpoints. Driven by the ``benchmark_storefront`` command.
+
+from decimal import Decimal
+import random
+import statistics
+import time
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils.text import slugify
+
+from .catalog_stats import refresh_all_stats
+from .recommendations import build_recommendations
+from .models import (
+    User, Address, Category, Brand, Product, ProductImage, ProductVariation,
+    Cart, CartItem, Order, OrderItem, Review,
+)
+
+# ==========================================
+# Benchmark Configuration
+# ==========================================
+
+DEFAULT_CATALOG_SIZE = {
+    'products': 500,
+    'categories': 20,
+    'brands': 15,
+    'images_per_product': 2,
+    'variations_per_product': 2,
+    'reviews_per_product': 3,
+    'users': 50,
+    'orders': 200,
+}
+
+BENCHMARK_CACHES = {
+    'locmem': {
+        'default': {
+            'BACKEND': 'bhushan_web_app.cache_utils.LocalRedisCache',
+            'LOCATION': 'storefront-benchmark',
+        }
+    },
+}
+
+PERCENTILES = (50, 90, 95, 99)
+BENCHMARK_MOBILE_PREFIX = '99'  # Synthetic users get 99XXXXXXXX mobiles
+BULK_BATCH_SIZE = 1000
+
+
+# ==========================================
+# Catalog Seeding
+# ==========================================
+
+def seed_catalog(products=None, categories=None, brands=None,
+                 images_per_product=None, variations_per_product=None,
+                 reviews_per_product=None, users=None, orders=None, seed=42):
+    """
+    Bulk-create a synthetic catalog and order history.
+    Uses bulk_create so seeding does not fire model signals; the
+    benchmark measures request handling, not fixture creation.
+    Returns a dict with the created counts and sample objects to hit.
+    """
+    size = dict(DEFAULT_CATALOG_SIZE)
+    overrides = {
+        'products': products, 'categories': categories, 'brands': brands,
+        'images_per_product': images_per_product,
+        'variations_per_product': variations_per_product,
+        'reviews_per_product': reviews_per_product,
+        'users': users, 'orders': orders,
+    }
+    size.update({k: v for k, v in overrides.items() if v is not None})
+    rng = random.Random(seed)
+
+    # Categories: a third are roots, the rest hang under a random root
+    root_count = max(1, size['categories'] // 3)
+    category_objs = []
+    for i in range(size['categories']):
+        parent = category_objs[rng.randrange(root_count)] if i >= root_count else None
+        name = f"Bench Category {i}"
+        category = Category(name=name, slug=slugify(name), parent=parent, display_order=i)
+        # bulk_create skips Category.save(), so fill the materialized path here
+        category.path = f"{parent.path if parent else '/'}{category.id.hex}/"
+        category.depth = parent.depth + 1 if parent else 0
+        category_objs.append(category)
+    Category.objects.bulk_create(category_objs, batch_size=BULK_BATCH_SIZE)
+
+    brand_objs = [
+        Brand(name=f"Bench Brand {i}", slug=f"bench-brand-{i}")
+        for i in range(size['brands'])
+    ]
+    Brand.objects.bulk_create(brand_objs, batch_size=BULK_BATCH_SIZE)
+
+    product_objs = []
+    for i in range(size['products']):
+        price = Decimal(rng.randrange(100, 100000)) / 100
+        on_sale = rng.random() < 0.3
+        name = f"Bench Product {i}"
+        product_objs.append(Product(
+            name=name,
+            slug=slugify(name),
+            sku=f"BENCH-{i:07d}",
+            category=rng.choice(category_objs),
+            brand=rng.choice(brand_objs) if brand_objs else None,
+            description=f"Synthetic benchmark product number {i}.",
+            short_description=f"Benchmark product {i}",
+            price=price,
+            compare_price=(price * Decimal('1.25')).quantize(Decimal('0.01')) if on_sale else None,
+            stock=rng.randrange(0, 500),
+            is_featured=rng.random() < 0.1,
+            sales_count=rng.randrange(0, 1000),
+            views_count=rng.randrange(0, 10000),
+        ))
+    Product.objects.bulk_create(product_objs, batch_size=BULK_BATCH_SIZE)
+
+    image_objs = []
+    variation_objs = []
+    for product in product_objs:
+        for n in range(size['images_per_product']):
+            image_objs.append(ProductImage(
+                product=product,
+                image=f"products/{product.sku.lower()}-{n}.jpg",
+                alt_text=product.name,
+                is_primary=(n == 0),
+                display_order=n,
+            ))
+        for n in range(size['variations_per_product']):
+            variation_objs.append(ProductVariation(
+                product=product,
+                variation_type='size',
+                variation_value=f"S{n}",
+                price_adjustment=Decimal(n * 10),
+                stock=rng.randrange(0, 100),
+                sku_suffix=f"S{n}",
+            ))
+    ProductImage.objects.bulk_create(image_objs, batch_size=BULK_BATCH_SIZE)
+    ProductVariation.objects.bulk_create(variation_objs, batch_size=BULK_BATCH_SIZE)
+
+    user_objs = [
+        User(
+            mobile=f"{BENCHMARK_MOBILE_PREFIX}{i:08d}",
+            username=f"{BENCHMARK_MOBILE_PREFIX}{i:08d}",
+            first_name='Bench', last_name=f"User {i}",
+            email=f"bench{i}@example.com",
+            is_mobile_verified=True, profile_completed=True,
+        )
+        for i in range(max(1, size['users']))
+    ]
+    User.objects.bulk_create(user_objs, batch_size=BULK_BATCH_SIZE)
+
+    address_objs = [
+        Address(
+            user=user, full_name=user.get_full_name(), mobile=user.mobile,
+            pincode='411001', address_line1='1 Benchmark Road',
+            city='Pune', state='Maharashtra', is_default=True,
+        )
+        for user in user_objs
+    ]
+    Address.objects.bulk_create(address_objs, batch_size=BULK_BATCH_SIZE)
+
+    review_objs = []
+    for product in product_objs:
+        reviewers = rng.sample(user_objs, min(size['reviews_per_product'], len(user_objs)))
+        for user in reviewers:
+            review_objs.append(Review(
+                product=product, user=user, rating=rng.randint(1, 5),
+                title='Benchmark review', comment='Synthetic review text.',
+                is_approved=rng.random() < 0.8,
+            ))
+    Review.objects.bulk_create(review_objs, batch_size=BULK_BATCH_SIZE)
+
+    order_objs = []
+    order_item_objs = []
+    statuses = [choice for choice, _ in Order.STATUS_CHOICES]
+    for i in range(size['orders']):
+        user_index = rng.randrange(len(user_objs))
+        lines = rng.sample(product_objs, min(3, len(product_objs)))
+        subtotal = Decimal('0')
+        order = Order(
+            order_number=f"BENCH{i:010d}",
+            user=user_objs[user_index],
+            status=rng.choice(statuses),
+            shipping_address=address_objs[user_index],
+            billing_address=address_objs[user_index],
+            subtotal=0, total_amount=0,
+        )
+        for product in lines:
+            quantity = rng.randint(1, 3)
+            subtotal += product.price * quantity
+            order_item_objs.append(OrderItem(
+                order=order, product=product, product_name=product.name,
+                sku=product.sku, quantity=quantity, unit_price=product.price,
+                total_price=product.price * quantity,
+            ))
+        order.subtotal = subtotal
+        order.tax_amount = (subtotal * Decimal('0.18')).quantize(Decimal('0.01'))
+        order.total_amount = order.subtotal + order.tax_amount
+        order_objs.append(order)
+    Order.objects.bulk_create(order_objs, batch_size=BULK_BATCH_SIZE)
+    OrderItem.objects.bulk_create(order_item_objs, batch_size=BULK_BATCH_SIZE)
+
+    # bulk_create bypasses the signals that maintain the materialized stats;
+    # recommendations are normally built by a periodic task
+    refresh_all_stats()
+    build_recommendations()
+
+    return {
+        'size': size,
+        'counts': {
+            'categories': len(category_objs),
+            'brands': len(brand_objs),
+            'products': len(product_objs),
+            'product_images': len(image_objs),
+            'product_variations': len(variation_objs),
+            'users': len(user_objs),
+            'reviews': len(review_objs),
+            'orders': len(order_objs),
+            'order_items': len(order_item_objs),
+        },
+        'sample': {
+            'user': user_objs[0],
+            'address': address_objs[0],
+            'products': product_objs[:20] or product_objs,
+            'category': category_objs[0],
+            'brand': brand_objs[0] if brand_objs else None,
+        },
+    }
+
+
+# ==========================================
+# Measurement Helpers
+# ==========================================
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[rank]
+
+
+def summarize(timings_ms, query_counts, statuses):
+    """Reduce raw samples to the machine-readable summary for one endpoint"""
+    summary = {
+        'iterations': len(timings_ms),
+        'mean_ms': round(statistics.fmean(timings_ms), 3) if timings_ms else None,
+        'min_ms': round(min(timings_ms), 3) if timings_ms else None,
+        'max_ms': round(max(timings_ms), 3) if timings_ms else None,
+        'queries_median': statistics.median(query_counts) if query_counts else None,
+        'queries_max': max(query_counts) if query_counts else None,
+        'status_codes': sorted(set(statuses)),
+    }
+    for pct in PERCENTILES:
+        value = percentile(timings_ms, pct)
+        summary[f'p{pct}_ms'] = round(value, 3) if value is not None else None
+    return summary
+
+
+def timed_request(client, method, path, data=None, content_type=None):
+    """Issue one request, returning (elapsed_ms, query_count, status_code)"""
+    kwargs = {}
+    if content_type:
+        kwargs['content_type'] = content_type
+    with CaptureQueriesContext(connection) as ctx:
+        start = time.perf_counter()
+        response = getattr(client, method)(path, data, **kwargs)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+    return elapsed_ms, len(ctx.captured_queries), response.status_code
+
+
+class EndpointBenchmark:
+    """
+    One measured endpoint.
+    ``setup`` runs before every iteration outside the timed region, so
+    stateful flows (cart, checkout) can be reset between samples.
+    """
+
+    def __init__(self, name, method, path, data=None, client=None,
+                 setup=None, content_type=None):
+        self.name = name
+        self.method = method
+        self.path = path
+        self.data = data
+        self.client = client or Client(raise_request_exception=False)
+        self.setup = setup
+        self.content_type = content_type
+
+    def _sample(self):
+        if self.setup:
+            self.setup()
+        return timed_request(self.client, self.method, self.path,
+                             self.data, self.content_type)
+
+    def run(self, iterations, warmup=1):
+        # Cold sample: empty cache, measures the miss path
+        cache.clear()
+        cold_ms, cold_queries, cold_status = self._sample()
+
+        for _ in range(warmup):
+            self._sample()
+
+        timings, queries, statuses = [], [], [cold_status]
+        for _ in range(iterations):
+            elapsed_ms, query_count, status_code = self._sample()
+            timings.append(elapsed_ms)
+            queries.append(query_count)
+            statuses.append(status_code)
+
+        result = summarize(timings, queries, statuses)
+        result.update({
+            'name': self.name,
+            'method': self.method.upper(),
+            'path': self.path,
+            'cold_ms': round(cold_ms, 3),
+            'cold_queries': cold_queries,
+        })
+        return result
+
+
+# ==========================================
+# Storefront Scenario
+# ==========================================
+
+def build_storefront_benchmarks(catalog):
+    """Build the list of endpoint benchmarks for a seeded catalog"""
+    sample = catalog['sample']
+    user = sample['user']
+    address = sample['address']
+    product = sample['products'][0]
+    category = sample['category']
+
+    # Server errors are recorded as status codes instead of aborting the run
+    anonymous = Client(raise_request_exception=False)
+    customer = Client(raise_request_exception=False)
+    customer.force_login(user)
+
+    cart, _ = Cart.objects.get_or_create(user=user)
+
+    def fill_cart():
+        """Put a few lines in the customer's cart before each checkout"""
+        if cart.items.exists():
+            return
+        CartItem.objects.bulk_create([
+            CartItem(cart=cart, product=p, quantity=1, price=p.price)
+            for p in sample['products'][:3]
+        ])
+
+    def empty_cart():
+        cart.items.all().delete()
+
+    filtered_url = reverse('shop:api-filtered-products')
+    # 'product-detail' and 'cart-detail' are shadowed by the DRF router's
+    # route names, so those page URLs are spelled out
+    product_url = f"/products/{product.slug}/"
+    cart_url = '/cart/api/'
+
+    return [
+        EndpointBenchmark('home', 'get', reverse('shop:home'), client=anonymous),
+        EndpointBenchmark('products', 'get', reverse('shop:products'), client=anonymous),
+        EndpointBenchmark('filtered_products:all', 'get', filtered_url,
+                          client=anonymous),
+        EndpointBenchmark('filtered_products:category', 'get', filtered_url,
+                          data={'category': str(category.id), 'sort': 'price'},
+                          client=anonymous),
+        EndpointBenchmark('filtered_products:search', 'get', filtered_url,
+                          data={'search': 'Product 1', 'tab': 'sale'},
+                          client=anonymous),
+        EndpointBenchmark('product_detail:anonymous', 'get',
+                          product_url, client=anonymous),
+        EndpointBenchmark('product_detail:customer', 'get',
+                          product_url, client=customer),
+        EndpointBenchmark('category_products', 'get',
+                          reverse('shop:category-products', args=[category.slug]),
+                          client=anonymous),
+        EndpointBenchmark('cart:add', 'post', reverse('shop:add-to-cart'),
+                          data={'product_id': str(product.id), 'quantity': 1},
+                          client=customer, setup=empty_cart,
+                          content_type='application/json'),
+        EndpointBenchmark('cart:detail', 'get', cart_url,
+                          client=customer, setup=fill_cart),
+        EndpointBenchmark('cart:page', 'get', reverse('shop:cart-page'),
+                          client=customer, setup=fill_cart),
+        EndpointBenchmark('orders:create', 'post', reverse('shop:create-order'),
+                          data={'shipping_address_id': str(address.id)},
+                          client=customer, setup=fill_cart,
+                          content_type='application/json'),
+    ]
+
+
+def run_storefront_benchmarks(catalog, iterations=20, warmup=1, only=None):
+    """Run every storefront benchmark (or the ``only`` subset) and collect results"""
+    results = []
+    for benchmark in build_storefront_benchmarks(catalog):
+        if only and not any(benchmark.name.startswith(name) for name in only):
+            continue
+        results.append(benchmark.run(iterations, warmup=warmup))
+    return results
@@ -1,11 +1,20 @@
 # cache_utils.py
 # Place this file in your Django app directory for easy cache management
 
-from django.core.cache import cache
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
 from django.db.models import Count, Q, F
+from django_redis.cache import RedisCache
+from contextlib import contextmanager
+from contextvars import ContextVar
+import fnmatch
 import hashlib
 import json
 import logging
+import threading
+import time
+
+from .instrumentation import current_stats
 
 logger = logging.getLogger(__name__)
 
@@ -22,24 +31,43 @@ CACHE_VERSION = 1  # Increment this to invalidate all caches
 # ==========================================
 
 class CacheKeys:
-    """Centralized cache keys management"""
+    """
+    Centralized cache keys management. Catalog reads (catalog.py) live
+    under catalog:<computation name>.
+    """
+    
+    CATALOG_PREFIX = 'catalog:'
     
     # Product caches
-    ALL_PRODUCTS = 'products:all'
-    FEATURED_PRODUCTS = 'products:featured:home'
-    NEW_ARRIVALS = 'products:new:home'
-    TOP_SELLING = 'products:top_selling:home'
-    PRICE_RANGE = 'products:price_range'
+    STOREFRONT_PRODUCTS = 'catalog:storefront_products'  # ProductsView
+    FEATURED_PRODUCTS = 'catalog:featured_products'
+    NEW_ARRIVALS = 'catalog:new_arrivals'
+    TOP_SELLING = 'catalog:top_selling'
+    PRICE_RANGE = 'catalog:price_range'
     
     # Category caches
-    ACTIVE_CATEGORIES = 'categories:active'
-    MEGA_MENU_CATEGORIES = 'categories:mega_menu'
+    CATEGORY_INDEX = 'catalog:category_index'
+    CATEGORY_STATS = 'catalog:category_stats'
     
     # Brand caches
-    ACTIVE_BRANDS = 'brands:active'
+    ACTIVE_BRANDS = 'catalog:active_brands'
+    
+    # Filtered products (pattern); the top_selling tab reads the trending
+    # lists and is also dropped on its own when they are rebuilt
+    FILTERED_PRODUCTS_PATTERN = 'catalog:filtered_products:*'
+    FILTERED_TOP_SELLING_PATTERN = 'catalog:filtered_products:top_selling:*'
     
-    # Filtered products (pattern)
-    FILTERED_PRODUCTS_PATTERN = 'products:filtered:*'
+    @staticmethod
+    def catalog(name):
+        return f'{CacheKeys.CATALOG_PREFIX}{name}'
+    
+    @staticmethod
+    def user_stats(user_id):
+        return f'user:stats:{user_id}'
+    
+    @staticmethod
+    def idempotent_response(key):
+        return f'idempotency:{key}'
     
     @staticmethod
     def filtered_products_key(category=None, brand=None, tab='all', search='', 
@@ -47,7 +75,9 @@ class CacheKeys:
         """Generate cache key for filtered products"""
         params = f"{category}_{brand}_{tab}_{search}_{min_price}_{max_price}_{sort}"
         hash_val = hashlib.md5(params.encode()).hexdigest()
-        return f'products:filtered:{hash_val}'
+        if tab == 'top_selling':
+            return f'catalog:filtered_products:top_selling:{hash_val}'
+        return f'catalog:filtered_products:{hash_val}'
 
 
 # ==========================================
@@ -122,192 +152,113 @@ class CacheManager:
     
     @staticmethod
     def clear_pattern(pattern):
-        """Clear all cache keys matching a pattern"""
+        """Clear all cache keys matching a pattern (SCAN-based, never KEYS)"""
+        from .invalidation import delete_pattern
+
         try:
-            keys = cache.keys(pattern)
-            if keys:
-                cache.delete_many(keys)
-                logger.info(f"Cache pattern DELETE: {pattern} ({len(keys)} keys)")
-            return len(keys)
+            count = delete_pattern(pattern) or 0
+            logger.info(f"Cache pattern DELETE: {pattern} ({count} keys)")
+            return count
         except Exception as e:
             logger.error(f"Error clearing cache pattern {pattern}: {str(e)}")
             return 0
 
+    @staticmethod
+    def exists_many(keys):
+        """
+        {key: bool} for several keys without fetching their values.
+        On Redis this is a single pipelined round trip of EXISTS commands.
+        """
+        keys = list(keys)
+        try:
+            if hasattr(cache, 'client') and hasattr(cache.client, 'get_client'):
+                client = cache.client.get_client(write=False)
+                pipe = client.pipeline(transaction=False)
+                for key in keys:
+                    pipe.exists(cache.make_key(key))
+                return {key: bool(found) for key, found in zip(keys, pipe.execute())}
+            return {key: cache.has_key(key) for key in keys}
+        except Exception as e:
+            logger.error(f"Error checking cache keys: {str(e)}")
+            return {key: False for key in keys}
+
 
 # ==========================================
-# Product Cache Functions
+# Cached Computations
 # ==========================================
+# Named cache entries shared by the catalog read service (catalog.py) and
+# the cache warmer (warming.py). Calling a computation reads through the
+# cache; ``warm()`` recomputes and stores it. Entries are keyed
+# catalog:<name> (a callable ``key`` makes the computation parameterized,
+# with keys under catalog:<name>:) and all live for CACHE_TIMEOUT. ``tags``
+# are the invalidation tags (invalidation.py) that drop the entry.
+
+COMPUTATIONS = {}
+
+
+class CachedComputation:
+    timeout = CACHE_TIMEOUT
+
+    def __init__(self, name, func, tags, key=None):
+        self.name = name
+        self.func = func
+        self.key = key or CacheKeys.catalog(name)
+        self.tags = set(tags)
+        self.__doc__ = func.__doc__
+
+    @property
+    def parameterized(self):
+        return callable(self.key)
+
+    @property
+    def pattern(self):
+        """Pattern matching every entry of a parameterized computation"""
+        return f'{CacheKeys.catalog(self.name)}:*'
+
+    def key_for(self, **params):
+        return self.key(**params) if self.parameterized else self.key
+
+    def __call__(self, *args, **params):
+        if args:
+            raise TypeError(f"{self.name} takes keyword arguments only")
+        key = self.key_for(**params)
+        value = CacheManager.get(key)
+        if value is None:
+            value = self.func(**params)
+            CacheManager.set(key, value, self.timeout)
+        return value
 
-def get_all_products_cached(query_func=None):
-    """
-    Get all products from cache or fetch if not cached.
-    query_func should be a callable that returns the products queryset.
-    IMPORTANT: Returns Product objects, not dictionaries
-    """
-    def fetch_products():
-        if query_func:
-            return list(query_func())
-        
-        from .models import Product, ProductImage
-        from django.db.models import Prefetch, Case, When, Value
-        from django.utils import timezone
-        from datetime import timedelta
-        
-        new_date = timezone.now() - timedelta(days=NEW_PRODUCT_DAYS)
-        primary_image_qs = ProductImage.objects.filter(is_primary=True)
-        
-        # FIXED: Removed .values() to return Product objects instead of dictionaries
-        return list(
-            Product.objects.filter(is_active=True).select_related(
-                "category", "brand"
-            ).prefetch_related(
-                Prefetch("images", queryset=primary_image_qs, to_attr="primary_images")
-            ).annotate(
-                is_new=Case(
-                    When(created_at__gte=new_date, then=Value(True)),
-                    default=Value(False)
-                )
-            ).order_by('-is_featured', '-sales_count', '-created_at')[:1000]
-        )
-    
-    return CacheManager.get_or_set(CacheKeys.ALL_PRODUCTS, fetch_products)
-
-
-def get_featured_products_cached(limit=8):
-    """Get featured products from cache"""
-    def fetch_featured():
-        from .models import Product, ProductImage
-        from django.db.models import Prefetch
-        
-        primary_image_qs = ProductImage.objects.filter(is_primary=True)
-        return list(
-            Product.objects.filter(is_active=True, is_featured=True)
-            .select_related("category", "brand")
-            .prefetch_related(
-                Prefetch("images", queryset=primary_image_qs, to_attr="primary_images")
-            ).order_by('-created_at')[:limit]
-        )
-    
-    return CacheManager.get_or_set(CacheKeys.FEATURED_PRODUCTS, fetch_featured)
-
-
-def get_new_arrivals_cached(limit=8):
-    """Get new arrival products from cache"""
-    def fetch_new():
-        from .models import Product, ProductImage
-        from django.db.models import Prefetch
-        from django.utils import timezone
-        from datetime import timedelta
-        
-        new_date = timezone.now() - timedelta(days=NEW_PRODUCT_DAYS)
-        primary_image_qs = ProductImage.objects.filter(is_primary=True)
-        
-        return list(
-            Product.objects.filter(is_active=True, created_at__gte=new_date)
-            .select_related("category", "brand")
-            .prefetch_related(
-                Prefetch("images", queryset=primary_image_qs, to_attr="primary_images")
-            ).order_by('-created_at')[:limit]
-        )
-    
-    return CacheManager.get_or_set(CacheKeys.NEW_ARRIVALS, fetch_new)
-
-
-def get_top_selling_products_cached(limit=8):
-    """Get top selling products from cache"""
-    def fetch_top():
-        from .models import Product, ProductImage
-        from django.db.models import Prefetch
-        
-        primary_image_qs = ProductImage.objects.filter(is_primary=True)
-        return list(
-            Product.objects.filter(is_active=True, sales_count__gt=0)
-            .select_related("category", "brand")
-            .prefetch_related(
-                Prefetch("images", queryset=primary_image_qs, to_attr="primary_images")
-            ).order_by('-sales_count', '-created_at')[:limit]
-        )
-    
-    return CacheManager.get_or_set(CacheKeys.TOP_SELLING, fetch_top)
-
-
-def get_price_range_cached():
-    """Get product price range from cache"""
-    def fetch_price_range():
-        from .models import Product
-        from django.db.models import Min, Max, Case, When, F
-        
-        price_stats = Product.objects.filter(
-            is_active=True
-        ).aggregate(
-            min_price=Min(Case(
-                When(compare_price__gt=0, then='compare_price'),
-                default='price'
-            )),
-            max_price=Max('price')
-        )
-        
-        return {
-            'min': int(price_stats['min_price'] or 0),
-            'max': int(price_stats['max_price'] or 0)
-        }
-    
-    return CacheManager.get_or_set(CacheKeys.PRICE_RANGE, fetch_price_range)
+    def warm(self, **params):
+        """Recompute and store the entry, returning the value"""
+        value = self.func(**params)
+        CacheManager.set(self.key_for(**params), value, self.timeout)
+        return value
 
 
-# ==========================================
-# Category Cache Functions
-# ==========================================
+def cached_computation(name, tags, key=None):
+    """Register the decorated function as the computation ``name``"""
+    def decorator(func):
+        computation = CachedComputation(name, func, tags, key=key)
+        COMPUTATIONS[name] = computation
+        return computation
+    return decorator
 
-def get_active_categories_cached():
-    """Get active categories from cache - Returns Category objects"""
-    def fetch_categories():
-        from .models import Category
-        
-        # FIXED: Removed .values() to return Category objects
-        return list(
-            Category.objects.filter(
-                is_active=True, parent=None
-            ).prefetch_related('children')
-        )
-    
-    return CacheManager.get_or_set(CacheKeys.ACTIVE_CATEGORIES, fetch_categories)
-
-
-def get_mega_menu_categories_cached():
-    """Get mega menu categories from cache"""
-    def fetch_mega_menu():
-        from .models import Category
-        
-        return list(
-            Category.objects.filter(is_active=True, parent=None)
-            .prefetch_related('children')[:4]
-        )
-    
-    return CacheManager.get_or_set(CacheKeys.MEGA_MENU_CATEGORIES, fetch_mega_menu)
 
+def load_computations():
+    """Import the catalog read service, which registers the computations"""
+    from . import catalog  # noqa: F401
 
-# ==========================================
-# Brand Cache Functions
-# ==========================================
 
-def get_active_brands_cached():
-    """Get active brands from cache - Returns Brand objects with product_count"""
-    def fetch_brands():
-        from .models import Brand
-        
-        # FIXED: Removed .values() to return Brand objects
-        return list(
-            Brand.objects.filter(
-                is_active=True
-            ).annotate(
-                product_count=Count('products', filter=Q(products__is_active=True))
-            ).filter(
-                product_count__gt=0
-            ).order_by('name')
-        )
-    
-    return CacheManager.get_or_set(CacheKeys.ACTIVE_BRANDS, fetch_brands)
+def computation_targets(tags):
+    """(keys, patterns) of the computations dropped by any of ``tags``"""
+    keys, patterns = set(), set()
+    for computation in COMPUTATIONS.values():
+        if computation.tags & set(tags):
+            if computation.parameterized:
+                patterns.add(computation.pattern)
+            else:
+                keys.add(computation.key)
+    return keys, patterns
 
 
 # ==========================================
@@ -315,42 +266,198 @@ def get_active_brands_cached():
 # ==========================================
 
 def get_cache_statistics():
-    """Get statistics about all cached items"""
-    return {
-        'all_products': CacheManager.get(CacheKeys.ALL_PRODUCTS) is not None,
-        'featured_products': CacheManager.get(CacheKeys.FEATURED_PRODUCTS) is not None,
-        'new_arrivals': CacheManager.get(CacheKeys.NEW_ARRIVALS) is not None,
-        'top_selling': CacheManager.get(CacheKeys.TOP_SELLING) is not None,
-        'price_range': CacheManager.get(CacheKeys.PRICE_RANGE) is not None,
-        'active_categories': CacheManager.get(CacheKeys.ACTIVE_CATEGORIES) is not None,
-        'mega_menu_categories': CacheManager.get(CacheKeys.MEGA_MENU_CATEGORIES) is not None,
-        'active_brands': CacheManager.get(CacheKeys.ACTIVE_BRANDS) is not None,
+    """
+    Which catalog entries are populated, plus the hit ratio of each key
+    family as recorded by the metrics store.
+    """
+    from .metrics import cache_hit_ratios
+
+    load_computations()
+    keys = {
+        name: computation.key for name, computation in COMPUTATIONS.items()
+        if not computation.parameterized
     }
+    present = CacheManager.exists_many(keys.values())
+    stats = {name: present[key] for name, key in keys.items()}
+    stats['hit_ratio'] = cache_hit_ratios()
+    return stats
 
 
 def clear_all_product_caches():
     """Clear all product-related caches"""
-    keys_to_delete = [
-        CacheKeys.ALL_PRODUCTS,
-        CacheKeys.FEATURED_PRODUCTS,
-        CacheKeys.NEW_ARRIVALS,
-        CacheKeys.TOP_SELLING,
-        CacheKeys.PRICE_RANGE,
-    ]
-    
-    for key in keys_to_delete:
-        CacheManager.delete(key)
-    
-    # Clear filtered products pattern
-    CacheManager.clear_pattern(CacheKeys.FILTERED_PRODUCTS_PATTERN)
-    
+    from .invalidation import mark_dirty
+
+    mark_dirty('products')
     logger.info("All product caches cleared")
 
 
 def clear_all_caches():
     """Clear all application caches"""
-    clear_all_product_caches()
-    CacheManager.delete(CacheKeys.ACTIVE_CATEGORIES)
-    CacheManager.delete(CacheKeys.MEGA_MENU_CATEGORIES)
-    CacheManager.delete(CacheKeys.ACTIVE_BRANDS)
-    logger.info("All caches cleared")
\ No newline at end of file
+    from .invalidation import INVALIDATION_MAP, coalesce_invalidations, mark_dirty
+
+    with coalesce_invalidations():
+        mark_dirty(*INVALIDATION_MAP)
+    logger.info("All caches cleared")
+
+# ==========================================
+# Instrumented Cache Backends
+# ==========================================
+
+_in_cache_call = ContextVar('in_cache_call', default=False)
+
+
+class InstrumentedCacheMixin:
+    """
+    Records every cache read, write and delete into the current request's
+    RequestStats (see instrumentation.py). Outside a request, or for calls
+    nested inside another instrumented call, it is a plain pass-through.
+    """
+
+    @contextmanager
+    def _measure(self):
+        stats = current_stats()
+        if stats is None or _in_cache_call.get():
+            yield None, None
+            return
+        token = _in_cache_call.set(True)
+        timer = {'start': time.perf_counter()}
+        try:
+            yield stats, timer
+        finally:
+            _in_cache_call.reset(token)
+
+    @staticmethod
+    def _elapsed_ms(timer):
+        return (time.perf_counter() - timer['start']) * 1000
+
+    def get(self, key, default=None, *args, **kwargs):
+        with self._measure() as (stats, timer):
+            value = super().get(key, default, *args, **kwargs)
+            if stats is not None:
+                stats.record_cache_read(key, None if value is default else value,
+                                        self._elapsed_ms(timer))
+            return value
+
+    def get_many(self, keys, *args, **kwargs):
+        with self._measure() as (stats, timer):
+            found = super().get_many(keys, *args, **kwargs)
+            if stats is not None:
+                elapsed_ms = self._elapsed_ms(timer)
+                for key in keys:
+                    stats.record_cache_read(key, found.get(key), elapsed_ms / max(len(keys), 1))
+            return found
+
+    def set(self, key, value, *args, **kwargs):
+        with self._measure() as (stats, timer):
+            result = super().set(key, value, *args, **kwargs)
+            if stats is not None:
+                stats.record_cache_write(value, self._elapsed_ms(timer))
+            return result
+
+    def add(self, key, value, *args, **kwargs):
+        with self._measure() as (stats, timer):
+            result = super().add(key, value, *args, **kwargs)
+            if stats is not None:
+                stats.record_cache_write(value, self._elapsed_ms(timer))
+            return result
+
+    def set_many(self, data, *args, **kwargs):
+        with self._measure() as (stats, timer):
+            result = super().set_many(data, *args, **kwargs)
+            if stats is not None:
+                elapsed_ms = self._elapsed_ms(timer)
+                for value in data.values():
+                    stats.record_cache_write(value, elapsed_ms / max(len(data), 1))
+            return result
+
+    def delete(self, key, *args, **kwargs):
+        with self._measure() as (stats, timer):
+            result = super().delete(key, *args, **kwargs)
+            if stats is not None:
+                stats.record_cache_delete(1, self._elapsed_ms(timer))
+            return result
+
+    def delete_many(self, keys, *args, **kwargs):
+        with self._measure() as (stats, timer):
+            result = super().delete_many(keys, *args, **kwargs)
+            if stats is not None:
+                stats.record_cache_delete(len(keys), self._elapsed_ms(timer))
+            return result
+
+
+class InstrumentedRedisCache(InstrumentedCacheMixin, RedisCache):
+    """django-redis backend with per-request cache accounting"""
+
+
+# ==========================================
+# Local Redis Stand-in
+# ==========================================
+
+class LocalRedisCache(InstrumentedCacheMixin, LocMemCache):
+    """
+    In-process cache backend exposing the pattern helpers of django-redis.
+    Lets benchmarks and tests run the real invalidation code without a
+    Redis server:
+
+        CACHES = {'default': {'BACKEND': 'bhushan_web_app.cache_utils.LocalRedisCache'}}
+    """
+
+    def keys(self, pattern, version=None):
+        """Return unprefixed keys matching a glob pattern"""
+        prefix_len = len(self.make_key('', version=version))
+        raw_pattern = self.make_key(pattern, version=version)
+        with self._lock:
+            return [
+                key[prefix_len:] for key in list(self._cache)
+                if fnmatch.fnmatchcase(key, raw_pattern) and not self._has_expired(key)
+            ]
+
+    def iter_keys(self, pattern, version=None):
+        yield from self.keys(pattern, version=version)
+
+    def delete_pattern(self, pattern, version=None):
+        """Delete all keys matching a glob pattern, returning the count"""
+        keys = self.keys(pattern, version=version)
+        if keys:
+            self.delete_many(keys, version=version)
+        return len(keys)
+
+
+# ==========================================
+# Shared Redis Stores
+# ==========================================
+
+class SharedStore:
+    """
+    Lazily built store for data that must be shared by every worker:
+    ``redis_class(client)`` on the default cache's Redis connection when it
+    is django-redis, otherwise ``local_class()`` (tests, benchmarks).
+    """
+
+    def __init__(self, name, redis_class, local_class):
+        self.name = name
+        self.redis_class = redis_class
+        self.local_class = local_class
+        self._store = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        if self._store is None:
+            with self._lock:
+                if self._store is None:
+                    self._store = self._build()
+        return self._store
+
+    def _build(self):
+        try:
+            if isinstance(caches['default'], RedisCache):
+                from django_redis import get_redis_connection
+                return self.redis_class(get_redis_connection('default'))
+        except Exception as e:
+            logger.warning(f"{self.name} falling back to in-process store: {e}")
+        return self.local_class()
+
+    def reset(self):
+        """Forget the built store (used when CACHES changes, e.g. in tests)"""
+        with self._lock:
+            self._store = None
@@ -0,0 +1,237 @@
+# catalog.py
+# Catalog read service.
+#
+# Every cached catalog read used by views, serializers and templates goes
+# through this module. Each read is a named computation (see
+# cache_utils.cached_computation):
+#   * one key namespace  - catalog:<name>, catalog:<name>:<hash> when
+#                          parameterized (CacheKeys)
+#   * one TTL policy     - CACHE_TIMEOUT, refreshed by the cache warmer
+#   * one invalidation map - each computation names the tags that drop it;
+#                          invalidation.py derives the keys from that
+# Category lookups are served by the category index (category_tree.py),
+# stats by catalog_stats.py, rankings by trending.py / recommendations.py;
+# they are re-exported here so callers have a single entry point.
+
+from datetime import timedelta
+
+from django.db.models import Case, DecimalField, F, Max, Min, Prefetch, Q, Value, When
+from django.utils import timezone
+
+from .cache_utils import NEW_PRODUCT_DAYS, CacheKeys, cached_computation
+from .catalog_stats import EMPTY_STATS, brand_stats, get_category_stats as category_stats
+from .category_tree import get_category_index as category_index, get_descendant_ids
+from .images import URL_FORMAT, rendition_url, srcset
+from .recommendations import get_recommendations as recommendations
+from .trending import TOP_N as TRENDING_TOP_N, trending_ids, trending_products
+
+__all__ = [
+    'EMPTY_STATS', 'brand_stats', 'category_stats', 'category_index', 'get_descendant_ids',
+    'recommendations', 'trending_products',
+    'storefront_products', 'featured_products', 'new_arrivals',
+    'top_selling', 'price_range', 'filtered_products', 'active_brands',
+    'category_tree', 'mega_menu',
+]
+
+
+def _with_primary_images(queryset):
+    from .models import ProductImage
+
+    return queryset.select_related('category', 'brand').prefetch_related(
+        Prefetch('images', queryset=ProductImage.objects.filter(is_primary=True), to_attr='primary_images')
+    )
+
+
+# ==========================================
+# Product Listings
+# ==========================================
+
+@cached_computation('storefront_products', tags=['products'])
+def storefront_products():
+    """Every active product with its primary image (products page)"""
+    from .models import Product
+
+    return list(_with_primary_images(Product.objects.filter(is_active=True)))
+
+
+@cached_computation('featured_products', tags=['products'])
+def featured_products(limit=8):
+    """Newest featured products"""
+    from .models import Product
+
+    return list(
+        _with_primary_images(Product.objects.filter(is_active=True, is_featured=True))
+        .order_by('-created_at')[:limit]
+    )
+
+
+@cached_computation('new_arrivals', tags=['products'])
+def new_arrivals(limit=8):
+    """Products created within NEW_PRODUCT_DAYS"""
+    from .models import Product
+
+    new_date = timezone.now() - timedelta(days=NEW_PRODUCT_DAYS)
+    return list(
+        _with_primary_images(Product.objects.filter(is_active=True, created_at__gte=new_date))
+        .order_by('-created_at')[:limit]
+    )
+
+
+@cached_computation('top_selling', tags=['products', 'trending'])
+def top_selling(limit=8):
+    """Trending products (see trending.py)"""
+    return trending_products(limit=limit)
+
+
+@cached_computation('price_range', tags=['products'])
+def price_range():
+    """{'min', 'max'} sale price over active products"""
+    from .models import Product
+
+    price_stats = Product.objects.filter(
+        is_active=True
+    ).aggregate(
+        min_price=Min(Case(
+            When(compare_price__gt=0, then='compare_price'),
+            default='price'
+        )),
+        max_price=Max('price')
+    )
+
+    return {
+        'min': int(price_stats['min_price'] or 0),
+        'max': int(price_stats['max_price'] or 0)
+    }
+
+
+@cached_computation('filtered_products', key=CacheKeys.filtered_products_key, tags=['products'])
+def filtered_products(category=None, brand=None, tab='all', search='',
+                      min_price=0, max_price=999999, sort='-is_featured'):
+    """Product cards for one filter combination (AJAX listing), cached per combination"""
+    from .models import Product
+
+    queryset = Product.objects.filter(is_active=True)
+    new_date = timezone.now() - timedelta(days=NEW_PRODUCT_DAYS)
+
+    # Apply filters based on tab
+    trending = []
+    if tab == 'new':
+        queryset = queryset.filter(created_at__gte=new_date)
+    elif tab == 'featured':
+        queryset = queryset.filter(is_featured=True)
+    elif tab == 'sale':
+        queryset = queryset.filter(compare_price__gt=F('price'))
+    elif tab == 'top_selling':
+        # Ranked by time-decayed trending score (trending.py) once available
+        trending = trending_ids(category, TRENDING_TOP_N)
+        if trending:
+            queryset = queryset.filter(id__in=trending)
+        else:
+            queryset = queryset.filter(sales_count__gt=0)
+
+    if category:
+        queryset = queryset.filter(category_id=category)
+
+    if brand:
+        queryset = queryset.filter(brand_id=brand)
+
+    if search:
+        queryset = queryset.filter(
+            Q(name__icontains=search) | Q(description__icontains=search) |
+            Q(short_description__icontains=search) | Q(sku__icontains=search)
+        )
+
+    # Price filter with annotations
+    queryset = queryset.annotate(
+        sale_price=Case(
+            When(compare_price__gt=0, then='compare_price'),
+            default='price',
+            output_field=DecimalField()
+        ),
+        is_new=Case(
+            When(created_at__gte=new_date, then=Value(True)),
+            default=Value(False)
+        )
+    ).filter(sale_price__gte=min_price, sale_price__lte=max_price)
+
+    # Determine sort order
+    if sort == '-sales_count':
+        order_by = ['-sales_count', '-created_at']
+    elif sort == 'price':
+        order_by = ['price']
+    elif sort == '-price':
+        order_by = ['-price']
+    elif sort == 'name':
+        order_by = ['name']
+    else:
+        order_by = ['-is_featured', '-sales_count', '-created_at']
+
+    products = _with_primary_images(queryset).order_by(*order_by)[:100]
+    # Top selling is listed by trending rank unless the shopper picked an order
+    if trending and sort not in ('price', '-price', 'name'):
+        rank = {pid: i for i, pid in enumerate(trending)}
+        products = sorted(products, key=lambda product: rank.get(str(product.id), len(rank)))
+
+    products_list = []
+    for product in products:
+        # Card-sized rendition of the primary image (original until generated)
+        primary_image = primary_image_srcset = primary_image_placeholder = primary_image_color = None
+        if product.primary_images:
+            image = product.primary_images[0]
+            primary_image = rendition_url(image.image, image.renditions, 'card')
+            if image.renditions:
+                primary_image_srcset = srcset(image.renditions, URL_FORMAT)
+            # LQIP painted while the card image loads lazily
+            primary_image_placeholder = image.placeholder or None
+            primary_image_color = image.dominant_color or None
+
+        products_list.append({
+            'id': str(product.id),
+            'name': product.name,
+            'slug': product.slug,
+            'price': str(product.price),
+            'compare_price': str(product.compare_price) if product.compare_price else None,
+            'is_featured': product.is_featured,
+            'is_new': product.created_at >= new_date,
+            'stock': product.stock,
+            'sales_count': product.sales_count,
+            'category__name': product.category.name if product.category else None,
+            'category_name': product.category.name if product.category else None,
+            'brand_name': product.brand.name if product.brand else None,
+            'primary_image': primary_image,
+            'primary_image_srcset': primary_image_srcset,
+            'primary_image_placeholder': primary_image_placeholder,
+            'primary_image_color': primary_image_color,
+            'discount_percentage': product.discount_percentage,
+            'is_low_stock': product.is_low_stock,
+        })
+
+    return products_list
+
+
+# ==========================================
+# Brands / Categories
+# ==========================================
+
+@cached_computation('active_brands', tags=['brands'])
+def active_brands():
+    """Active brands with products, annotated with product_count (BrandStats)"""
+    from .models import Brand
+
+    return list(
+        Brand.objects.filter(
+            is_active=True, stats__product_count__gt=0
+        ).select_related('stats').annotate(
+            product_count=F('stats__product_count')
+        ).order_by('name')
+    )
+
+
+def category_tree(limit=None):
+    """Root CategoryNodes with nested children, from the category index"""
+    return category_index().tree(limit=limit)
+
+
+def mega_menu():
+    """First four root categories for the mega menu"""
+    return category_tree(limit=4)
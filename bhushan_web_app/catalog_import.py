@@ -0,0 +1,560 @@
+# catalog_import.py
+# Bulk catalog import (manage.py import_catalog).
+#
+# Products are read from CSV or JSON lines and written BATCH_SIZE rows at a
+# time: one query for the batch's existing SKUs, one upsert on sku
+# (bulk_create with update_conflicts), one upsert of the variations and one
+# insert of the new images. Categories and brands are resolved from
+# in-memory maps loaded once and created on first use. Images (URLs or
+# paths) are fetched, checked and stored by a thread pool before the batch
+# transaction opens. Model save() and the post_save handlers are bypassed,
+# so the caches, catalog generations and brand/category stats are
+# invalidated once, for everything imported, when the run ends.
+#
+# Row fields (only sku is always required; name, price and category for
+# new products):
+#   sku, name, description, short_description, price, compare_price,
+#   cost_price, stock, low_stock_threshold, is_active, is_featured,
+#   meta_title, meta_description,
+#   category     "Parent > Child" path, missing levels are created (names
+#                are unique, so a name under another parent is an error)
+#   brand        name, created if missing
+#   images       list of URLs / paths (CSV: separated by "|")
+#   variations   list of {"type", "value", "price_adjustment", "stock",
+#                "sku_suffix", "is_active"} (CSV: a JSON list)
+# Fields left out of a row, or empty, keep their current value on existing
+# products; a JSON null clears compare_price / cost_price.
+
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal, InvalidOperation
+from functools import lru_cache
+from io import BytesIO
+from urllib.parse import urlparse
+import csv
+import hashlib
+import json
+import logging
+import os
+import uuid
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import DatabaseError, transaction
+from django.utils.text import slugify
+from PIL import Image
+import requests
+
+from .catalog_stats import ancestor_ids
+from .catalog_version import category_scope
+from .invalidation import coalesce_invalidations, mark_changed, mark_dirty, mark_for_refresh
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 1000
+IMAGE_WORKERS = 8
+IMAGE_TIMEOUT = 15                  # seconds per download
+MAX_IMAGE_BYTES = 20 * 1024 * 1024
+IMAGE_DIR = 'products/imports'
+
+TEXT_FIELDS = ['name', 'description', 'short_description', 'meta_title', 'meta_description']
+DECIMAL_FIELDS = ['price', 'compare_price', 'cost_price']
+NULLABLE_FIELDS = {'compare_price', 'cost_price'}
+INT_FIELDS = ['stock', 'low_stock_threshold']
+BOOL_FIELDS = ['is_active', 'is_featured']
+NON_NEGATIVE_FIELDS = {'price', 'compare_price', 'cost_price', 'stock'}
+PRODUCT_FIELDS = TEXT_FIELDS + DECIMAL_FIELDS + INT_FIELDS + BOOL_FIELDS + ['category_id', 'brand_id']
+REQUIRED_FOR_NEW = ['name', 'price', 'category_id']
+
+# Product / variation DecimalFields: max_digits=10, decimal_places=2
+CENTS = Decimal('0.01')
+MAX_AMOUNT = Decimal(10) ** 8
+MAX_NAME_LENGTH = 100               # Category.name, Brand.name
+
+
+class RowError(ValueError):
+    """A row that cannot be imported"""
+
+
+# ==========================================
+# Reading
+# ==========================================
+
+def read_csv(path):
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        # Line 1 is the header
+        for line, row in enumerate(csv.DictReader(f), start=2):
+            yield line, row
+
+
+def read_jsonl(path):
+    with open(path, encoding='utf-8') as f:
+        for line, text in enumerate(f, start=1):
+            if not text.strip():
+                continue
+            try:
+                yield line, json.loads(text)
+            except ValueError:
+                yield line, None
+
+
+READERS = {
+    'csv': read_csv,
+    'jsonl': read_jsonl,
+}
+
+
+def read_rows(path, fmt=None):
+    """(line number, row dict or None when unreadable) from a CSV / JSONL file"""
+    fmt = fmt or os.path.splitext(path)[1].lstrip('.').lower()
+    if fmt not in READERS:
+        raise ValueError(f"Unknown catalog format: {fmt}")
+    return READERS[fmt](path)
+
+
+def _bool(value):
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ('1', 'true', 'yes', 'y')
+
+
+def _list(value, separator='|'):
+    if value in (None, ''):
+        return []
+    if isinstance(value, list):
+        return value
+    value = str(value).strip()
+    if value.startswith('['):
+        return json.loads(value)
+    return [part.strip() for part in value.split(separator) if part.strip()]
+
+
+def _decimal(value):
+    """An amount that fits the DecimalFields; raises ValueError otherwise"""
+    try:
+        amount = Decimal(str(value))
+        if not amount.is_finite() or abs(amount) >= MAX_AMOUNT:
+            raise ValueError(value)
+        return amount.quantize(CENTS)
+    except InvalidOperation:
+        raise ValueError(value)
+
+
+def _text(value, field, max_length):
+    value = str(value).strip()
+    if max_length and len(value) > max_length:
+        raise RowError(f"{field} is longer than {max_length} characters")
+    return value
+
+
+@lru_cache(maxsize=None)
+def _max_lengths(label):
+    from django.apps import apps
+
+    return {field.name: field.max_length for field in apps.get_model(label)._meta.fields}
+
+
+def _variation(item):
+    """ProductVariation field values from one variations entry"""
+    lengths = _max_lengths('bhushan_web_app.ProductVariation')
+    stock = int(item.get('stock') or 0)
+    if stock < 0:
+        raise ValueError(stock)
+    return {
+        'variation_type': _text(item['type'], 'variation type', lengths['variation_type']),
+        'variation_value': _text(item['value'], 'variation value', lengths['variation_value']),
+        'price_adjustment': _decimal(item.get('price_adjustment') or 0),
+        'stock': stock,
+        'sku_suffix': _text(item.get('sku_suffix') or '', 'variation sku_suffix', lengths['sku_suffix']),
+        'is_active': _bool(item.get('is_active', True)),
+    }
+
+
+def parse_row(row):
+    """(sku, product values, category path, brand name, images, variations)"""
+    if not isinstance(row, dict):
+        raise RowError("Unreadable row")
+    lengths = _max_lengths('bhushan_web_app.Product')
+    sku = _text(row.get('sku') or '', 'sku', lengths['sku'])
+    if not sku:
+        raise RowError("Missing sku")
+
+    values = {}
+    for field in TEXT_FIELDS + DECIMAL_FIELDS + INT_FIELDS + BOOL_FIELDS:
+        value = row.get(field, '')
+        if value == '' or (value is None and field not in NULLABLE_FIELDS):
+            continue
+        if value is None or field in TEXT_FIELDS:
+            values[field] = value if value is None else _text(value, field, lengths[field])
+            continue
+        try:
+            if field in DECIMAL_FIELDS:
+                values[field] = _decimal(value)
+            elif field in INT_FIELDS:
+                values[field] = int(value)
+            else:
+                values[field] = _bool(value)
+        except (TypeError, ValueError):
+            raise RowError(f"Invalid {field}: {value!r}")
+        if field in NON_NEGATIVE_FIELDS and values[field] < 0:
+            raise RowError(f"Negative {field}")
+
+    try:
+        images = [str(source).strip() for source in _list(row['images'])] if 'images' in row else None
+        variations = [_variation(item) for item in _list(row['variations'])] if 'variations' in row else None
+    except RowError:
+        raise
+    except (ValueError, TypeError, KeyError, AttributeError):
+        raise RowError("Invalid images or variations")
+
+    category = str(row.get('category') or '').strip() or None
+    brand = row.get('brand')
+    brand = _text(brand, 'brand', MAX_NAME_LENGTH) if brand is not None else None
+    return sku, values, category, brand, images, variations
+
+
+def _batches(rows, size):
+    batch = []
+    for item in rows:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+# ==========================================
+# Import
+# ==========================================
+
+class CatalogImport:
+    """One import run: lookup maps, counters and the changes to invalidate"""
+
+    def __init__(self, batch_size=BATCH_SIZE, image_workers=IMAGE_WORKERS,
+                 images_root=None, renditions=True):
+        self.batch_size = batch_size
+        self.image_workers = image_workers
+        self.images_root = images_root
+        self.renditions = renditions
+        self.counts = Counter()
+        self.errors = []                    # (line, sku, message)
+        # Collected for the invalidation at the end of the run
+        self.changed_products = set()
+        self.brand_ids = set()
+        self.category_ids = set()
+        self.new_categories = False
+        self._load_maps()
+
+    def _load_maps(self):
+        from .models import Brand, Category
+
+        self.categories = {}                # (parent id, lower name) -> row
+        self.category_names = set()         # Category.name is unique
+        self.category_paths = {}
+        self.category_slugs = set()
+        for row in Category.objects.values('id', 'parent_id', 'name', 'slug', 'path', 'depth'):
+            self._add_category(row)
+        self.brands = {}
+        self.brand_slugs = set()
+        for pk, name, slug in Brand.objects.values_list('id', 'name', 'slug'):
+            self.brands[name.lower()] = pk
+            self.brand_slugs.add(slug)
+        self._pending_categories = []
+        self._pending_brands = []
+
+    def error(self, line, sku, message):
+        self.counts['errors'] += 1
+        self.errors.append((line, sku, message))
+
+    # ---------- Categories / brands ----------
+
+    @staticmethod
+    def _unique_slug(name, taken, max_length):
+        base = slugify(name)[:max_length - 9] or uuid.uuid4().hex[:8]
+        slug = base
+        while slug in taken:
+            slug = f'{base}-{uuid.uuid4().hex[:8]}'
+        taken.add(slug)
+        return slug
+
+    def _add_category(self, row):
+        self.categories[(row['parent_id'], row['name'].lower())] = row
+        self.category_names.add(row['name'].lower())
+        self.category_paths[row['id']] = row['path']
+        self.category_slugs.add(row['slug'])
+
+    def category_id(self, path):
+        """
+        Id of the category at ``path`` ("A > B"), each level looked up under
+        its parent; missing levels are created
+        """
+        from .models import Category
+
+        names = [part.strip() for part in path.split('>') if part.strip()]
+        parent = None
+        while names:
+            row = self.categories.get((parent['id'] if parent else None, names[0].lower()))
+            if row is None:
+                break
+            parent = row
+            names.pop(0)
+
+        # Checked before anything is created, so a bad path leaves no levels behind
+        seen = set()
+        for name in names:
+            _text(name, 'category', MAX_NAME_LENGTH)
+            if name.lower() in self.category_names or name.lower() in seen:
+                raise RowError(f"Category {name!r} already exists under another parent")
+            seen.add(name.lower())
+
+        for name in names:
+            pk = uuid.uuid4()
+            row = {
+                'id': pk, 'parent_id': parent['id'] if parent else None, 'name': name,
+                'slug': self._unique_slug(name, self.category_slugs, 150),
+                'path': f"{parent['path'] if parent else '/'}{pk.hex}/",
+                'depth': parent['depth'] + 1 if parent else 0,
+            }
+            # save() is bypassed; the materialized path is set here
+            self._pending_categories.append(Category(**row))
+            self._add_category(row)
+            parent = row
+        return parent['id'] if parent else None
+
+    def brand_id(self, name):
+        from .models import Brand
+
+        if not name:
+            return None
+        pk = self.brands.get(name.lower())
+        if pk is None:
+            pk = uuid.uuid4()
+            self._pending_brands.append(Brand(
+                id=pk, name=name, slug=self._unique_slug(name, self.brand_slugs, 150),
+            ))
+            self.brands[name.lower()] = pk
+        return pk
+
+    def _track_listing(self, category_id, brand_id):
+        if brand_id:
+            self.brand_ids.add(brand_id)
+        path = self.category_paths.get(category_id)
+        if path:
+            self.category_ids.update(ancestor_ids(path))
+
+    # ---------- Images ----------
+
+    def fetch_image(self, source):
+        """Storage name of image ``source`` (URL or path); runs in the worker pool"""
+        if urlparse(source).scheme in ('http', 'https'):
+            response = requests.get(source, timeout=IMAGE_TIMEOUT)
+            response.raise_for_status()
+            data = response.content
+        else:
+            path = source if os.path.isabs(source) or not self.images_root \
+                else os.path.join(self.images_root, source)
+            with open(path, 'rb') as f:
+                data = f.read(MAX_IMAGE_BYTES + 1)
+        if len(data) > MAX_IMAGE_BYTES:
+            raise ValueError("Image is too large")
+        with Image.open(BytesIO(data)) as image:
+            image.verify()
+
+        # Named after the content, so re-imports and shared images store once
+        digest = hashlib.sha256(data).hexdigest()
+        ext = os.path.splitext(urlparse(source).path)[1].lower() or '.jpg'
+        name = f'{IMAGE_DIR}/{digest[:2]}/{digest}{ext}'
+        if not default_storage.exists(name):
+            name = default_storage.save(name, ContentFile(data))
+        return name
+
+    def _fetch_images(self, pool, sources):
+        """{source: storage name} for the sources that could be stored"""
+        sources = list(dict.fromkeys(sources))
+        stored = {}
+        futures = {source: pool.submit(self.fetch_image, source) for source in sources}
+        for source, future in futures.items():
+            try:
+                stored[source] = future.result()
+            except Exception as e:
+                self.counts['image_errors'] += 1
+                logger.warning(f"Cannot import image {source}: {e}")
+        return stored
+
+    # ---------- Batches ----------
+
+    def import_batch(self, batch, pool):
+        from .models import Product, ProductImage, ProductVariation
+
+        parsed = {}
+        for line, row in batch:
+            try:
+                sku, values, category, brand, images, variations = parse_row(row)
+                if category:
+                    values['category_id'] = self.category_id(category)
+                if brand is not None:
+                    values['brand_id'] = self.brand_id(brand)
+            except RowError as e:
+                self.error(line, row.get('sku', '') if isinstance(row, dict) else '', str(e))
+                continue
+            # A SKU repeated within the batch: the last row wins
+            parsed[sku] = (line, values, images, variations)
+
+        # Downloads finish before the transaction opens
+        stored = self._fetch_images(pool, [
+            source for _, _, images, _ in parsed.values() for source in images or []
+        ])
+
+        existing = {
+            row['sku']: row
+            for row in Product.objects.filter(sku__in=list(parsed)).values('id', 'sku', 'slug', *PRODUCT_FIELDS)
+        }
+        new_slugs = {
+            sku: slugify(values.get('name', ''))[:250]
+            for sku, (_, values, _, _) in parsed.items() if sku not in existing
+        }
+        taken_slugs = set(
+            Product.objects.filter(slug__in=[slug for slug in new_slugs.values() if slug])
+            .values_list('slug', flat=True)
+        )
+
+        products = []
+        for sku, (line, values, images, variations) in list(parsed.items()):
+            current = existing.get(sku)
+            if current is None:
+                missing = [field.replace('_id', '') for field in REQUIRED_FOR_NEW if values.get(field) is None]
+                if missing:
+                    self.error(line, sku, f"New product needs {', '.join(missing)}")
+                    del parsed[sku]
+                    continue
+                slug = self._unique_slug(new_slugs[sku] or sku, taken_slugs, 300)
+                product = Product(sku=sku, slug=slug, **values)
+            else:
+                product = Product(**{**current, **values})
+                self._track_listing(current['category_id'], current['brand_id'])
+                self.changed_products.update({f'product:{current["id"]}', f'product:{current["slug"]}'})
+            self._track_listing(product.category_id, product.brand_id)
+            products.append(product)
+        if not products:
+            return
+        by_sku = {product.sku: product for product in products}
+
+        with transaction.atomic():
+            from .models import Brand, Category
+
+            if self._pending_categories:
+                Category.objects.bulk_create(self._pending_categories)
+                self.counts['categories_created'] += len(self._pending_categories)
+                self.new_categories = True
+            if self._pending_brands:
+                Brand.objects.bulk_create(self._pending_brands)
+                self.counts['brands_created'] += len(self._pending_brands)
+            self._pending_categories, self._pending_brands = [], []
+
+            Product.objects.bulk_create(
+                products, batch_size=self.batch_size, update_conflicts=True, unique_fields=['sku'],
+                update_fields=PRODUCT_FIELDS + ['updated_at'],
+            )
+            self.counts['created'] += len(products) - len(existing)
+            self.counts['updated'] += len(existing)
+
+            # One row per (product, type, value); a repeat within the row wins
+            variations = list({
+                (sku, variation['variation_type'], variation['variation_value']):
+                    ProductVariation(product_id=by_sku[sku].pk, **variation)
+                for sku, (_, _, _, rows) in parsed.items() for variation in rows or []
+            }.values())
+            if variations:
+                ProductVariation.objects.bulk_create(
+                    variations, batch_size=self.batch_size, update_conflicts=True,
+                    unique_fields=['product', 'variation_type', 'variation_value'],
+                    update_fields=['price_adjustment', 'stock', 'sku_suffix', 'is_active'],
+                )
+                self.counts['variations'] += len(variations)
+
+            images = self._new_images([
+                (by_sku[sku].pk, [stored[source] for source in sources if source in stored])
+                for sku, (_, _, sources, _) in parsed.items() if sources
+            ])
+            if images:
+                ProductImage.objects.bulk_create(images, batch_size=self.batch_size)
+                self.counts['images'] += len(images)
+                if self.renditions:
+                    self._queue_renditions(images)
+
+    def _new_images(self, product_images):
+        """ProductImage rows for stored images the products do not have yet"""
+        from .models import ProductImage
+
+        product_ids = [pk for pk, names in product_images if names]
+        current = defaultdict(set)
+        for product_id, name in ProductImage.objects.filter(product_id__in=product_ids) \
+                .values_list('product_id', 'image'):
+            current[product_id].add(name)
+
+        images = []
+        for product_id, names in product_images:
+            have = current[product_id]
+            order = len(have)
+            for name in dict.fromkeys(names):
+                if name in have:
+                    continue
+                images.append(ProductImage(
+                    product_id=product_id, image=name, is_primary=not have and order == 0,
+                    display_order=order,
+                ))
+                order += 1
+            if order > len(have):
+                self.changed_products.add(f'product:{product_id}')
+        return images
+
+    def _queue_renditions(self, images):
+        from .tasks import generate_image_renditions
+
+        model_label = images[0]._meta.label_lower
+        pks = [str(image.pk) for image in images]
+
+        def enqueue():
+            for pk in pks:
+                try:
+                    generate_image_renditions.delay(model_label, pk)
+                except Exception as e:
+                    # backfill_image_renditions picks up anything missed here
+                    logger.warning(f"Could not queue renditions for {model_label} {pk}: {e}")
+
+        transaction.on_commit(enqueue)
+
+    # ---------- Run ----------
+
+    def invalidate(self):
+        """Mark everything the run changed; flushed once by coalesce_invalidations()"""
+        if not self.counts['created'] and not self.counts['updated']:
+            return
+        mark_for_refresh('brand_stats', *self.brand_ids)
+        mark_for_refresh('category_stats', *self.category_ids)
+        mark_changed(*self.changed_products, *(category_scope(pk) for pk in self.category_ids))
+        mark_dirty('products', 'brands', *(['categories'] if self.new_categories else []))
+
+    def run(self, rows):
+        """Import ``rows`` ((line, dict) pairs); returns the counters"""
+        with coalesce_invalidations(), ThreadPoolExecutor(max_workers=self.image_workers) as pool:
+            for batch in _batches(rows, self.batch_size):
+                try:
+                    self.import_batch(batch, pool)
+                except DatabaseError as e:
+                    # The batch rolled back, with any categories/brands it created
+                    for line, row in batch:
+                        self.error(line, row.get('sku', '') if isinstance(row, dict) else '', str(e))
+                    self._load_maps()
+                self.counts['rows'] += len(batch)
+            self.invalidate()
+        logger.info(f"Catalog import: {dict(self.counts)}")
+        return self.counts
+
+
+def import_catalog(path, fmt=None, **options):
+    """Import the catalog file at ``path``; returns the CatalogImport run"""
+    run = CatalogImport(**options)
+    run.run(read_rows(path, fmt))
+    return run
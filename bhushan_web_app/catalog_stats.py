@@ -0,0 +1,169 @@
+# catalog_stats.py
+# Materialized brand and category stats (BrandStats / CategoryStats).
+#
+# Product changes queue the affected brands and categories; they are
+# recomputed once per request/transaction through the invalidation
+# coalescer. Category stats are rolled up over the active subtree using the
+# category index. A periodic Celery task rebuilds everything to catch
+# changes made with queryset.update() or raw SQL.
+
+import logging
+import uuid
+
+from django.db.models import Count, Max, Min, Q
+
+from .cache_utils import CacheKeys, CacheManager, cached_computation
+from .invalidation import mark_for_refresh, register_refresher
+
+logger = logging.getLogger(__name__)
+
+STAT_FIELDS = ['product_count', 'in_stock_count', 'min_price', 'max_price']
+EMPTY_STATS = {'product_count': 0, 'in_stock_count': 0, 'min_price': None, 'max_price': None}
+
+
+def _aggregate_by(field, **filters):
+    """{<field value>: stats} over active products, one GROUP BY query"""
+    from .models import Product
+
+    rows = (
+        Product.objects.filter(is_active=True, **filters)
+        .values(field)
+        .annotate(
+            product_count=Count('id'),
+            in_stock_count=Count('id', filter=Q(stock__gt=0)),
+            min_price=Min('price'),
+            max_price=Max('price'),
+        )
+    )
+    return {row.pop(field): row for row in rows}
+
+
+def _merge(stats_list):
+    stats_list = [s for s in stats_list if s['product_count']]
+    if not stats_list:
+        return dict(EMPTY_STATS)
+    return {
+        'product_count': sum(s['product_count'] for s in stats_list),
+        'in_stock_count': sum(s['in_stock_count'] for s in stats_list),
+        'min_price': min(s['min_price'] for s in stats_list),
+        'max_price': max(s['max_price'] for s in stats_list),
+    }
+
+
+def _upsert(model, key_field, stats_by_id):
+    objs = [model(**{f'{key_field}_id': pk}, **stats) for pk, stats in stats_by_id.items()]
+    model.objects.bulk_create(
+        objs, update_conflicts=True, unique_fields=[key_field],
+        update_fields=STAT_FIELDS + ['updated_at'],
+    )
+
+
+# ==========================================
+# Refresh
+# ==========================================
+
+def refresh_brand_stats(brand_ids=None):
+    """Recompute stats for the given brands (all active brands if None)"""
+    from .models import Brand, BrandStats
+
+    if brand_ids is None:
+        brand_ids = list(Brand.objects.values_list('id', flat=True))
+        direct = _aggregate_by('brand_id')
+    else:
+        # Queued ids may belong to brands deleted since; BrandStats has an FK
+        brand_ids = list(Brand.objects.filter(pk__in=list(brand_ids)).values_list('id', flat=True))
+        direct = _aggregate_by('brand_id', brand_id__in=brand_ids)
+
+    _upsert(BrandStats, 'brand', {pk: direct.get(pk, dict(EMPTY_STATS)) for pk in brand_ids})
+    return len(brand_ids)
+
+
+def refresh_category_stats(category_ids=None):
+    """
+    Recompute rolled-up stats for the given categories (all if None).
+    Callers pass every ancestor of a changed category as well.
+    """
+    from .category_tree import CategoryIndex
+    from .models import CategoryStats
+
+    # Built fresh: the cached index may not reflect this transaction yet
+    index = CategoryIndex.build()
+    if category_ids is None:
+        category_ids = list(index.rows)
+    # Drops categories deleted since they were queued (CategoryStats has an FK)
+    category_ids = [pk for pk in category_ids if pk in index.rows]
+
+    subtree_ids = {cid for pk in category_ids for cid in index.descendant_ids(pk)}
+    direct = _aggregate_by('category_id', category_id__in=subtree_ids)
+    _upsert(CategoryStats, 'category', {
+        pk: _merge([direct[cid] for cid in index.descendant_ids(pk) if cid in direct])
+        for pk in category_ids
+    })
+    return len(category_ids)
+
+
+def refresh_all_stats():
+    """Full rebuild; run periodically by tasks.refresh_catalog_stats"""
+    brands = refresh_brand_stats()
+    categories = refresh_category_stats()
+    CacheManager.delete_many([CacheKeys.CATEGORY_STATS, CacheKeys.ACTIVE_BRANDS])
+    return {'brands': brands, 'categories': categories}
+
+
+def ancestor_ids(path):
+    """Category ids on a materialized path, root first"""
+    return [uuid.UUID(part) for part in path.strip('/').split('/') if part]
+
+
+def queue_category_stats(category):
+    """Queue a changed category's old and new ancestors"""
+    paths = {category.path, getattr(category, '_previous_path', '')}
+    mark_for_refresh('category_stats', *{pk for path in paths if path for pk in ancestor_ids(path)})
+
+
+def product_category_ids(product):
+    """Categories (with ancestors) a product was and is listed under"""
+    from .category_tree import get_category_index
+
+    index = get_category_index()
+    category_ids = set()
+    for category_id in {product.category_id, getattr(product, '_loaded_category_id', None)}:
+        row = index.rows.get(category_id)
+        if row and row['path']:
+            category_ids.update(ancestor_ids(row['path']))
+        elif category_id:
+            category_ids.add(category_id)
+    return category_ids
+
+
+def queue_product_stats(product):
+    """Queue the brands/categories a product was and is listed under"""
+    mark_for_refresh('brand_stats', product.brand_id, getattr(product, '_loaded_brand_id', None))
+    mark_for_refresh('category_stats', *product_category_ids(product))
+
+
+register_refresher('brand_stats', refresh_brand_stats)
+register_refresher('category_stats', refresh_category_stats)
+
+
+# ==========================================
+# Reads
+# ==========================================
+
+@cached_computation('category_stats', tags=['products', 'categories'])
+def get_category_stats():
+    """{category_id: stats dict} for every category, one query when cold"""
+    from .models import CategoryStats
+
+    return {
+        row.pop('category_id'): row
+        for row in CategoryStats.objects.values('category_id', *STAT_FIELDS)
+    }
+
+
+def brand_stats(brand):
+    """Stats for a Brand instance (use select_related('stats'))"""
+    stats = getattr(brand, 'stats', None)
+    if stats is None:
+        return dict(EMPTY_STATS)
+    return {field: getattr(stats, field) for field in STAT_FIELDS}
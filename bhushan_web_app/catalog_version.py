@@ -0,0 +1,123 @@
+# catalog_version.py
+# Catalog generation stamps for conditional GET (ETag / Last-Modified).
+#
+# A generation is the time (in microseconds) of the last change to a scope:
+#   products, categories, brands   - bumped when the matching cache tag is
+#                                    flushed (invalidation.py)
+#   category:<id>                  - products listed under a category (and
+#                                    its subcategories) changed
+#   product:<id>, product:<slug>   - one product, its images, variations or
+#                                    reviews changed
+#   reviews                        - any review changed (list ratings)
+#   brand_details                  - a Brand row itself changed ('brands' also
+#                                    moves with every product, via brand stats)
+#   recommendations                - the related-products lists were rebuilt
+#   trending                       - the trending lists were rematerialized
+# Stamps live in the cache without expiry. A missing stamp is re-seeded
+# with the current time, which can only cause a spurious 200, never a wrong
+# 304. The product stamp mirrors Product.updated_at, so views can answer
+# If-None-Match / If-Modified-Since without querying the database.
+
+from datetime import datetime, timezone as dt_timezone
+import hashlib
+import time
+import uuid
+
+from django.core.cache import cache
+from django.views.decorators.http import condition
+
+GENERATION_KEY_PREFIX = 'catalog:gen:'
+
+
+def _now():
+    return time.time_ns() // 1000
+
+
+def _key(scope):
+    return f'{GENERATION_KEY_PREFIX}{scope}'
+
+
+def bump_generations(scopes):
+    """Mark ``scopes`` as changed now (one round trip)"""
+    now = _now()
+    cache.set_many({_key(scope): now for scope in set(scopes)}, timeout=None)
+
+
+def get_generations(*scopes):
+    """{scope: stamp} for ``scopes``, seeding any that are missing"""
+    keys = {_key(scope): scope for scope in scopes}
+    found = cache.get_many(list(keys))
+    missing = [key for key in keys if key not in found]
+    if missing:
+        now = _now()
+        for key in missing:
+            # add() keeps a stamp another process seeded in the meantime
+            cache.add(key, now, timeout=None)
+        found.update(cache.get_many(missing))
+    return {scope: found.get(key, 0) for key, scope in keys.items()}
+
+
+def product_scopes(product):
+    """Generation scopes of one Product instance (old slug included on rename)"""
+    scopes = {f'product:{product.pk}', f'product:{product.slug}'}
+    old_slug = getattr(product, '_loaded_slug', None)
+    if old_slug:
+        scopes.add(f'product:{old_slug}')
+    return scopes
+
+
+def category_scope(category_id):
+    """``category:<uuid>``, or None for ids that are not UUIDs (user input)"""
+    try:
+        return f'category:{uuid.UUID(str(category_id))}'
+    except ValueError:
+        return None
+
+
+# ==========================================
+# Conditional GET
+# ==========================================
+
+def catalog_condition(scopes, anonymous_only=False, validators=None):
+    """
+    ``django.views.decorators.http.condition`` driven by catalog
+    generations. ``scopes(request, *args, **kwargs)`` returns the scopes the
+    response depends on::
+
+        @method_decorator(catalog_condition(lambda request, **kw: ['brands']), name='dispatch')
+
+    ``validators`` optionally returns extra values folded into the ETag
+    (e.g. the date, for time-dependent payloads); such responses get no
+    Last-Modified. With ``anonymous_only`` signed-in users (whose pages
+    differ) always get a full response.
+    """
+    def versions(request, *args, **kwargs):
+        if anonymous_only and request.user.is_authenticated:
+            return None
+        if not hasattr(request, '_catalog_versions'):
+            request._catalog_versions = get_generations(*scopes(request, *args, **kwargs))
+        return request._catalog_versions
+
+    def etag(request, *args, **kwargs):
+        generations = versions(request, *args, **kwargs)
+        if generations is None:
+            return None
+        extra = validators(request, *args, **kwargs) if validators else ()
+        raw = '|'.join([
+            request.get_full_path(),
+            request.META.get('HTTP_ACCEPT', ''),
+            *(f'{scope}={stamp}' for scope, stamp in sorted(generations.items())),
+            *(str(value) for value in extra),
+        ])
+        return hashlib.md5(raw.encode()).hexdigest()
+
+    def last_modified(request, *args, **kwargs):
+        if validators:
+            return None
+        generations = versions(request, *args, **kwargs)
+        if not generations:
+            return None
+        stamp = max(generations.values())
+        return datetime.fromtimestamp(stamp / 1_000_000, tz=dt_timezone.utc)
+
+    return condition(etag_func=etag, last_modified_func=last_modified)
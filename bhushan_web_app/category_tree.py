@@ -0,0 +1,198 @@
+# category_tree.py
+# Category tree service.
+#
+# The whole hierarchy (a few hundred rows at most) is loaded with one query
+# and cached as a CategoryIndex, stamped with the 'categories' catalog
+# generation (catalog_version.py) read before the query. Saving or deleting
+# a Category bumps that generation on commit, and a reader that finds an
+# older stamp rebuilds - so an index built from pre-commit rows by a
+# concurrent cold read is never served after the change. Tree views derive
+# their ETags from the same generation.
+#
+# The HTML category tree, the mega menu, the categories context processor,
+# CategoryViewSet and CategoryProductsView all read from this one structure.
+# Descendant id sets are precomputed, so listing a category of any depth is
+# a single `category_id IN (...)` query. Rolled-up product counts come from
+# CategoryStats (catalog_stats.py).
+
+from collections import defaultdict
+import logging
+
+from django.urls import reverse
+
+from .cache_utils import cached_computation
+from .catalog_version import get_generations
+from .images import rendition_url
+
+logger = logging.getLogger(__name__)
+
+INDEX_FIELDS = (
+    'id', 'name', 'slug', 'description', 'image', 'image_renditions', 'parent',
+    'path', 'depth', 'is_active', 'display_order',
+)
+
+
+# ==========================================
+# Template Nodes
+# ==========================================
+
+class NodeList(list):
+    """Children list usable as ``node.children`` and ``node.children.all``"""
+
+    def all(self):
+        return self
+
+
+class CategoryNode:
+    """Read-only category for templates, built from an index row"""
+
+    def __init__(self, row, children=()):
+        self.id = row['id']
+        self.name = row['name']
+        self.slug = row['slug']
+        self.description = row['description']
+        self.image = row['image']
+        self.image_renditions = row['image_renditions']
+        self.parent_id = row['parent']
+        self.depth = row['depth']
+        self.display_order = row['display_order']
+        self.children = NodeList(children)
+
+    @property
+    def image_url(self):
+        return rendition_url(self.image, self.image_renditions, 'card')
+
+    def get_absolute_url(self):
+        return reverse('shop:category-products', args=[self.slug])
+
+    def __str__(self):
+        return self.name
+
+
+# ==========================================
+# Index
+# ==========================================
+
+class CategoryIndex:
+    """
+    Every category row keyed by id, plus the derived active hierarchy.
+    A subtree under an inactive category is unreachable and never listed.
+    """
+
+    def __init__(self, rows):
+        self.rows = {row['id']: row for row in rows}
+        self._derive()
+
+    def _derive(self):
+        self.children_ids = defaultdict(list)
+        ordered = sorted(self.rows.values(), key=lambda row: (row['display_order'], row['name']))
+        for row in ordered:
+            if row['is_active']:
+                self.children_ids[row['parent']].append(row['id'])
+
+        self.descendants = {}
+        self.roots = list(self.children_ids[None])
+        for root in self.roots:
+            self._collect(root)
+        self.nodes = {cid: self.rows[cid] for cid in self.descendants}
+        self.by_slug = {row['slug']: cid for cid, row in self.nodes.items()}
+        self.ordered_ids = [row['id'] for row in ordered if row['id'] in self.nodes]
+
+    def _collect(self, category_id):
+        ids = [category_id]
+        for child in self.children_ids.get(category_id, []):
+            ids.extend(self._collect(child))
+        self.descendants[category_id] = ids
+        return ids
+
+    # ---------- lookups ----------
+
+    def get(self, category_id):
+        return self.nodes.get(category_id)
+
+    def get_by_slug(self, slug):
+        category_id = self.by_slug.get(slug)
+        return self.nodes.get(category_id) if category_id else None
+
+    def children(self, category_id):
+        return [self.nodes[cid] for cid in self.children_ids.get(category_id, [])]
+
+    def descendant_ids(self, category_id, include_self=True):
+        ids = self.descendants.get(category_id, [])
+        return ids if include_self else ids[1:]
+
+    def all_nodes(self):
+        """Active categories in display order"""
+        return [self.nodes[cid] for cid in self.ordered_ids]
+
+    def node(self, category_id):
+        """CategoryNode with its whole active subtree"""
+        return CategoryNode(
+            self.nodes[category_id],
+            [self.node(cid) for cid in self.children_ids.get(category_id, [])],
+        )
+
+    def tree(self, limit=None):
+        """Root CategoryNodes (optionally the first ``limit``) with nested children"""
+        roots = self.roots if limit is None else self.roots[:limit]
+        return [self.node(cid) for cid in roots]
+
+    @classmethod
+    def build(cls):
+        from .models import Category
+
+        return cls([
+            dict(row, image=row['image'] or '')
+            for row in Category.objects.values(*INDEX_FIELDS)
+        ])
+
+
+def category_row(instance):
+    """Index row for a Category instance (no query)"""
+    return {
+        'id': instance.id,
+        'name': instance.name,
+        'slug': instance.slug,
+        'description': instance.description,
+        'image': instance.image.name if instance.image else '',
+        'image_renditions': instance.image_renditions,
+        'parent': instance.parent_id,
+        'path': instance.path,
+        'depth': instance.depth,
+        'is_active': instance.is_active,
+        'display_order': instance.display_order,
+    }
+
+
+# ==========================================
+# Service Functions
+# ==========================================
+
+def _categories_generation():
+    return get_generations('categories')['categories']
+
+
+@cached_computation('category_index', tags=['categories'])
+def stamped_category_index():
+    """(generation, CategoryIndex); the generation is read before the query"""
+    generation = _categories_generation()
+    return generation, CategoryIndex.build()
+
+
+def get_category_index():
+    """Cached CategoryIndex; rebuilt with one query when missing or older than the tree"""
+    generation, index = stamped_category_index()
+    if generation != _categories_generation():
+        generation, index = stamped_category_index.warm()
+    return index
+
+
+def get_category_product_counts():
+    """{category_id: active products in the category and all its subcategories}"""
+    from .catalog_stats import get_category_stats
+
+    return {pk: stats['product_count'] for pk, stats in get_category_stats().items()}
+
+
+def get_descendant_ids(category_id, include_self=True):
+    return get_category_index().descendant_ids(category_id, include_self=include_self)
@@ -3,7 +3,8 @@ Create this file: shop/context_processors.py
 
 """
 
-from .models import Cart, Category
+from . import catalog
+from .models import Cart
 
 def cart_context(request):
     """Add cart count to all templates"""
@@ -22,10 +23,7 @@ def cart_context(request):
 
 def categories_context(request):
     """Add categories to all templates for mega menu"""
-    categories = Category.objects.filter(
-        is_active=True, 
-        parent=None
-    ).prefetch_related('children')[:8]
+    categories = catalog.category_tree(limit=8)
     
     return {
         'categories': categories
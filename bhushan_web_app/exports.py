@@ -0,0 +1,143 @@
+# exports.py
+# Streaming CSV / JSON lines exports of orders, products and contact
+# messages, for the admin export actions and `manage.py export_data`.
+#
+# Rows are read with values_list() through QuerySet.iterator(), i.e. a
+# server-side cursor on PostgreSQL fetching CHUNK_SIZE rows at a time, and
+# each row is encoded and handed to the client (StreamingHttpResponse) or
+# the file as soon as it is read. No model instances are built and memory
+# does not grow with the number of rows.
+
+from datetime import datetime
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+CHUNK_SIZE = 2000
+
+# Cells a spreadsheet would evaluate as formulas (CSV injection)
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+# name -> (model label, [(column, lookup)])
+EXPORTS = {
+    'orders': ('bhushan_web_app.Order', [
+        ('order_number', 'order_number'),
+        ('customer_mobile', 'user__mobile'),
+        ('status', 'status'),
+        ('subtotal', 'subtotal'),
+        ('tax_amount', 'tax_amount'),
+        ('shipping_charge', 'shipping_charge'),
+        ('discount_amount', 'discount_amount'),
+        ('total_amount', 'total_amount'),
+        ('shipping_city', 'shipping_address__city'),
+        ('shipping_state', 'shipping_address__state'),
+        ('shipping_pincode', 'shipping_address__pincode'),
+        ('created_at', 'created_at'),
+        ('confirmed_at', 'confirmed_at'),
+        ('shipped_at', 'shipped_at'),
+        ('delivered_at', 'delivered_at'),
+    ]),
+    'products': ('bhushan_web_app.Product', [
+        ('sku', 'sku'),
+        ('name', 'name'),
+        ('category', 'category__name'),
+        ('brand', 'brand__name'),
+        ('price', 'price'),
+        ('compare_price', 'compare_price'),
+        ('cost_price', 'cost_price'),
+        ('stock', 'stock'),
+        ('is_active', 'is_active'),
+        ('is_featured', 'is_featured'),
+        ('views_count', 'views_count'),
+        ('sales_count', 'sales_count'),
+        ('created_at', 'created_at'),
+    ]),
+    'contact_messages': ('bhushan_web_app.ContactMessage', [
+        ('name', 'name'),
+        ('email', 'email'),
+        ('phone', 'phone'),
+        ('subject', 'subject'),
+        ('message', 'message'),
+        ('is_read', 'is_read'),
+        ('created_at', 'created_at'),
+    ]),
+}
+
+FORMATS = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+}
+
+
+def export_queryset(name):
+    """All rows of export ``name``, in primary-key order"""
+    from django.apps import apps
+
+    label, _ = EXPORTS[name]
+    return apps.get_model(label).objects.order_by('pk')
+
+
+def _rows(name, queryset):
+    _, columns = EXPORTS[name]
+    return queryset.values_list(*[lookup for _, lookup in columns]).iterator(chunk_size=CHUNK_SIZE)
+
+
+# ==========================================
+# Encoders
+# ==========================================
+
+class _Echo:
+    """File-like object whose write() returns the line instead of storing it"""
+
+    def write(self, value):
+        return value
+
+
+def _local(value):
+    """Timestamps in the store's time zone, like the admin shows them"""
+    return timezone.localtime(value).isoformat() if isinstance(value, datetime) else value
+
+
+def _csv_cell(value):
+    if value is None:
+        return ''
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        # Quoted so spreadsheets show the text instead of running it
+        return "'" + value
+    return _local(value)
+
+
+def encode_csv(columns, rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(columns)
+    for row in rows:
+        yield writer.writerow([_csv_cell(value) for value in row])
+
+
+def encode_jsonl(columns, rows):
+    encoder = DjangoJSONEncoder()
+    for row in rows:
+        yield encoder.encode(dict(zip(columns, map(_local, row)))) + '\n'
+
+
+ENCODERS = {
+    'csv': encode_csv,
+    'jsonl': encode_jsonl,
+}
+
+
+def stream(name, queryset, fmt='csv'):
+    """Encoded lines of export ``name`` for ``queryset``"""
+    _, columns = EXPORTS[name]
+    return ENCODERS[fmt]([column for column, _ in columns], _rows(name, queryset))
+
+
+def streaming_response(name, queryset, fmt='csv'):
+    """Attachment download of ``queryset`` as export ``name``"""
+    response = StreamingHttpResponse(stream(name, queryset, fmt), content_type=FORMATS[fmt])
+    filename = f"{name}-{timezone.localtime():%Y%m%d-%H%M%S}.{fmt}"
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
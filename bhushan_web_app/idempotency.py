@@ -0,0 +1,211 @@
+# idempotency.py
+# Idempotency keys for checkout and payment endpoints.
+#
+# A client that sends an ``Idempotency-Key`` header gets the response of the
+# first successful attempt for that key back on every retry, for
+# IDEMPOTENCY_TTL seconds, instead of a second order or payment. Keys are
+# scoped to the user and the endpoint.
+#
+# Redis holds the stored responses, so a retry costs one cache lookup. The
+# idempotency_keys table is the fallback behind it: its unique key column is
+# the lock taken by the first attempt (a concurrent duplicate waits for that
+# attempt and replays its response), and it keeps the response when Redis is
+# unavailable or has evicted it. Failed attempts release the key, so they
+# can be retried.
+
+from datetime import timedelta
+from functools import wraps
+import hashlib
+import json
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from .cache_utils import CacheKeys
+
+logger = logging.getLogger(__name__)
+
+HEADER = 'HTTP_IDEMPOTENCY_KEY'
+REPLAY_HEADER = 'Idempotent-Replayed'
+MAX_KEY_LENGTH = 255
+DEFAULT_TTL = 24 * 60 * 60
+LOCK_TIMEOUT = 60       # seconds before an unfinished attempt is presumed dead
+WAIT_TIMEOUT = 10       # seconds a duplicate waits for the attempt in flight
+POLL_INTERVAL = 0.1
+
+
+class KeyInFlight(Exception):
+    """The first attempt for the key is still running"""
+
+
+def _ttl():
+    return getattr(settings, 'IDEMPOTENCY_TTL', DEFAULT_TTL)
+
+
+def scoped_key(request, key):
+    user_id = request.user.pk if request.user.is_authenticated else ''
+    return hashlib.sha256(f'{user_id}:{request.path}:{key}'.encode()).hexdigest()
+
+
+def fingerprint(request):
+    """Hash of the request body; a key may not be reused for another body"""
+    body = json.dumps(request.data, sort_keys=True, default=str)
+    return hashlib.sha256(body.encode()).hexdigest()
+
+
+def _entry(row):
+    return {'request_hash': row.request_hash, 'status_code': row.status_code, 'response': row.response}
+
+
+def _store(key, entry):
+    cache.set(CacheKeys.idempotent_response(key), entry, _ttl())
+
+
+# ==========================================
+# Locking
+# ==========================================
+
+def _wait(key, pk):
+    """The entry of the attempt holding ``pk``, or None if it gave up"""
+    from .models import IdempotencyKey
+
+    deadline = time.monotonic() + WAIT_TIMEOUT
+    while time.monotonic() < deadline:
+        time.sleep(POLL_INTERVAL)
+        entry = cache.get(CacheKeys.idempotent_response(key))
+        if entry is not None:
+            return entry
+        row = IdempotencyKey.objects.filter(pk=pk).first()
+        if row is None:
+            return None
+        if row.status_code is not None:
+            return _entry(row)
+    raise KeyInFlight(key)
+
+
+def acquire(key, request_hash, user=None):
+    """
+    Take ``key`` for a first attempt (returns None), or return the stored
+    entry of an earlier one - waiting for it if it is still running
+    """
+    from .models import IdempotencyKey
+
+    while True:
+        now = timezone.now()
+        try:
+            with transaction.atomic():
+                IdempotencyKey.objects.create(
+                    key=key, user=user, request_hash=request_hash,
+                    expires_at=now + timedelta(seconds=_ttl()),
+                )
+            return None
+        except IntegrityError:
+            pass
+
+        row = IdempotencyKey.objects.filter(key=key).first()
+        if row is None:
+            continue
+        expired = row.expires_at <= now
+        abandoned = row.status_code is None and row.created_at < now - timedelta(seconds=LOCK_TIMEOUT)
+        if expired or abandoned:
+            IdempotencyKey.objects.filter(pk=row.pk).delete()
+            continue
+        if row.status_code is not None:
+            entry = _entry(row)
+            _store(key, entry)
+            return entry
+
+        entry = _wait(key, row.pk)
+        if entry is not None:
+            return entry
+
+
+def release(key):
+    """Free ``key`` after a failed first attempt"""
+    from .models import IdempotencyKey
+
+    IdempotencyKey.objects.filter(key=key, status_code__isnull=True).delete()
+
+
+def complete(key, request_hash, response):
+    """Keep a successful ``response`` for replays; release the key otherwise"""
+    from .models import IdempotencyKey
+
+    if not status.is_success(response.status_code):
+        release(key)
+        return
+    IdempotencyKey.objects.filter(key=key).update(
+        status_code=response.status_code, response=response.data,
+        expires_at=timezone.now() + timedelta(seconds=_ttl()),
+    )
+    _store(key, {'request_hash': request_hash, 'status_code': response.status_code,
+                 'response': response.data})
+
+
+def purge_expired():
+    """Delete expired keys; returns the number deleted"""
+    from .models import IdempotencyKey
+
+    deleted, _ = IdempotencyKey.objects.filter(expires_at__lte=timezone.now()).delete()
+    return deleted
+
+
+# ==========================================
+# View decorator
+# ==========================================
+
+def _replay(entry):
+    response = Response(entry['response'], status=entry['status_code'])
+    response[REPLAY_HEADER] = 'true'
+    return response
+
+
+def idempotent(handler):
+    """
+    Make an APIView handler (``post``) idempotent for requests that carry an
+    Idempotency-Key header; requests without one run as before
+    """
+    @wraps(handler)
+    def wrapper(self, request, *args, **kwargs):
+        raw_key = request.META.get(HEADER)
+        if not raw_key:
+            return handler(self, request, *args, **kwargs)
+        if len(raw_key) > MAX_KEY_LENGTH:
+            return Response({'error': 'Idempotency-Key is too long'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        key = scoped_key(request, raw_key)
+        request_hash = fingerprint(request)
+        user = request.user if request.user.is_authenticated else None
+
+        entry = cache.get(CacheKeys.idempotent_response(key))
+        if entry is None:
+            try:
+                entry = acquire(key, request_hash, user)
+            except KeyInFlight:
+                response = Response({'error': 'A request with this Idempotency-Key is in progress'},
+                                    status=status.HTTP_409_CONFLICT)
+                response['Retry-After'] = '1'
+                return response
+
+        if entry is not None:
+            if entry['request_hash'] != request_hash:
+                return Response({'error': 'Idempotency-Key was used for a different request'},
+                                status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+            return _replay(entry)
+
+        try:
+            response = handler(self, request, *args, **kwargs)
+        except Exception:
+            release(key)
+            raise
+        complete(key, request_hash, response)
+        return response
+
+    return wrapper
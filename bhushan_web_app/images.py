@@ -0,0 +1,342 @@
+# images.py
+# Responsive image renditions.
+#
+# ProductImage.image, Category.image and Brand.logo are resized by a Celery
+# task into a few fixed widths, each encoded as AVIF, WebP and a JPEG (PNG
+# for transparent sources) fallback. Rendition files are named after the
+# SHA-256 of the source bytes, so a URL never changes content and can be
+# served with a one-year immutable Cache-Control.
+#
+# A small manifest describing what was generated is stored in a JSONField
+# next to the image field. Templates render <picture>/srcset markup from it
+# (templatetags/responsive_images.py) and fall back to the original upload
+# until the task has filled it in.
+#
+# The same task stores a tiny blurred placeholder (LQIP data: URI) and the
+# dominant color on ProductImage, so product grids can paint immediately
+# and load the real images lazily.
+#
+# Listings embed rendition URLs, so a stored manifest invalidates its tag
+# ('products', 'categories', 'brands'). Task runs debounce that: a burst of
+# renditions (an import, a backfill) shares one invalidation per
+# INVALIDATE_DELAY instead of one per image.
+
+from base64 import b64encode
+import hashlib
+from io import BytesIO
+import logging
+import re
+
+from django.apps import apps
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils.html import format_html, format_html_join
+from PIL import Image, ImageOps, features
+
+from .invalidation import coalesce_invalidations, mark_dirty
+
+logger = logging.getLogger(__name__)
+
+RENDITION_DIR = 'renditions'
+RENDITION_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+RENDITION_NAME_RE = re.compile(r'^[0-9a-f]{2}/[0-9a-f]{64}-\d{1,5}\.(avif|webp|jpg|png)$')
+
+# Named widths (px); sources are never upscaled
+RENDITION_WIDTHS = {
+    'thumb': 160,
+    'card': 400,
+    'detail': 800,
+    'zoom': 1600,
+}
+
+# Encoder settings per file extension. Modern formats are listed in
+# preference order and only produced when this Pillow build supports them.
+FORMATS = {
+    'avif': ('AVIF', 'image/avif', {'quality': 55}),
+    'webp': ('WEBP', 'image/webp', {'quality': 80, 'method': 4}),
+    'jpg': ('JPEG', 'image/jpeg', {'quality': 82, 'optimize': True, 'progressive': True}),
+    'png': ('PNG', 'image/png', {'optimize': True}),
+}
+MODERN_FORMATS = [fmt for fmt in ('avif', 'webp') if features.check(fmt)]
+
+INVALIDATE_LOCK_PREFIX = 'renditions:invalidate:'
+INVALIDATE_DELAY = 10      # seconds; renditions finishing meanwhile share one invalidation
+
+# Single-URL contexts (JS payloads, main image swapping) use WebP
+URL_FORMAT = 'webp'
+
+# "<app_label.model>" -> (image field, manifest field, cache tag to invalidate)
+IMAGE_FIELDS = {
+    'bhushan_web_app.productimage': ('image', 'renditions', 'products'),
+    'bhushan_web_app.category': ('image', 'image_renditions', 'categories'),
+    'bhushan_web_app.brand': ('logo', 'logo_renditions', 'brands'),
+}
+
+# Models that also store ``placeholder`` and ``dominant_color``
+PLACEHOLDER_MODELS = {'bhushan_web_app.productimage'}
+PLACEHOLDER_WIDTH = 16  # px; roughly 200-400 bytes once base64 encoded
+
+
+# ==========================================
+# Generation
+# ==========================================
+
+def rendition_name(digest, width, fmt):
+    return f'{RENDITION_DIR}/{digest[:2]}/{digest}-{width}.{fmt}'
+
+
+def _prepare(data):
+    image = ImageOps.exif_transpose(Image.open(BytesIO(data)))
+    has_alpha = image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+    return image.convert('RGBA' if has_alpha else 'RGB'), ('png' if has_alpha else 'jpg')
+
+
+def _load(field_file):
+    """(source digest, decoded image, fallback format)"""
+    with field_file.open('rb') as f:
+        data = f.read()
+    image, fallback = _prepare(data)
+    return hashlib.sha256(data).hexdigest(), image, fallback
+
+
+def build_renditions(field_file, force=False, loaded=None):
+    """
+    Write every rendition of ``field_file`` to default storage and return
+    its manifest. Files that already exist (same source bytes) are reused.
+    """
+    digest, image, fallback = loaded or _load(field_file)
+
+    formats = MODERN_FORMATS + [fallback]
+    widths = sorted({min(width, image.width) for width in RENDITION_WIDTHS.values()})
+    for width in widths:
+        resized = None
+        for fmt in formats:
+            name = rendition_name(digest, width, fmt)
+            if default_storage.exists(name):
+                if not force:
+                    continue
+                default_storage.delete(name)
+            if resized is None:
+                height = max(1, round(image.height * width / image.width))
+                resized = image if width == image.width else image.resize((width, height), Image.LANCZOS)
+            pil_format, _, options = FORMATS[fmt]
+            buffer = BytesIO()
+            resized.save(buffer, pil_format, **options)
+            default_storage.save(name, ContentFile(buffer.getvalue()))
+
+    return {
+        'source': field_file.name,
+        'digest': digest,
+        'width': image.width,
+        'height': image.height,
+        'widths': widths,
+        'formats': formats,
+    }
+
+
+def build_placeholder(image):
+    """Tiny blurred preview as a data: URI and the dominant ``#rrggbb`` color"""
+    if image.mode == 'RGBA':
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        image = background
+
+    height = max(1, round(image.height * PLACEHOLDER_WIDTH / image.width))
+    tiny = image.resize((PLACEHOLDER_WIDTH, height), Image.BOX)
+    fmt = 'webp' if 'webp' in MODERN_FORMATS else 'jpg'
+    buffer = BytesIO()
+    tiny.save(buffer, FORMATS[fmt][0], quality=40)
+    placeholder = f'data:{FORMATS[fmt][1]};base64,{b64encode(buffer.getvalue()).decode()}'
+
+    # Most common color of a 5-color palette, not the (muddy) average
+    sample = image.copy()
+    sample.thumbnail((64, 64))
+    quantized = sample.quantize(colors=5)
+    _, index = max(quantized.getcolors())
+    r, g, b = quantized.getpalette()[index * 3:index * 3 + 3]
+    return {'placeholder': placeholder, 'dominant_color': f'#{r:02x}{g:02x}{b:02x}'}
+
+
+def needs_renditions(instance):
+    """True when the manifest (or placeholder) does not describe the current upload"""
+    model_label = instance._meta.label_lower
+    field, manifest_field, _ = IMAGE_FIELDS[model_label]
+    image = getattr(instance, field)
+    manifest = getattr(instance, manifest_field) or {}
+    if image and model_label in PLACEHOLDER_MODELS and not instance.dominant_color:
+        return True
+    return (image.name or '') != manifest.get('source', '')
+
+
+def process_image(model_label, pk, force=False, debounce=False):
+    """
+    Generate renditions for one row and store the manifest. Called by the
+    generate_image_renditions task (``debounce``: invalidate through
+    queue_invalidation()) and the backfill command.
+    """
+    field, manifest_field, tag = IMAGE_FIELDS[model_label]
+    model = apps.get_model(model_label)
+    instance = model.objects.filter(pk=pk).first()
+    if instance is None:
+        return None
+
+    image = getattr(instance, field)
+    manifest = {}
+    extra = {'placeholder': '', 'dominant_color': ''} if model_label in PLACEHOLDER_MODELS else {}
+    if image:
+        if not force and not needs_renditions(instance):
+            return getattr(instance, manifest_field)
+        try:
+            loaded = _load(image)
+            manifest = build_renditions(image, force=force, loaded=loaded)
+            if extra:
+                extra = build_placeholder(loaded[1])
+        except (OSError, Image.DecompressionBombError) as e:
+            logger.warning(f"Cannot build renditions for {model_label} {pk} ({image.name}): {e}")
+            return None
+
+    # Only store the manifest if the upload was not replaced meanwhile;
+    # update() skips the post_save handlers that queued this task
+    unchanged = {field: image.name} if image else {}
+    with coalesce_invalidations():
+        updated = model.objects.filter(pk=pk, **unchanged).update(
+            **{manifest_field: manifest}, **extra
+        )
+        if updated and debounce:
+            queue_invalidation(tag)
+        elif updated:
+            mark_dirty(tag)
+    return manifest
+
+
+def queue_invalidation(tag):
+    """Invalidate ``tag`` once, INVALIDATE_DELAY after the first of a burst of changes"""
+    # The lock outlives the countdown; the task deletes it when it starts,
+    # so changes landing after that queue the next run
+    if not cache.add(f'{INVALIDATE_LOCK_PREFIX}{tag}', 1, INVALIDATE_DELAY * 6):
+        return
+    from .tasks import invalidate_image_caches
+
+    try:
+        invalidate_image_caches.apply_async(kwargs={'tag': tag}, countdown=INVALIDATE_DELAY)
+    except Exception as e:
+        logger.warning(f"Could not queue the {tag} invalidation, invalidating now: {e}")
+        flush_invalidation(tag)
+
+
+def flush_invalidation(tag):
+    """Run the invalidation queued by queue_invalidation()"""
+    cache.delete(f'{INVALIDATE_LOCK_PREFIX}{tag}')
+    with coalesce_invalidations():
+        mark_dirty(tag)
+
+
+def queue_renditions(instance):
+    """Schedule rendition generation once the upload is committed"""
+    if not needs_renditions(instance):
+        return
+    from .tasks import generate_image_renditions
+
+    model_label, pk = instance._meta.label_lower, str(instance.pk)
+
+    def enqueue():
+        try:
+            generate_image_renditions.delay(model_label, pk)
+        except Exception as e:
+            # The backfill command picks up anything missed here
+            logger.warning(f"Could not queue renditions for {model_label} {pk}: {e}")
+
+    transaction.on_commit(enqueue)
+
+
+# ==========================================
+# URLs / Markup
+# ==========================================
+
+def _pick_width(manifest, size):
+    target = RENDITION_WIDTHS.get(size, RENDITION_WIDTHS['card'])
+    widths = manifest['widths']
+    return next((w for w in widths if w >= target), widths[-1])
+
+
+def _source_name(image):
+    """Storage name of a FieldFile, or a name already (category index rows)"""
+    return getattr(image, 'name', image) or ''
+
+
+def _has_manifest(name, manifest):
+    return bool(manifest and manifest.get('widths') and manifest.get('source') == name)
+
+
+def rendition_url(image, manifest, size='card', fmt=URL_FORMAT):
+    """URL of the rendition closest to ``size``; the original until one exists"""
+    name = _source_name(image)
+    if not name:
+        return ''
+    if not _has_manifest(name, manifest):
+        return default_storage.url(name)
+    if fmt not in manifest['formats']:
+        fmt = manifest['formats'][-1]
+    return default_storage.url(rendition_name(manifest['digest'], _pick_width(manifest, size), fmt))
+
+
+def srcset(manifest, fmt):
+    return ', '.join(
+        f"{default_storage.url(rendition_name(manifest['digest'], width, fmt))} {width}w"
+        for width in manifest['widths']
+    )
+
+
+def placeholder_style(placeholder='', color=''):
+    """Inline CSS painting the LQIP / dominant color behind an image while it loads"""
+    parts = []
+    if color:
+        parts.append(f'background-color:{color}')
+    if placeholder:
+        parts.append(f'background-image:url({placeholder});background-size:cover;background-position:center')
+    return ';'.join(parts)
+
+
+def picture_html(image, manifest, size='card', alt='', css_class='', style='',
+                 sizes=None, loading='lazy', placeholder='', color=''):
+    """<picture> with AVIF/WebP sources and a JPEG/PNG <img> fallback"""
+    name = _source_name(image)
+    if not name:
+        return ''
+    backdrop = placeholder_style(placeholder, color)
+    if backdrop:
+        style = f'{style.rstrip(";")};{backdrop}' if style else backdrop
+    if not _has_manifest(name, manifest):
+        return format_html(
+            '<img src="{}" alt="{}" class="{}" style="{}" loading="{}" decoding="async">',
+            default_storage.url(name), alt, css_class, style, loading,
+        )
+
+    sizes = sizes or f'{RENDITION_WIDTHS.get(size, RENDITION_WIDTHS["card"])}px'
+    width = _pick_width(manifest, size)
+    height = round(manifest['height'] * width / manifest['width'])
+    fallback = manifest['formats'][-1]
+    sources = format_html_join(
+        '', '<source type="{}" srcset="{}" sizes="{}">',
+        ((FORMATS[fmt][1], srcset(manifest, fmt), sizes) for fmt in manifest['formats'][:-1]),
+    )
+    # display:contents keeps existing img sizing classes relative to the card
+    return format_html(
+        '<picture style="display:contents">{}<img src="{}" srcset="{}" sizes="{}" width="{}" height="{}" '
+        'alt="{}" class="{}" style="{}" loading="{}" decoding="async"></picture>',
+        sources, default_storage.url(rendition_name(manifest['digest'], width, fallback)),
+        srcset(manifest, fallback), sizes, width, height, alt, css_class, style, loading,
+    )
+
+
+def rendition_urls(image, manifest, request=None, sizes=('thumb', 'card', 'detail')):
+    """{size: WebP URL} for API payloads; None until renditions exist"""
+    name = _source_name(image)
+    if not _has_manifest(name, manifest):
+        return None
+    urls = {size: rendition_url(name, manifest, size) for size in sizes}
+    if request is not None:
+        urls = {size: request.build_absolute_uri(url) for size, url in urls.items()}
+    return urls
@@ -0,0 +1,145 @@
+# instrumentation.py
+# Per-request accounting of SQL queries and cache calls.
+# RequestInstrumentationMiddleware opens a RequestStats for every request;
+# the DB execute wrapper and the instrumented cache backends record into it.
+
+from collections import Counter, defaultdict
+from contextvars import ContextVar
+import pickle
+import time
+
+_current_stats = ContextVar('request_stats', default=None)
+
+SQL_PREVIEW_CHARS = 1000  # SQL longer than this is truncated in reports
+
+
+class RequestStats:
+    """Query and cache counters collected while serving one request"""
+
+    def __init__(self, measure_cache_bytes=True):
+        self.started = time.perf_counter()
+        self.measure_cache_bytes = measure_cache_bytes
+        self.queries = []  # (sql, params, duration_ms)
+        self.query_time_ms = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.cache_writes = 0
+        self.cache_deletes = 0
+        self.cache_bytes_read = 0
+        self.cache_bytes_written = 0
+        self.cache_time_ms = 0.0
+        self.cache_families = defaultdict(lambda: {'hits': 0, 'misses': 0})
+
+    # ---------- recording ----------
+
+    def record_query(self, sql, params, duration_ms):
+        self.queries.append((sql, params, duration_ms))
+        self.query_time_ms += duration_ms
+
+    def record_cache_read(self, key, value, duration_ms):
+        family = cache_key_family(key)
+        if value is None:
+            self.cache_misses += 1
+            self.cache_families[family]['misses'] += 1
+        else:
+            self.cache_hits += 1
+            self.cache_families[family]['hits'] += 1
+            self.cache_bytes_read += self._size_of(value)
+        self.cache_time_ms += duration_ms
+
+    def record_cache_write(self, value, duration_ms):
+        self.cache_writes += 1
+        self.cache_bytes_written += self._size_of(value)
+        self.cache_time_ms += duration_ms
+
+    def record_cache_delete(self, count, duration_ms):
+        self.cache_deletes += count
+        self.cache_time_ms += duration_ms
+
+    def _size_of(self, value):
+        if not self.measure_cache_bytes:
+            return 0
+        try:
+            return len(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+        except Exception:
+            return 0
+
+    # ---------- reporting ----------
+
+    @property
+    def elapsed_ms(self):
+        return (time.perf_counter() - self.started) * 1000
+
+    @property
+    def query_count(self):
+        return len(self.queries)
+
+    def duplicate_query_count(self):
+        """Queries repeated with identical SQL and parameters"""
+        seen = Counter((sql, repr(params)) for sql, params, _ in self.queries)
+        return sum(count - 1 for count in seen.values() if count > 1)
+
+    def repeated_statements(self, threshold=3):
+        """
+        SQL statements (ignoring parameters) executed at least ``threshold``
+        times - the usual signature of an N+1 loop.
+        """
+        counts = Counter(sql for sql, _, _ in self.queries)
+        return [
+            {'sql': sql[:SQL_PREVIEW_CHARS], 'count': count}
+            for sql, count in counts.most_common() if count >= threshold
+        ]
+
+    def top_queries(self, limit=5):
+        """Statements ranked by cumulative time spent in this request"""
+        totals = defaultdict(lambda: {'count': 0, 'total_ms': 0.0})
+        for sql, _, duration_ms in self.queries:
+            totals[sql]['count'] += 1
+            totals[sql]['total_ms'] += duration_ms
+        ranked = sorted(totals.items(), key=lambda item: item[1]['total_ms'], reverse=True)
+        return [
+            {'sql': sql[:SQL_PREVIEW_CHARS], 'count': data['count'], 'total_ms': round(data['total_ms'], 3)}
+            for sql, data in ranked[:limit]
+        ]
+
+
+def cache_key_family(key):
+    """
+    Group a cache key into its family for reporting:
+    'catalog:filtered_products:abc' -> 'catalog:filtered_products',
+    'catalog:price_range' -> 'catalog:price_range', 'category_obj_x' -> 'category_obj'.
+    """
+    key = str(key)
+    if ':' in key:
+        return ':'.join(key.split(':')[:2])
+    if '_' in key:
+        return key.rsplit('_', 1)[0]
+    return key
+
+
+def current_stats():
+    """RequestStats of the request being served, or None outside a request"""
+    return _current_stats.get()
+
+
+def begin_request(measure_cache_bytes=True):
+    stats = RequestStats(measure_cache_bytes=measure_cache_bytes)
+    return stats, _current_stats.set(stats)
+
+
+def end_request(token):
+    _current_stats.reset(token)
+
+
+class QueryRecorder:
+    """connection.execute_wrapper hook timing every SQL statement"""
+
+    def __init__(self, stats):
+        self.stats = stats
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.stats.record_query(sql, params, (time.perf_counter() - start) * 1000)
@@ -0,0 +1,206 @@
+# invalidation.py
+# Coalesced cache invalidation.
+#
+# Signal handlers only *mark* cache tags dirty. Dirty tags are collected and
+# flushed as one deduplicated batch:
+#   * at the end of the request (InvalidationCoalescingMiddleware),
+#   * at the end of a ``coalesce_invalidations()`` block (bulk imports,
+#     management commands, Celery tasks),
+#   * otherwise once the surrounding transaction commits.
+# Saving 500 products in an admin action therefore deletes every key once.
+# Flushing a tag also bumps its catalog generation (catalog_version.py),
+# which the conditional-GET ETags are derived from.
+
+from contextlib import contextmanager
+import logging
+import threading
+
+from django.core.cache import cache
+from django.db import transaction
+
+from .cache_utils import CacheKeys, computation_targets, load_computations
+from .catalog_version import bump_generations
+
+logger = logging.getLogger(__name__)
+
+
+# ==========================================
+# Invalidation Map
+# ==========================================
+# Every tag that can be marked dirty. The catalog entries a tag drops are
+# declared by the cached computations themselves (catalog.py); the keys and
+# patterns listed here are extras outside that registry.
+#   products   - any product listing data
+#   categories - the category hierarchy; single saves/deletes only bump the
+#                'categories' generation, which outdates the cached index
+#                (category_tree.py); the tag also drops it
+#   brands     - brand list / brand stats
+#   trending   - trending lists rebuilt (trending.py)
+
+INVALIDATION_MAP = {
+    'products': {'keys': [], 'patterns': []},
+    'categories': {'keys': [], 'patterns': []},
+    'brands': {'keys': [], 'patterns': []},
+    'trending': {
+        # Only the top_selling tab of the filtered listing reads them
+        'keys': [],
+        'patterns': [CacheKeys.FILTERED_TOP_SELLING_PATTERN],
+    },
+}
+
+
+def tag_targets(tags):
+    """(keys, patterns) dropped by ``tags``: registered computations plus extras"""
+    load_computations()
+    keys, patterns = computation_targets(tags)
+    for tag in tags:
+        keys.update(INVALIDATION_MAP[tag]['keys'])
+        patterns.update(INVALIDATION_MAP[tag]['patterns'])
+    return keys, patterns
+
+
+# ==========================================
+# Pending Batch
+# ==========================================
+
+_state = threading.local()
+
+# name -> callable(ids) recomputing derived rows before keys are deleted
+_refreshers = {}
+
+# callables(tags) run after a batch was invalidated (cache re-warming)
+_flush_hooks = []
+
+
+def _pending():
+    if not hasattr(_state, 'tags'):
+        _state.tags = set()
+        _state.refresh = {}
+        _state.scopes = set()
+        _state.depth = 0
+    return _state
+
+
+def register_refresher(name, func):
+    """Register ``func(ids)`` to run for ids queued with ``mark_for_refresh``"""
+    _refreshers[name] = func
+
+
+def register_flush_hook(func):
+    """Register ``func(tags)`` to run after the keys of ``tags`` were deleted"""
+    if func not in _flush_hooks:
+        _flush_hooks.append(func)
+
+
+def mark_for_refresh(name, *ids):
+    """
+    Queue ids for the ``name`` refresher; they are recomputed once, in the
+    same batch and at the same point as pending invalidations.
+    """
+    state = _pending()
+    state.refresh.setdefault(name, set()).update(i for i in ids if i is not None)
+    if state.depth == 0:
+        transaction.on_commit(flush)
+
+
+def mark_changed(*scopes):
+    """
+    Queue catalog generation scopes (``product:<id>``, ``category:<id>``)
+    to be bumped in the same batch, after the caches are invalidated.
+    """
+    state = _pending()
+    state.scopes.update(s for s in scopes if s)
+    if state.depth == 0:
+        transaction.on_commit(flush)
+
+
+def mark_dirty(*tags):
+    """
+    Record that the caches behind ``tags`` are stale.
+
+    Inside a request or ``coalesce_invalidations()`` block the flush waits for
+    the outermost scope to exit; otherwise it runs when the current
+    transaction commits (immediately in autocommit mode).
+    """
+    state = _pending()
+    unknown = set(tags) - INVALIDATION_MAP.keys()
+    if unknown:
+        raise ValueError(f"Unknown cache tags: {', '.join(sorted(unknown))}")
+
+    state.tags.update(tags)
+    if state.depth == 0:
+        # Every registration flushes whatever is pending at that moment; the
+        # later ones find an empty batch. Callbacks dropped by a rollback
+        # leave their tags pending for the next flush.
+        transaction.on_commit(flush)
+
+
+def flush():
+    """
+    Run pending refreshers, then delete the keys and patterns of every
+    pending tag, once each, and bump the affected catalog generations
+    """
+    state = _pending()
+    if state.refresh:
+        refresh, state.refresh = state.refresh, {}
+        for name, ids in refresh.items():
+            try:
+                _refreshers[name](ids)
+            except Exception as e:
+                logger.warning(f"Refresher {name} failed for {len(ids)} ids: {e}")
+    if not (state.tags or state.scopes):
+        return
+    tags, state.tags = state.tags, set()
+    scopes, state.scopes = state.scopes, set()
+
+    try:
+        keys, patterns = tag_targets(tags)
+        if keys:
+            cache.delete_many(list(keys))
+        for pattern in patterns:
+            delete_pattern(pattern)
+        # Bumped last so a new ETag is never paired with stale cached data
+        bump_generations(tags | scopes)
+        logger.debug(f"Invalidated {sorted(tags)}: {len(keys)} keys, {len(patterns)} patterns")
+    except Exception as e:
+        logger.warning(f"Cache invalidation failed for {sorted(tags)}: {e}")
+        return
+
+    for hook in _flush_hooks:
+        try:
+            hook(tags)
+        except Exception as e:
+            logger.warning(f"Flush hook {getattr(hook, '__name__', hook)} failed: {e}")
+
+
+def delete_pattern(pattern):
+    """
+    Delete keys matching ``pattern`` with SCAN-based iteration (never KEYS).
+    Backends that cannot enumerate keys are cleared entirely - stale pages
+    are worse than a cold cache.
+    """
+    if hasattr(cache, 'delete_pattern'):
+        return cache.delete_pattern(pattern)
+    logger.warning(f"Cache backend cannot match '{pattern}'; clearing the whole cache")
+    cache.clear()
+    return 0
+
+
+@contextmanager
+def coalesce_invalidations():
+    """
+    Defer invalidation until the block exits, then flush one batch.
+    Use around bulk imports and loops that save many rows::
+
+        with coalesce_invalidations():
+            for row in rows:
+                Product.objects.update_or_create(...)
+    """
+    state = _pending()
+    state.depth += 1
+    try:
+        yield
+    finally:
+        state.depth -= 1
+        if state.depth == 0 and (state.tags or state.refresh or state.scopes):
+            transaction.on_commit(flush)
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+
+from bhushan_web_app.order_archive import (
+    BATCH_SIZE, archivable_orders, archive_cutoff, archive_orders,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Move delivered, cancelled and refunded orders older than "
+        "ORDER_ARCHIVE_AFTER_MONTHS (with their items, payments and tracking) "
+        "to the archive tables. Runs in small transactions, safe on a live site."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months', type=int,
+                            help='Archive orders older than this (default ORDER_ARCHIVE_AFTER_MONTHS)')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE,
+                            help=f'Orders moved per transaction (default {BATCH_SIZE})')
+        parser.add_argument('--limit', type=int,
+                            help='Stop after this many orders')
+        parser.add_argument('--pause', type=float, default=0,
+                            help='Seconds to sleep between batches')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only count the orders that would be archived')
+
+    def handle(self, *args, **options):
+        if options['dry_run']:
+            count = archivable_orders(archive_cutoff(options['months'])).count()
+            self.stdout.write(f"{count} orders would be archived")
+            return
+
+        moved = archive_orders(
+            months=options['months'], batch_size=options['batch_size'],
+            limit=options['limit'], pause=options['pause'],
+        )
+        self.stdout.write(self.style.SUCCESS(f"Archived {moved} orders"))
@@ -0,0 +1,61 @@
+from django.core.management.base import BaseCommand
+from django.apps import apps
+
+from bhushan_web_app.images import (
+    IMAGE_FIELDS, PLACEHOLDER_MODELS, needs_renditions, process_image,
+)
+from bhushan_web_app.invalidation import coalesce_invalidations
+from bhushan_web_app.tasks import generate_image_renditions
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate thumbnails and WebP/AVIF renditions (and product image "
+        "placeholders) for existing product images, category images and brand "
+        "logos that have none or are stale."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model', choices=sorted(IMAGE_FIELDS),
+                            help='Only process this model (default: all)')
+        parser.add_argument('--force', action='store_true',
+                            help='Regenerate even when the manifest is current')
+        parser.add_argument('--async', action='store_true', dest='use_celery',
+                            help='Queue Celery tasks instead of processing inline')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Rows fetched per query (default 500)')
+
+    def handle(self, *args, **options):
+        labels = [options['model']] if options['model'] else list(IMAGE_FIELDS)
+        # Inline runs invalidate the listing caches once at the end
+        with coalesce_invalidations():
+            for label in labels:
+                self._backfill(label, options)
+
+    def _backfill(self, label, options):
+        field, manifest_field, _ = IMAGE_FIELDS[label]
+        model = apps.get_model(label)
+        columns = ['pk', field, manifest_field]
+        if label in PLACEHOLDER_MODELS:
+            columns.append('dominant_color')
+        rows = (
+            model.objects.exclude(**{field: ''}).exclude(**{f'{field}__isnull': True})
+            .only(*columns)
+            .iterator(chunk_size=options['batch_size'])
+        )
+
+        queued = processed = failed = 0
+        for instance in rows:
+            if not options['force'] and not needs_renditions(instance):
+                continue
+            if options['use_celery']:
+                generate_image_renditions.delay(label, str(instance.pk), force=options['force'])
+                queued += 1
+            elif process_image(label, instance.pk, force=options['force']) is None:
+                failed += 1
+            else:
+                processed += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{label}: {processed} processed, {queued} queued, {failed} failed"
+        ))
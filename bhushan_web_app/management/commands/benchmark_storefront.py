@@ -0,0 +1,105 @@
+import json
+import platform
+import subprocess
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import (
+    override_settings, setup_test_environment, teardown_test_environment,
+)
+from django.utils import timezone
+
+from bhushan_web_app.benchmarks import (
+    BENCHMARK_CACHES, DEFAULT_CATALOG_SIZE, run_storefront_benchmarks, seed_catalog,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a synthetic catalog into a throwaway test database and measure "
+        "latency percentiles and query counts of the storefront's hot endpoints. "
+        "Results are written as JSON for tracking across releases."
+    )
+
+    def add_arguments(self, parser):
+        for name, default in DEFAULT_CATALOG_SIZE.items():
+            parser.add_argument(
+                f"--{name.replace('_', '-')}", type=int, default=default,
+                dest=name, help=f"Synthetic catalog size: {name} (default {default})",
+            )
+        parser.add_argument('--iterations', type=int, default=20,
+                            help='Timed requests per endpoint (default 20)')
+        parser.add_argument('--warmup', type=int, default=1,
+                            help='Untimed requests per endpoint after the cold sample')
+        parser.add_argument('--cache', choices=['locmem', 'configured'], default='locmem',
+                            help="'locmem' uses the in-process Redis stand-in, "
+                                 "'configured' uses settings.CACHES (e.g. a local Redis)")
+        parser.add_argument('--only', nargs='*',
+                            help='Only run endpoints whose name starts with these prefixes')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed for the catalog')
+        parser.add_argument('--output', help='Write results to this file instead of stdout')
+        parser.add_argument('--keepdb', action='store_true',
+                            help='Keep the benchmark database between runs')
+
+    def handle(self, *args, **options):
+        cache_settings = BENCHMARK_CACHES.get(options['cache'], settings.CACHES)
+
+        setup_test_environment()
+        old_db_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, keepdb=options['keepdb'],
+        )
+        try:
+            # Re-warming runs in Celery workers, not in the measured requests
+            with override_settings(CACHES=cache_settings, COMPRESS_ENABLED=False,
+                                   COMPRESS_OFFLINE=False, CACHE_WARMING_ENABLED=False):
+                catalog = seed_catalog(
+                    seed=options['seed'],
+                    **{name: options[name] for name in DEFAULT_CATALOG_SIZE},
+                )
+                results = run_storefront_benchmarks(
+                    catalog,
+                    iterations=options['iterations'],
+                    warmup=options['warmup'],
+                    only=options['only'],
+                )
+        finally:
+            connection.creation.destroy_test_db(
+                old_db_name, verbosity=0, keepdb=options['keepdb'],
+            )
+            teardown_test_environment()
+
+        report = {
+            'generated_at': timezone.now().isoformat(),
+            'git_revision': self._git_revision(),
+            'environment': {
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+                'cache_backend': cache_settings['default']['BACKEND'],
+            },
+            'catalog': catalog['counts'],
+            'iterations': options['iterations'],
+            'results': results,
+        }
+
+        payload = json.dumps(report, indent=2, default=str)
+        if options['output']:
+            with open(options['output'], 'w') as fh:
+                fh.write(payload)
+            self.stdout.write(self.style.SUCCESS(
+                f"Wrote {len(results)} endpoint results to {options['output']}"
+            ))
+        else:
+            self.stdout.write(payload)
+
+    @staticmethod
+    def _git_revision():
+        try:
+            return subprocess.check_output(
+                ['git', 'rev-parse', '--short', 'HEAD'],
+                stderr=subprocess.DEVNULL, cwd=settings.BASE_DIR,
+            ).decode().strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
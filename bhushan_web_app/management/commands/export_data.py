@@ -0,0 +1,27 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from bhushan_web_app.exports import EXPORTS, FORMATS, export_queryset, stream
+
+
+class Command(BaseCommand):
+    help = (
+        "Stream orders, products or contact messages to CSV or JSON lines "
+        "with constant memory, however many rows there are."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', choices=sorted(EXPORTS))
+        parser.add_argument('--format', choices=sorted(FORMATS), default='csv',
+                            help='Output format (default csv)')
+        parser.add_argument('--output', help='File to write (default: stdout)')
+
+    def handle(self, *args, **options):
+        output = open(options['output'], 'w', newline='') if options['output'] else sys.stdout
+        try:
+            for line in stream(options['name'], export_queryset(options['name']), options['format']):
+                output.write(line)
+        finally:
+            if output is not sys.stdout:
+                output.close()
@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from bhushan_web_app.catalog_import import (
+    BATCH_SIZE, IMAGE_WORKERS, READERS, import_catalog,
+)
+
+MAX_ERRORS_SHOWN = 20
+
+
+class Command(BaseCommand):
+    help = (
+        "Bulk import products, variations, images, categories and brands from "
+        "CSV or JSON lines, upserting on sku."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Catalog file')
+        parser.add_argument('--format', choices=sorted(READERS),
+                            help='File format (default: from the extension)')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE,
+                            help=f'Rows written per transaction (default {BATCH_SIZE})')
+        parser.add_argument('--image-workers', type=int, default=IMAGE_WORKERS,
+                            help=f'Parallel image downloads (default {IMAGE_WORKERS})')
+        parser.add_argument('--images-root',
+                            help='Directory relative image paths are read from')
+        parser.add_argument('--no-renditions', action='store_true',
+                            help='Do not queue image renditions (run backfill_image_renditions later)')
+
+    def handle(self, *args, **options):
+        try:
+            run = import_catalog(
+                options['path'], options['format'],
+                batch_size=options['batch_size'],
+                image_workers=options['image_workers'],
+                images_root=options['images_root'],
+                renditions=not options['no_renditions'],
+            )
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+
+        counts = run.counts
+        self.stdout.write(
+            f"{counts['rows']} rows: {counts['created']} products created, "
+            f"{counts['updated']} updated, {counts['variations']} variations, "
+            f"{counts['images']} images ({counts['image_errors']} failed), "
+            f"{counts['categories_created']} categories and "
+            f"{counts['brands_created']} brands created"
+        )
+        for line, sku, message in run.errors[:MAX_ERRORS_SHOWN]:
+            self.stderr.write(f"Line {line} ({sku or 'no sku'}): {message}")
+        if len(run.errors) > MAX_ERRORS_SHOWN:
+            self.stderr.write(f"... and {len(run.errors) - MAX_ERRORS_SHOWN} more errors")
+        style = self.style.WARNING if run.errors else self.style.SUCCESS
+        self.stdout.write(style(f"Import finished with {len(run.errors)} errors"))
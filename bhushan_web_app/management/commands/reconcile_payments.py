@@ -0,0 +1,50 @@
+from datetime import date, timedelta
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from bhushan_web_app.invalidation import coalesce_invalidations
+from bhushan_web_app.reconciliation import CHUNK_SIZE, READERS, reconcile
+from bhushan_web_app.sales_rollups import local_midnight
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare payments with a gateway settlement report (CSV or JSON lines), "
+        "write the discrepancies as CSV and apply the safe fixes in bulk."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('report', help='Gateway report file')
+        parser.add_argument('--format', choices=sorted(READERS),
+                            help='Report format (default: from the file extension)')
+        parser.add_argument('--output', help='Discrepancy CSV file (default: stdout)')
+        parser.add_argument('--since', type=date.fromisoformat,
+                            help='First day the report covers (YYYY-MM-DD); also flags '
+                                 'captured payments missing from it')
+        parser.add_argument('--until', type=date.fromisoformat,
+                            help='Last day the report covers (YYYY-MM-DD)')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only report, change nothing')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE,
+                            help=f'Payments compared per query (default {CHUNK_SIZE})')
+
+    def handle(self, *args, **options):
+        since = local_midnight(options['since']) if options['since'] else None
+        until = local_midnight(options['until'] + timedelta(days=1)) if options['until'] else None
+        output = open(options['output'], 'w', newline='') if options['output'] else sys.stdout
+        try:
+            # Bulk order fixes invalidate caches once at the end
+            with coalesce_invalidations():
+                summary = reconcile(
+                    options['report'], output, fmt=options['format'], since=since, until=until,
+                    apply_fixes=not options['dry_run'], chunk_size=options['chunk_size'],
+                )
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Cannot read gateway report: {e}")
+        finally:
+            if output is not sys.stdout:
+                output.close()
+
+        counts = ', '.join(f'{kind}: {count}' for kind, count in sorted(summary.items()))
+        self.stderr.write(self.style.SUCCESS(f"Reconciled payments ({counts})"))
@@ -0,0 +1,359 @@
+# metrics.py
+# Prometheus-style metrics aggregated across gunicorn and Celery workers.
+#
+# Samples are accumulated in Redis hashes (one per metric) so every worker
+# process writes to the same store and /metrics renders the cluster-wide
+# totals. When the default cache is not Redis (tests, benchmarks) an
+# in-process store is used instead.
+
+from collections import defaultdict
+import json
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection
+
+from .cache_utils import SharedStore
+
+logger = logging.getLogger(__name__)
+
+METRICS_KEY_PREFIX = 'metrics:'
+
+# Seconds; tuned for page/API latencies and Celery task runtimes
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+# ==========================================
+# Stores
+# ==========================================
+
+class LocalMetricsStore:
+    """In-process store; used when no Redis cache is configured"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data = defaultdict(lambda: defaultdict(float))
+
+    def increment(self, updates):
+        with self._lock:
+            for metric, field, amount in updates:
+                self._data[metric][field] += amount
+
+    def read(self, metric):
+        with self._lock:
+            return dict(self._data.get(metric, {}))
+
+    def reset(self):
+        with self._lock:
+            self._data.clear()
+
+
+class RedisMetricsStore:
+    """Shared store: one Redis hash per metric, updated with HINCRBYFLOAT"""
+
+    def __init__(self, client):
+        self.client = client
+
+    def increment(self, updates):
+        pipe = self.client.pipeline(transaction=False)
+        for metric, field, amount in updates:
+            pipe.hincrbyfloat(METRICS_KEY_PREFIX + metric, field, amount)
+        pipe.execute()
+
+    def read(self, metric):
+        raw = self.client.hgetall(METRICS_KEY_PREFIX + metric)
+        return {
+            (k.decode() if isinstance(k, bytes) else k): float(v)
+            for k, v in raw.items()
+        }
+
+    def reset(self):
+        for key in self.client.scan_iter(match=METRICS_KEY_PREFIX + '*'):
+            self.client.delete(key)
+
+
+_stores = SharedStore('Metrics', RedisMetricsStore, LocalMetricsStore)
+# Redis store when the default cache is django-redis, otherwise local
+get_store = _stores.get
+reset_store = _stores.reset
+
+
+# ==========================================
+# Metric Types
+# ==========================================
+
+def _labels_field(labelnames, labels):
+    return json.dumps([str(labels.get(name, '')) for name in labelnames])
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        REGISTRY.register(self)
+
+    def updates(self, **labels):
+        raise NotImplementedError
+
+    def samples(self):
+        """[(suffix, labels_dict, value)] read back from the store"""
+        raise NotImplementedError
+
+    def _decode_labels(self, field):
+        return dict(zip(self.labelnames, json.loads(field)))
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def updates(self, amount=1, **labels):
+        return [(self.name, _labels_field(self.labelnames, labels), amount)]
+
+    def inc(self, amount=1, **labels):
+        record(self.updates(amount, **labels))
+
+    def samples(self):
+        return [
+            ('_total', self._decode_labels(field), value)
+            for field, value in sorted(get_store().read(self.name).items())
+        ]
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        super().__init__(name, documentation, labelnames)
+
+    def updates(self, value, **labels):
+        field = _labels_field(self.labelnames, labels)
+        updates = [
+            (self.name, f'{field}|sum', value),
+            (self.name, f'{field}|count', 1),
+        ]
+        # Buckets are stored non-cumulatively and summed when rendering
+        for bound in self.buckets:
+            if value <= bound:
+                updates.append((self.name, f'{field}|le={bound}', 1))
+                break
+        else:
+            updates.append((self.name, f'{field}|le=+Inf', 1))
+        return updates
+
+    def observe(self, value, **labels):
+        record(self.updates(value, **labels))
+
+    def samples(self):
+        grouped = defaultdict(dict)
+        for key, value in get_store().read(self.name).items():
+            field, _, part = key.rpartition('|')
+            grouped[field][part] = value
+
+        samples = []
+        for field, parts in sorted(grouped.items()):
+            labels = self._decode_labels(field)
+            cumulative = 0
+            for bound in self.buckets:
+                cumulative += parts.get(f'le={bound}', 0)
+                samples.append(('_bucket', dict(labels, le=str(bound)), cumulative))
+            cumulative += parts.get('le=+Inf', 0)
+            samples.append(('_bucket', dict(labels, le='+Inf'), cumulative))
+            samples.append(('_sum', labels, parts.get('sum', 0)))
+            samples.append(('_count', labels, parts.get('count', 0)))
+        return samples
+
+
+class Gauge(Metric):
+    """
+    Gauge computed at scrape time by ``collect`` - a callable returning
+    [(labels_dict, value)]. Nothing is stored.
+    """
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, collect, labelnames=()):
+        self.collect = collect
+        super().__init__(name, documentation, labelnames)
+
+    def samples(self):
+        try:
+            return [('', labels, value) for labels, value in self.collect()]
+        except Exception as e:
+            logger.warning(f"Gauge {self.name} collection failed: {e}")
+            return []
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+
+    def render(self):
+        """Prometheus text exposition format (version 0.0.4)"""
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for suffix, labels, value in metric.samples():
+                lines.append(f'{metric.name}{suffix}{_format_labels(labels)} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    pairs = ','.join(
+        '{}="{}"'.format(k, str(v).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n'))
+        for k, v in labels.items()
+    )
+    return '{' + pairs + '}'
+
+
+def _format_value(value):
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def record(updates):
+    """Apply a batch of metric updates in one store round trip; never raises"""
+    if not updates or not getattr(settings, 'METRICS_ENABLED', True):
+        return
+    try:
+        get_store().increment(updates)
+    except Exception as e:
+        logger.warning(f"Failed to record metrics: {e}")
+
+
+# ==========================================
+# Scrape-time Collectors
+# ==========================================
+
+def collect_celery_queue_depth():
+    """Pending messages per Celery queue (Redis broker lists)"""
+    import redis
+
+    queues = getattr(settings, 'METRICS_CELERY_QUEUES', ['celery'])
+    client = redis.Redis.from_url(settings.CELERY_BROKER_URL, socket_timeout=2)
+    try:
+        pipe = client.pipeline(transaction=False)
+        for queue in queues:
+            pipe.llen(queue)
+        return [({'queue': q}, depth) for q, depth in zip(queues, pipe.execute())]
+    finally:
+        client.close()
+
+
+def collect_db_connections():
+    """Server-side connections to our database grouped by state (PostgreSQL)"""
+    if connection.vendor != 'postgresql':
+        return [({'state': 'open'}, 1 if connection.connection is not None else 0)]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT COALESCE(state, 'unknown'), COUNT(*) FROM pg_stat_activity "
+            "WHERE datname = current_database() GROUP BY 1"
+        )
+        rows = cursor.fetchall()
+        cursor.execute("SHOW max_connections")
+        max_connections = int(cursor.fetchone()[0])
+    samples = [({'state': state}, count) for state, count in rows]
+    samples.append(({'state': 'max'}, max_connections))
+    return samples
+
+
+# ==========================================
+# Metric Definitions
+# ==========================================
+
+http_requests = Counter(
+    'http_requests', 'HTTP requests served', ['view', 'method', 'status'],
+)
+http_request_duration = Histogram(
+    'http_request_duration_seconds', 'Request latency per view', ['view', 'method'],
+)
+http_request_queries = Histogram(
+    'http_request_db_queries', 'SQL queries issued per request', ['view'],
+    buckets=QUERY_COUNT_BUCKETS,
+)
+cache_requests = Counter(
+    'cache_requests', 'Cache reads per key family', ['family', 'result'],
+)
+cache_invalidations = Counter(
+    'cache_invalidations', 'Cache invalidations by triggering signal', ['signal'],
+)
+celery_task_duration = Histogram(
+    'celery_task_duration_seconds', 'Celery task runtime', ['task', 'state'],
+)
+celery_queue_length = Gauge(
+    'celery_queue_length', 'Messages waiting in each Celery queue',
+    collect_celery_queue_depth, ['queue'],
+)
+db_connections = Gauge(
+    'db_connections', 'Database connections by state', collect_db_connections, ['state'],
+)
+
+
+def observe_request(view, method, status, duration_ms, stats=None):
+    """Record one served request (called by RequestInstrumentationMiddleware)"""
+    view = view or 'unresolved'
+    updates = http_requests.updates(view=view, method=method, status=status)
+    updates += http_request_duration.updates(duration_ms / 1000, view=view, method=method)
+    if stats is not None:
+        updates += http_request_queries.updates(stats.query_count, view=view)
+        for family, counts in stats.cache_families.items():
+            if counts['hits']:
+                updates += cache_requests.updates(counts['hits'], family=family, result='hit')
+            if counts['misses']:
+                updates += cache_requests.updates(counts['misses'], family=family, result='miss')
+    record(updates)
+
+
+def cache_hit_ratios():
+    """{family: hit ratio} computed from the cache_requests counter"""
+    totals = defaultdict(lambda: {'hit': 0, 'miss': 0})
+    for _, labels, value in cache_requests.samples():
+        totals[labels['family']][labels['result']] += value
+    return {
+        family: round(c['hit'] / (c['hit'] + c['miss']), 4)
+        for family, c in totals.items() if c['hit'] + c['miss']
+    }
+
+
+# ==========================================
+# Celery Task Timing
+# ==========================================
+
+_task_started = {}
+
+
+def _task_prerun(task_id=None, **kwargs):
+    _task_started[task_id] = time.perf_counter()
+
+
+def _task_postrun(task_id=None, task=None, state=None, **kwargs):
+    started = _task_started.pop(task_id, None)
+    if started is not None:
+        celery_task_duration.observe(
+            time.perf_counter() - started,
+            task=getattr(task, 'name', 'unknown'), state=state or 'UNKNOWN',
+        )
+
+
+def connect_celery_signals():
+    from celery.signals import task_prerun, task_postrun
+    task_prerun.connect(_task_prerun, weak=False, dispatch_uid='metrics_task_prerun')
+    task_postrun.connect(_task_postrun, weak=False, dispatch_uid='metrics_task_postrun')
+
+
+connect_celery_signals()
@@ -1,6 +1,20 @@
+from contextlib import ExitStack
+import json
+import logging
+import random
+
+from django.conf import settings
+from django.db import connections
 from django.shortcuts import redirect
 from django.urls import reverse
 
+from . import metrics
+from .instrumentation import QueryRecorder, begin_request, end_request
+from .invalidation import coalesce_invalidations
+
+request_logger = logging.getLogger('bhushan_web_app.instrumentation')
+slow_logger = logging.getLogger('bhushan_web_app.instrumentation.slow')
+
 class ProfileCompletionMiddleware:
     """
     Middleware to redirect authenticated users with incomplete profiles
@@ -46,4 +60,106 @@ class ProfileCompletionMiddleware:
                         return redirect('shop:profile-completion')
         
         response = self.get_response(request)
-        return response
\ No newline at end of file
+        return response
+
+
+class RequestInstrumentationMiddleware:
+    """
+    Per-request SQL and cache accounting.
+
+    Wraps every database connection with ``connection.execute_wrapper`` and
+    collects cache calls made through the instrumented cache backends, then:
+      * adds a ``Server-Timing`` header (db / cache / app durations),
+      * logs one structured JSON line per request at DEBUG,
+      * feeds request latency and cache hit/miss counts to ``metrics``,
+      * logs slow requests (sampled) together with their most expensive SQL.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = getattr(settings, 'INSTRUMENTATION_ENABLED', True)
+        self.server_timing = getattr(settings, 'INSTRUMENTATION_SERVER_TIMING', True)
+        self.measure_cache_bytes = getattr(settings, 'INSTRUMENTATION_CACHE_BYTES', False)
+        self.slow_request_ms = getattr(settings, 'INSTRUMENTATION_SLOW_REQUEST_MS', 500)
+        self.slow_sample_rate = getattr(settings, 'INSTRUMENTATION_SLOW_SAMPLE_RATE', 1.0)
+        self.top_sql = getattr(settings, 'INSTRUMENTATION_TOP_SQL', 5)
+        self.exempt_prefixes = getattr(
+            settings, 'INSTRUMENTATION_EXEMPT_PATHS',
+            [settings.STATIC_URL, settings.MEDIA_URL],
+        )
+
+    def __call__(self, request):
+        if not self.enabled or request.path.startswith(tuple(self.exempt_prefixes)):
+            return self.get_response(request)
+
+        stats, token = begin_request(measure_cache_bytes=self.measure_cache_bytes)
+        recorder = QueryRecorder(stats)
+        try:
+            with ExitStack() as stack:
+                for conn in connections.all():
+                    stack.enter_context(conn.execute_wrapper(recorder))
+                response = self.get_response(request)
+        finally:
+            end_request(token)
+
+        self._report(request, response, stats)
+        return response
+
+    def _report(self, request, response, stats):
+        total_ms = stats.elapsed_ms
+        view = self._view_name(request)
+
+        if self.server_timing:
+            response['Server-Timing'] = ', '.join([
+                f'db;dur={stats.query_time_ms:.1f};desc="{stats.query_count} queries"',
+                f'cache;dur={stats.cache_time_ms:.1f};'
+                f'desc="{stats.cache_hits} hits, {stats.cache_misses} misses"',
+                f'app;dur={total_ms:.1f}',
+            ])
+
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'view': view,
+            'status': response.status_code,
+            'duration_ms': round(total_ms, 2),
+            'db_queries': stats.query_count,
+            'db_time_ms': round(stats.query_time_ms, 2),
+            'db_duplicate_queries': stats.duplicate_query_count(),
+            'cache_hits': stats.cache_hits,
+            'cache_misses': stats.cache_misses,
+            'cache_writes': stats.cache_writes,
+            'cache_deletes': stats.cache_deletes,
+            'cache_bytes_read': stats.cache_bytes_read,
+            'cache_bytes_written': stats.cache_bytes_written,
+            'cache_time_ms': round(stats.cache_time_ms, 2),
+        }
+        if request_logger.isEnabledFor(logging.DEBUG):
+            request_logger.debug(json.dumps(record))
+        metrics.observe_request(view, request.method, response.status_code, total_ms, stats)
+
+        if total_ms >= self.slow_request_ms and random.random() < self.slow_sample_rate:
+            record['top_sql'] = stats.top_queries(self.top_sql)
+            record['repeated_sql'] = stats.repeated_statements()[:self.top_sql]
+            slow_logger.warning(json.dumps(record, default=str))
+
+    @staticmethod
+    def _view_name(request):
+        match = getattr(request, 'resolver_match', None)
+        if match is None:
+            return None
+        return match.view_name or match._func_path
+
+
+class InvalidationCoalescingMiddleware:
+    """
+    Collects cache tags marked dirty while the request runs and flushes them
+    as a single deduplicated batch when it finishes (see invalidation.py).
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with coalesce_invalidations():
+            return self.get_response(request)
@@ -0,0 +1,30 @@
+from django.db import migrations
+
+
+def populate_paths(apps, schema_editor):
+    Category = apps.get_model('bhushan_web_app', 'Category')
+    categories = list(Category.objects.all())
+    children = {}
+    for category in categories:
+        children.setdefault(category.parent_id, []).append(category)
+
+    # Walk down from the roots so every parent's path is known first
+    stack = [(category, '/', 0) for category in children.get(None, [])]
+    while stack:
+        category, prefix, depth = stack.pop()
+        category.path = f"{prefix}{category.id.hex}/"
+        category.depth = depth
+        stack.extend((child, category.path, depth + 1) for child in children.get(category.id, []))
+
+    Category.objects.bulk_update(categories, ['path', 'depth'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bhushan_web_app', '0003_category_path'),
+    ]
+
+    operations = [
+        migrations.RunPython(populate_paths, migrations.RunPython.noop),
+    ]
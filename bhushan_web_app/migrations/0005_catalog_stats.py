@@ -0,0 +1,77 @@
+# Generated by Django 5.2.8 on 2026-10-19 12:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Max, Min, Q
+
+
+def populate_stats(apps, schema_editor):
+    Brand = apps.get_model('bhushan_web_app', 'Brand')
+    Category = apps.get_model('bhushan_web_app', 'Category')
+    Product = apps.get_model('bhushan_web_app', 'Product')
+    BrandStats = apps.get_model('bhushan_web_app', 'BrandStats')
+    CategoryStats = apps.get_model('bhushan_web_app', 'CategoryStats')
+
+    aggregates = dict(
+        product_count=Count('id'),
+        in_stock_count=Count('id', filter=Q(stock__gt=0)),
+        min_price=Min('price'),
+        max_price=Max('price'),
+    )
+    active = Product.objects.filter(is_active=True)
+    BrandStats.objects.bulk_create([
+        BrandStats(brand_id=brand.id, **active.filter(brand_id=brand.id).aggregate(**aggregates))
+        for brand in Brand.objects.all()
+    ])
+    # Later refreshes exclude subtrees under inactive categories; this first
+    # pass simply counts everything below each path.
+    CategoryStats.objects.bulk_create([
+        CategoryStats(
+            category_id=category.id,
+            **active.filter(category__path__startswith=category.path).aggregate(**aggregates),
+        )
+        for category in Category.objects.exclude(path='')
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bhushan_web_app', '0004_populate_category_path'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BrandStats',
+            fields=[
+                ('product_count', models.PositiveIntegerField(default=0)),
+                ('in_stock_count', models.PositiveIntegerField(default=0)),
+                ('min_price', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('max_price', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('brand', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='bhushan_web_app.brand')),
+            ],
+            options={
+                'verbose_name': 'Brand stats',
+                'verbose_name_plural': 'Brand stats',
+                'db_table': 'brand_stats',
+            },
+        ),
+        migrations.CreateModel(
+            name='CategoryStats',
+            fields=[
+                ('product_count', models.PositiveIntegerField(default=0)),
+                ('in_stock_count', models.PositiveIntegerField(default=0)),
+                ('min_price', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('max_price', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('category', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='bhushan_web_app.category')),
+            ],
+            options={
+                'verbose_name': 'Category stats',
+                'verbose_name_plural': 'Category stats',
+                'db_table': 'category_stats',
+            },
+        ),
+        migrations.RunPython(populate_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.8 on 2026-10-19 12:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bhushan_web_app', '0006_image_renditions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productimage',
+            name='dominant_color',
+            field=models.CharField(blank=True, editable=False, max_length=7),
+        ),
+        migrations.AddField(
+            model_name='productimage',
+            name='placeholder',
+            field=models.TextField(blank=True, editable=False),
+        ),
+    ]
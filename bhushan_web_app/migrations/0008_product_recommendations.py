@@ -0,0 +1,28 @@
+# Generated by Django 5.2.8 on 2026-10-19 12:45
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bhushan_web_app', '0007_image_placeholders'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductRecommendations',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='recommendations', serialize=False, to='bhushan_web_app.product')),
+                ('related_ids', models.JSONField(blank=True, default=list)),
+                ('bought_together_ids', models.JSONField(blank=True, default=list)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Product recommendations',
+                'verbose_name_plural': 'Product recommendations',
+                'db_table': 'product_recommendations',
+            },
+        ),
+    ]
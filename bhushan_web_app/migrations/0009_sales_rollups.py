@@ -0,0 +1,68 @@
+# Generated by Django 5.2.8 on 2026-10-19 12:57
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bhushan_web_app', '0008_product_recommendations'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySales',
+            fields=[
+                ('orders', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('units', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('date', models.DateField(primary_key=True, serialize=False)),
+                ('new_users', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Daily sales',
+                'verbose_name_plural': 'Daily sales',
+                'db_table': 'sales_daily',
+                'ordering': ['-date'],
+            },
+        ),
+        migrations.CreateModel(
+            name='HourlySales',
+            fields=[
+                ('orders', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('units', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('hour', models.DateTimeField(primary_key=True, serialize=False)),
+                ('new_users', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Hourly sales',
+                'verbose_name_plural': 'Hourly sales',
+                'db_table': 'sales_hourly',
+                'ordering': ['-hour'],
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyCategorySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('orders', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('units', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('date', models.DateField()),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_sales', to='bhushan_web_app.category')),
+            ],
+            options={
+                'verbose_name': 'Daily category sales',
+                'verbose_name_plural': 'Daily category sales',
+                'db_table': 'sales_daily_category',
+                'ordering': ['-date'],
+                'indexes': [models.Index(fields=['date'], name='sales_daily_date_555c2a_idx')],
+                'constraints': [models.UniqueConstraint(fields=('category', 'date'), name='unique_category_sales_day')],
+            },
+        ),
+    ]
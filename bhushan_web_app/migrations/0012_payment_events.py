@@ -0,0 +1,37 @@
+# Generated by Django 5.2.8 on 2026-10-19 13:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bhushan_web_app', '0011_idempotency_keys'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymentEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_type', models.CharField(choices=[('payment.captured', 'Payment captured'), ('payment.failed', 'Payment failed'), ('payment.refunded', 'Payment refunded')], max_length=30)),
+                ('transaction_id', models.CharField(max_length=100)),
+                ('payment_ref', models.UUIDField()),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('source', models.CharField(choices=[('gateway', 'Gateway webhook'), ('client', 'Client verification')], default='gateway', max_length=20)),
+                ('payload', models.JSONField(default=dict)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('processed', 'Processed'), ('ignored', 'Ignored'), ('failed', 'Failed')], default='pending', max_length=20)),
+                ('error', models.TextField(blank=True)),
+                ('received_at', models.DateTimeField(auto_now_add=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Payment Event',
+                'verbose_name_plural': 'Payment Events',
+                'db_table': 'payment_events',
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['status', 'id'], name='payment_eve_status_3dd203_idx')],
+                'constraints': [models.UniqueConstraint(fields=('transaction_id', 'event_type'), name='unique_payment_event')],
+            },
+        ),
+    ]
@@ -0,0 +1,97 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import migrations
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+
+# Frozen copy of sales_rollups.REVENUE_STATUSES
+REVENUE_STATUSES = ['delivered']
+
+
+def _empty():
+    return {'orders': 0, 'revenue': Decimal('0'), 'units': 0}
+
+
+def backfill_rollups(apps, schema_editor):
+    # The admin dashboard reads only the rollups; fill them for all history
+    # (live and archived orders) so it is right from the first request.
+    # Same GROUP BY queries as sales_rollups._collect, on historical models.
+    def get(name):
+        return apps.get_model('bhushan_web_app', name)
+
+    HourlySales, DailySales, DailyCategorySales = get('HourlySales'), get('DailySales'), get('DailyCategorySales')
+
+    revenue = Q(status__in=REVENUE_STATUSES)
+    item_revenue = Q(order__status__in=REVENUE_STATUSES)
+    hours = defaultdict(lambda: {**_empty(), 'new_users': 0})
+    categories = defaultdict(_empty)
+
+    for order_model, item_model in (('Order', 'OrderItem'), ('ArchivedOrder', 'ArchivedOrderItem')):
+        orders = (
+            get(order_model).objects.annotate(bucket=TruncHour('created_at'))
+            .values('bucket')
+            .annotate(orders=Count('id'), revenue=Sum('total_amount', filter=revenue))
+            .order_by()
+        )
+        for row in orders:
+            hours[row['bucket']]['orders'] += row['orders']
+            hours[row['bucket']]['revenue'] += row['revenue'] or Decimal('0')
+
+        items = (
+            get(item_model).objects.annotate(bucket=TruncHour('order__created_at'))
+            .values('bucket', 'product__category_id')
+            .annotate(
+                orders=Count('order_id', distinct=True),
+                units=Sum('quantity', filter=item_revenue),
+                revenue=Sum('total_price', filter=item_revenue),
+            )
+            .order_by()
+        )
+        for row in items:
+            units = row['units'] or 0
+            hours[row['bucket']]['units'] += units
+            category = categories[(timezone.localtime(row['bucket']).date(), row['product__category_id'])]
+            category['orders'] += row['orders']
+            category['units'] += units
+            category['revenue'] += row['revenue'] or Decimal('0')
+
+    users = (
+        get('User').objects.annotate(bucket=TruncHour('created_at'))
+        .values('bucket').annotate(new_users=Count('id')).order_by()
+    )
+    for row in users:
+        hours[row['bucket']]['new_users'] = row['new_users']
+
+    days = defaultdict(lambda: {**_empty(), 'new_users': 0})
+    for hour, totals in hours.items():
+        day = days[timezone.localtime(hour).date()]
+        for field, value in totals.items():
+            day[field] += value
+
+    HourlySales.objects.all().delete()
+    DailySales.objects.all().delete()
+    DailyCategorySales.objects.all().delete()
+    HourlySales.objects.bulk_create(
+        [HourlySales(hour=hour, **totals) for hour, totals in hours.items()], batch_size=1000,
+    )
+    DailySales.objects.bulk_create(
+        [DailySales(date=day, **totals) for day, totals in days.items()], batch_size=1000,
+    )
+    DailyCategorySales.objects.bulk_create(
+        [DailyCategorySales(date=day, category_id=category_id, **totals)
+         for (day, category_id), totals in categories.items()],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bhushan_web_app', '0012_payment_events'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.8 on 2026-10-19 13:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bhushan_web_app', '0013_backfill_sales_rollups'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='paymentevent',
+            name='unique_payment_event',
+        ),
+        migrations.AddConstraint(
+            model_name='paymentevent',
+            constraint=models.UniqueConstraint(fields=('source', 'transaction_id', 'event_type'), name='unique_payment_event_per_source'),
+        ),
+    ]
@@ -3,9 +3,11 @@ from django.db import models
 from django.contrib.auth.models import AbstractUser
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.utils.text import slugify
-from django.db.models import Avg
+from django.db.models import Avg, F, Value
+from django.db.models.functions import Concat, Substr
 from django.utils import timezone
 from django.contrib.auth.hashers import make_password, check_password
+from django.core.serializers.json import DjangoJSONEncoder
 
 
 class User(AbstractUser):
@@ -135,8 +137,13 @@ class Category(models.Model):
                                related_name='children', null=True, blank=True)
     description = models.TextField(blank=True)
     image = models.ImageField(upload_to='categories/', blank=True, null=True)
+    # Responsive renditions of ``image`` (see images.py)
+    image_renditions = models.JSONField(default=dict, blank=True, editable=False)
     is_active = models.BooleanField(default=True, db_index=True)
     display_order = models.IntegerField(default=0)
+    # Materialized path: "/<root hex>/.../<own hex>/", maintained in save()
+    path = models.CharField(max_length=1024, db_index=True, editable=False, blank=True)
+    depth = models.PositiveSmallIntegerField(default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -157,8 +164,36 @@ class Category(models.Model):
     def save(self, *args, **kwargs):
         if not self.slug:
             self.slug = slugify(self.name)
+
+        old_path, old_depth = self.path, self.depth
+        self._previous_path = old_path
+        if self.parent_id:
+            self.path = f"{self.parent.path}{self.id.hex}/"
+            self.depth = self.parent.depth + 1
+        else:
+            self.path = f"/{self.id.hex}/"
+            self.depth = 0
+        moved = bool(old_path) and old_path != self.path
+        if moved and self.path.startswith(old_path):
+            raise ValueError("A category cannot be moved under one of its own subcategories")
+
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'parent' in update_fields:
+            kwargs['update_fields'] = set(update_fields) | {'path', 'depth'}
         super().save(*args, **kwargs)
 
+        if moved:
+            # Re-root the whole subtree in one UPDATE
+            Category.objects.filter(path__startswith=old_path).exclude(pk=self.pk).update(
+                path=Concat(Value(self.path), Substr('path', len(old_path) + 1)),
+                depth=F('depth') + (self.depth - old_depth),
+            )
+
+    def get_descendants(self, include_self=True):
+        """All categories below this one (any depth), via the path index"""
+        qs = Category.objects.filter(path__startswith=self.path)
+        return qs if include_self else qs.exclude(pk=self.pk)
+
 
 
 
@@ -170,6 +205,7 @@ class Brand(models.Model):
     name = models.CharField(max_length=100, unique=True)
     slug = models.SlugField(max_length=150, unique=True, db_index=True)
     logo = models.ImageField(upload_to='brands/', blank=True, null=True)
+    logo_renditions = models.JSONField(default=dict, blank=True, editable=False)
     is_active = models.BooleanField(default=True, db_index=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
@@ -188,6 +224,40 @@ class Brand(models.Model):
         super().save(*args, **kwargs)
 
 
+class CatalogStats(models.Model):
+    """Materialized product stats; maintained by catalog_stats.py"""
+    product_count = models.PositiveIntegerField(default=0)
+    in_stock_count = models.PositiveIntegerField(default=0)
+    min_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    max_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        abstract = True
+
+
+class BrandStats(CatalogStats):
+    """Active product stats per brand"""
+    brand = models.OneToOneField(Brand, on_delete=models.CASCADE,
+                                 primary_key=True, related_name='stats')
+
+    class Meta:
+        db_table = 'brand_stats'
+        verbose_name = 'Brand stats'
+        verbose_name_plural = 'Brand stats'
+
+
+class CategoryStats(CatalogStats):
+    """Active product stats per category, rolled up over its subcategories"""
+    category = models.OneToOneField(Category, on_delete=models.CASCADE,
+                                    primary_key=True, related_name='stats')
+
+    class Meta:
+        db_table = 'category_stats'
+        verbose_name = 'Category stats'
+        verbose_name_plural = 'Category stats'
+
+
 class Product(models.Model):
     """Main product model"""
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -234,6 +304,16 @@ class Product(models.Model):
     def __str__(self):
         return self.name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember where the product was listed so catalog stats can also be
+        # refreshed for the brand/category it is moved away from
+        instance._loaded_brand_id = instance.__dict__.get('brand_id')
+        instance._loaded_category_id = instance.__dict__.get('category_id')
+        instance._loaded_slug = instance.__dict__.get('slug')
+        return instance
+
     def save(self, *args, **kwargs):
         if not self.slug:
             self.slug = slugify(self.name)
@@ -260,6 +340,11 @@ class ProductImage(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, 
                                 related_name='images')
     image = models.ImageField(upload_to='products/')
+    # Manifest of generated thumbnails / WebP / AVIF files (see images.py)
+    renditions = models.JSONField(default=dict, blank=True, editable=False)
+    # Low-quality placeholder (data: URI) and #rrggbb color, filled in with the renditions
+    placeholder = models.TextField(blank=True, editable=False)
+    dominant_color = models.CharField(max_length=7, blank=True, editable=False)
     alt_text = models.CharField(max_length=255, blank=True)
     is_primary = models.BooleanField(default=False)
     display_order = models.IntegerField(default=0)
@@ -406,6 +491,13 @@ class Order(models.Model):
     def __str__(self):
         return f"Order #{self.order_number}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Status transitions update the sales rollups (sales_rollups.py)
+        instance._loaded_status = instance.__dict__.get('status')
+        return instance
+
     def save(self, *args, **kwargs):
         if not self.order_number:
             self.order_number = f"ORD{uuid.uuid4().hex[:12].upper()}"
@@ -476,6 +568,60 @@ class Payment(models.Model):
         return f"Payment for {self.order.order_number} - {self.status}"
 
 
+class PaymentEvent(models.Model):
+    """
+    Inbox of payment gateway callbacks (payment_events.py); rows are only
+    appended by the webhook and applied in id order by a Celery task
+    """
+    EVENT_CHOICES = [
+        ('payment.captured', 'Payment captured'),
+        ('payment.failed', 'Payment failed'),
+        ('payment.refunded', 'Payment refunded'),
+    ]
+
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('processed', 'Processed'),
+        ('ignored', 'Ignored'),
+        ('failed', 'Failed'),
+    ]
+
+    SOURCE_CHOICES = [
+        ('gateway', 'Gateway webhook'),
+        ('client', 'Client verification'),
+    ]
+
+    event_type = models.CharField(max_length=30, choices=EVENT_CHOICES)
+    transaction_id = models.CharField(max_length=100)
+    # Not a foreign key: the webhook stores events without looking anything up
+    payment_ref = models.UUIDField()
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    source = models.CharField(max_length=20, choices=SOURCE_CHOICES, default='gateway')
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    error = models.TextField(blank=True)
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'payment_events'
+        verbose_name = 'Payment Event'
+        verbose_name_plural = 'Payment Events'
+        ordering = ['id']
+        constraints = [
+            # Gateways redeliver; each transaction's event is kept once per
+            # source, so a client report cannot shadow the gateway's event
+            models.UniqueConstraint(fields=['source', 'transaction_id', 'event_type'],
+                                    name='unique_payment_event_per_source'),
+        ]
+        indexes = [
+            models.Index(fields=['status', 'id']),
+        ]
+
+    def __str__(self):
+        return f"{self.event_type} {self.transaction_id} - {self.status}"
+
+
 class OrderTracking(models.Model):
     """Order tracking history"""
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -496,6 +642,134 @@ class OrderTracking(models.Model):
         return f"{self.order.order_number} - {self.status}"
 
 
+# ==================== Order Archive ====================
+# Delivered/cancelled/refunded orders older than ORDER_ARCHIVE_AFTER_MONTHS
+# are moved here with their items, payments and tracking (order_archive.py),
+# keeping their ids. Same fields and related names as the live tables, so
+# the order serializers read both.
+
+class ArchivedOrder(models.Model):
+    """Order moved out of the live orders table"""
+    id = models.UUIDField(primary_key=True, editable=False)
+    order_number = models.CharField(max_length=20, unique=True)
+    user = models.ForeignKey(User, on_delete=models.PROTECT, related_name='archived_orders')
+    status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES)
+    shipping_address = models.ForeignKey(Address, on_delete=models.PROTECT, related_name='+')
+    billing_address = models.ForeignKey(Address, on_delete=models.PROTECT, related_name='+',
+                                        null=True, blank=True)
+    subtotal = models.DecimalField(max_digits=10, decimal_places=2)
+    tax_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    shipping_charge = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    discount_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    total_amount = models.DecimalField(max_digits=10, decimal_places=2)
+    notes = models.TextField(blank=True)
+    cancellation_reason = models.TextField(blank=True)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    confirmed_at = models.DateTimeField(null=True, blank=True)
+    shipped_at = models.DateTimeField(null=True, blank=True)
+    delivered_at = models.DateTimeField(null=True, blank=True)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'orders_archive'
+        verbose_name = 'Archived order'
+        verbose_name_plural = 'Archived orders'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', '-created_at']),
+            models.Index(fields=['created_at']),
+        ]
+
+    def __str__(self):
+        return f"Order #{self.order_number} (archived)"
+
+
+class ArchivedOrderItem(models.Model):
+    id = models.UUIDField(primary_key=True, editable=False)
+    order = models.ForeignKey(ArchivedOrder, on_delete=models.CASCADE, related_name='items')
+    product = models.ForeignKey(Product, on_delete=models.PROTECT, related_name='+')
+    variation = models.ForeignKey(ProductVariation, on_delete=models.SET_NULL, related_name='+',
+                                  null=True, blank=True)
+    product_name = models.CharField(max_length=255)
+    sku = models.CharField(max_length=50)
+    quantity = models.IntegerField()
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2)
+    total_price = models.DecimalField(max_digits=10, decimal_places=2)
+    created_at = models.DateTimeField()
+
+    class Meta:
+        db_table = 'order_items_archive'
+        verbose_name = 'Archived order item'
+        verbose_name_plural = 'Archived order items'
+
+    def __str__(self):
+        return f"{self.product_name} x {self.quantity}"
+
+
+class ArchivedPayment(models.Model):
+    id = models.UUIDField(primary_key=True, editable=False)
+    order = models.ForeignKey(ArchivedOrder, on_delete=models.CASCADE, related_name='payments')
+    payment_method = models.CharField(max_length=20, choices=Payment.PAYMENT_METHOD_CHOICES)
+    status = models.CharField(max_length=20, choices=Payment.STATUS_CHOICES)
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    transaction_id = models.CharField(max_length=100, blank=True, db_index=True)
+    gateway_response = models.JSONField(blank=True, null=True)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+
+    class Meta:
+        db_table = 'payments_archive'
+        verbose_name = 'Archived payment'
+        verbose_name_plural = 'Archived payments'
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"Payment for {self.order_id} - {self.status}"
+
+
+class ArchivedOrderTracking(models.Model):
+    id = models.UUIDField(primary_key=True, editable=False)
+    order = models.ForeignKey(ArchivedOrder, on_delete=models.CASCADE, related_name='tracking')
+    status = models.CharField(max_length=20)
+    message = models.TextField()
+    location = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField()
+
+    class Meta:
+        db_table = 'order_tracking_archive'
+        verbose_name = 'Archived order tracking'
+        verbose_name_plural = 'Archived order tracking'
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.order_id} - {self.status}"
+
+
+# ==================== Idempotency ====================
+# Durable copy of idempotent responses and the lock for keys in flight
+# (idempotency.py); Redis serves the replays
+
+class IdempotencyKey(models.Model):
+    key = models.CharField(max_length=64, unique=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True,
+                             related_name='+')
+    request_hash = models.CharField(max_length=64)
+    # Empty while the first attempt is running
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    response = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        db_table = 'idempotency_keys'
+        verbose_name = 'Idempotency Key'
+        verbose_name_plural = 'Idempotency Keys'
+
+    def __str__(self):
+        return self.key
+
+
 class Wishlist(models.Model):
     """User wishlist"""
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -534,6 +808,80 @@ class RecentlyViewed(models.Model):
         return f"{self.user.mobile} - {self.product.name}"
 
 
+class ProductRecommendations(models.Model):
+    """Precomputed neighbor lists per product; maintained by recommendations.py"""
+    product = models.OneToOneField(Product, on_delete=models.CASCADE,
+                                   primary_key=True, related_name='recommendations')
+    related_ids = models.JSONField(default=list, blank=True)
+    bought_together_ids = models.JSONField(default=list, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'product_recommendations'
+        verbose_name = 'Product recommendations'
+        verbose_name_plural = 'Product recommendations'
+
+    def __str__(self):
+        return f"Recommendations for {self.product_id}"
+
+
+class SalesRollup(models.Model):
+    """
+    Order totals for one time bucket; maintained by sales_rollups.py.
+    ``orders`` counts orders placed, ``revenue`` / ``units`` delivered ones.
+    """
+    orders = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    units = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        abstract = True
+
+
+class HourlySales(SalesRollup):
+    """Sales per local hour (start of the hour)"""
+    hour = models.DateTimeField(primary_key=True)
+    new_users = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        db_table = 'sales_hourly'
+        verbose_name = 'Hourly sales'
+        verbose_name_plural = 'Hourly sales'
+        ordering = ['-hour']
+
+
+class DailySales(SalesRollup):
+    """Sales per local day"""
+    date = models.DateField(primary_key=True)
+    new_users = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        db_table = 'sales_daily'
+        verbose_name = 'Daily sales'
+        verbose_name_plural = 'Daily sales'
+        ordering = ['-date']
+
+
+class DailyCategorySales(SalesRollup):
+    """Sales per local day of the products directly in one category"""
+    date = models.DateField()
+    category = models.ForeignKey(Category, on_delete=models.CASCADE,
+                                 related_name='daily_sales')
+
+    class Meta:
+        db_table = 'sales_daily_category'
+        verbose_name = 'Daily category sales'
+        verbose_name_plural = 'Daily category sales'
+        ordering = ['-date']
+        constraints = [
+            models.UniqueConstraint(fields=['category', 'date'], name='unique_category_sales_day'),
+        ]
+        indexes = [
+            models.Index(fields=['date']),
+        ]
+
+
 class Review(models.Model):
     """Product reviews and ratings"""
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -0,0 +1,139 @@
+# order_archive.py
+# Archive of finished orders.
+#
+# Orders that are delivered, cancelled or refunded and older than
+# ORDER_ARCHIVE_AFTER_MONTHS are moved, with their items, payments and
+# tracking, from the live tables into the *_archive tables
+# (manage.py archive_orders, tasks.archive_orders). Each batch is copied and
+# deleted in its own short transaction, so the move runs online next to
+# regular traffic, and the live tables - which order lists, dashboards and
+# checkout hit - keep only recent and open orders.
+# Reads that may need old orders go through this module: lookups by id fall
+# back to the archive, purchase checks and the sales/user stats read both.
+
+from datetime import timedelta
+import logging
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.http import Http404
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+FINAL_STATUSES = ['delivered', 'cancelled', 'refunded']
+DEFAULT_ARCHIVE_AFTER_MONTHS = 12
+BATCH_SIZE = 500
+
+
+def archive_cutoff(months=None):
+    """Orders created before this are archived once final"""
+    if months is None:
+        months = getattr(settings, 'ORDER_ARCHIVE_AFTER_MONTHS', DEFAULT_ARCHIVE_AFTER_MONTHS)
+    return timezone.now() - timedelta(days=30 * months)
+
+
+def archivable_orders(cutoff):
+    """Live orders due for the archive"""
+    from .models import Order
+
+    # Reviews point at live order items; those orders stay
+    return (
+        Order.objects.filter(created_at__lt=cutoff, status__in=FINAL_STATUSES)
+        .exclude(items__review__isnull=False)
+    )
+
+
+# ==========================================
+# Moving
+# ==========================================
+
+def _copy(rows, model):
+    """Unsaved ``model`` instances with the field values of ``rows``"""
+    names = [field.attname for field in model._meta.concrete_fields if field.name != 'archived_at']
+    return [model(**{name: getattr(row, name) for name in names}) for row in rows]
+
+
+def archive_batch(cutoff, batch_size=BATCH_SIZE):
+    """Move up to ``batch_size`` orders created before ``cutoff``; returns the count"""
+    from .models import (
+        ArchivedOrder, ArchivedOrderItem, ArchivedOrderTracking, ArchivedPayment,
+        Order, OrderItem, OrderTracking, Payment,
+    )
+
+    with transaction.atomic():
+        ids = list(archivable_orders(cutoff).order_by('created_at').values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return 0
+        # Lock, then re-check: an order may have changed since it was picked
+        orders = list(
+            Order.objects.select_for_update()
+            .filter(id__in=ids, status__in=FINAL_STATUSES, created_at__lt=cutoff)
+        )
+        ids = [order.id for order in orders]
+
+        ArchivedOrder.objects.bulk_create(_copy(orders, ArchivedOrder), batch_size=batch_size)
+        ArchivedOrderItem.objects.bulk_create(
+            _copy(OrderItem.objects.filter(order_id__in=ids), ArchivedOrderItem), batch_size=1000,
+        )
+        ArchivedPayment.objects.bulk_create(
+            _copy(Payment.objects.filter(order_id__in=ids), ArchivedPayment), batch_size=1000,
+        )
+        ArchivedOrderTracking.objects.bulk_create(
+            _copy(OrderTracking.objects.filter(order_id__in=ids), ArchivedOrderTracking), batch_size=1000,
+        )
+
+        # Payments protect their order; items and tracking cascade
+        Payment.objects.filter(order_id__in=ids).delete()
+        Order.objects.filter(id__in=ids).delete()
+    return len(ids)
+
+
+def archive_orders(months=None, batch_size=BATCH_SIZE, limit=None, pause=0):
+    """
+    Archive every due order in batches, sleeping ``pause`` seconds between
+    them to leave room for other writers; returns the number moved
+    """
+    cutoff = archive_cutoff(months)
+    moved = 0
+    while limit is None or moved < limit:
+        size = batch_size if limit is None else min(batch_size, limit - moved)
+        count = archive_batch(cutoff, size)
+        moved += count
+        if count < size:
+            break
+        if pause:
+            time.sleep(pause)
+    if moved:
+        logger.info(f"Archived {moved} orders created before {cutoff:%Y-%m-%d}")
+    return moved
+
+
+# ==========================================
+# Reads
+# ==========================================
+
+def get_order_or_404(user, pk, prepare=None):
+    """
+    The user's order ``pk``, live or archived. ``prepare`` adapts the
+    queryset (e.g. serializers.with_order_details) and works on both.
+    """
+    from .models import ArchivedOrder, Order
+
+    for model in (Order, ArchivedOrder):
+        queryset = model.objects.filter(user=user, pk=pk)
+        order = (prepare(queryset) if prepare else queryset).first()
+        if order is not None:
+            return order
+    raise Http404("No order matches the given query.")
+
+
+def has_purchased(user, product):
+    """Whether ``user`` has a delivered order with ``product``, live or archived"""
+    from .models import ArchivedOrderItem, OrderItem
+
+    return any(
+        model.objects.filter(order__user=user, product=product, order__status='delivered').exists()
+        for model in (OrderItem, ArchivedOrderItem)
+    )
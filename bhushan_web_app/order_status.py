@@ -0,0 +1,136 @@
+# order_status.py
+# Order state machine.
+#
+# Every status change goes through transition(): it checks the move against
+# TRANSITIONS, applies it as a single UPDATE ... WHERE status = <current>
+# (so two concurrent requests cannot both cancel, or confirm and cancel, the
+# same order) and writes the OrderTracking row in the same transaction.
+# Each change is published as ``order_status_changed``; receivers in
+# signals.py queue the sales rollups, drop the user's cached stats and send
+# emails. Since the UPDATE bypasses Order.save(), those receivers - not the
+# post_save handlers - see status changes made here.
+
+import logging
+
+from django.db import transaction
+from django.dispatch import Signal
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# Sent inside the transaction of the change with ``order``, ``previous``
+# (None when the order was just placed) and ``status``; receivers defer side
+# effects with transaction.on_commit()
+order_status_changed = Signal()
+
+TRANSITIONS = {
+    'pending': {'confirmed', 'cancelled'},
+    'confirmed': {'processing', 'cancelled'},
+    'processing': {'shipped', 'cancelled'},
+    'shipped': {'delivered'},
+    'delivered': {'refunded'},
+    'cancelled': {'refunded'},
+    'refunded': set(),
+}
+
+# Set when the order enters the status
+TIMESTAMP_FIELDS = {
+    'confirmed': 'confirmed_at',
+    'shipped': 'shipped_at',
+    'delivered': 'delivered_at',
+}
+
+CANCELLABLE = {status for status, targets in TRANSITIONS.items() if 'cancelled' in targets}
+
+
+class InvalidTransition(Exception):
+    """The order cannot move to the requested status (any more)"""
+
+
+def can_transition(current, status):
+    return status in TRANSITIONS.get(current, ())
+
+
+def _publish(order, previous, status):
+    for receiver, response in order_status_changed.send_robust(
+        sender=type(order), order=order, previous=previous, status=status,
+    ):
+        if isinstance(response, Exception):
+            logger.error(f"order_status_changed receiver {receiver} failed: {response}")
+
+
+def place(order, message='Order placed successfully'):
+    """Record a newly created order: its first tracking row and event"""
+    from .models import OrderTracking
+
+    OrderTracking.objects.create(order=order, status=order.status, message=message)
+    _publish(order, None, order.status)
+
+
+def transition(order, status, message='', location='', **fields):
+    """
+    Move ``order`` to ``status``, updating only the status, its timestamp and
+    ``fields`` (e.g. cancellation_reason). Raises InvalidTransition when the
+    move is not allowed or another request changed the status first; on
+    success ``order`` reflects the new row.
+    """
+    from .models import Order, OrderTracking
+
+    previous = order.status
+    if not can_transition(previous, status):
+        raise InvalidTransition(f"Cannot move order from {previous} to {status}")
+
+    now = timezone.now()
+    values = {'status': status, 'updated_at': now, **fields}
+    if status in TIMESTAMP_FIELDS:
+        values[TIMESTAMP_FIELDS[status]] = now
+
+    with transaction.atomic():
+        updated = Order.objects.filter(pk=order.pk, status=previous).update(**values)
+        if not updated:
+            raise InvalidTransition(f"Order {order.order_number} is no longer {previous}")
+
+        for name, value in values.items():
+            setattr(order, name, value)
+        order._loaded_status = status
+
+        OrderTracking.objects.create(
+            order=order, status=status, message=message, location=location,
+        )
+        _publish(order, previous, status)
+    return order
+
+
+def bulk_transition(queryset, status, message=''):
+    """
+    transition() for every order in ``queryset`` that may move to
+    ``status``, with one UPDATE and one tracking INSERT; orders that may not
+    are skipped. Returns the moved orders.
+    """
+    from .models import Order, OrderTracking
+
+    with transaction.atomic():
+        # Locked, so the statuses checked here are the ones replaced
+        orders = [
+            order for order in queryset.select_for_update().order_by('pk')
+            if can_transition(order.status, status)
+        ]
+        if not orders:
+            return []
+
+        now = timezone.now()
+        values = {'status': status, 'updated_at': now}
+        if status in TIMESTAMP_FIELDS:
+            values[TIMESTAMP_FIELDS[status]] = now
+        Order.objects.filter(pk__in=[order.pk for order in orders]).update(**values)
+        OrderTracking.objects.bulk_create([
+            OrderTracking(order=order, status=status, message=message) for order in orders
+        ])
+
+        for order in orders:
+            previous = order.status
+            for name, value in values.items():
+                setattr(order, name, value)
+            order._loaded_status = status
+            _publish(order, previous, status)
+    return orders
@@ -0,0 +1,172 @@
+# page_cache.py
+# Full-page cache for storefront pages, with per-user "holes".
+#
+# Pages are rendered once with a marker in place of every user-specific
+# fragment ({% hole %} from templatetags/page_cache.py) and the result is
+# cached under a key built from the URL and the catalog generations the page
+# depends on (catalog_version.py) - so the existing signals invalidate it
+# without deleting anything. The URL is absolute (head_template.html renders
+# scheme and host into the canonical and og: tags) and keeps only the query
+# parameters the view reads, so tracking parameters share one entry. Every response, cached or fresh, then has its
+# holes filled in for the current request: the auth links in the header,
+# CSRF tokens, the PDP wishlist icon. Anonymous and signed-in visitors share
+# the same cached HTML.
+
+from urllib.parse import urlencode
+
+import hashlib
+import json
+import logging
+import re
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+from django.template.loader import render_to_string
+from django.utils.html import format_html
+
+from .catalog_version import get_generations
+
+logger = logging.getLogger(__name__)
+
+PAGE_CACHE_KEY_PREFIX = 'page:'
+HOLE_RE = re.compile(r'<!--#hole (\w+) (.*?)#-->')
+
+# name -> callable(request, *args) returning the fragment's HTML
+HOLES = {}
+
+
+def register_hole(name):
+    def decorator(func):
+        HOLES[name] = func
+        return func
+    return decorator
+
+
+def hole_marker(name, args):
+    # Arguments are JSON; '#-->' cannot occur in it once '>' is escaped
+    payload = json.dumps([str(arg) for arg in args]).replace('>', '\\u003e')
+    return f'<!--#hole {name} {payload}#-->'
+
+
+def render_hole(name, request, args=()):
+    try:
+        return str(HOLES[name](request, *args))
+    except Exception as e:
+        logger.warning(f"Page hole {name} failed: {e}")
+        return ''
+
+
+def fill_holes(html, request):
+    """Replace every hole marker with its fragment for ``request``"""
+    return HOLE_RE.sub(lambda m: render_hole(m.group(1), request, json.loads(m.group(2))), html)
+
+
+# ==========================================
+# Holes
+# ==========================================
+
+@register_hole('auth_nav')
+def auth_nav_hole(request):
+    return render_to_string('fragments/auth_nav.html', {'user': request.user})
+
+
+@register_hole('csrf_token')
+def csrf_input_hole(request):
+    return format_html('<input type="hidden" name="csrfmiddlewaretoken" value="{}">', get_token(request))
+
+
+@register_hole('csrf_value')
+def csrf_value_hole(request):
+    return get_token(request)
+
+
+@register_hole('wishlist_icon')
+def wishlist_icon_hole(request, product_id):
+    """Font Awesome style of the PDP wishlist heart"""
+    from .models import Wishlist
+
+    if request.user.is_authenticated and Wishlist.objects.filter(
+        user=request.user, product_id=product_id
+    ).exists():
+        return 'fas'
+    return 'far'
+
+
+# ==========================================
+# View Mixin
+# ==========================================
+
+class CachedPageMixin:
+    """
+    Serve GET requests from the page cache. Views list the generation
+    scopes their HTML depends on in ``page_cache_scopes``; per-request side
+    effects belong in ``page_cache_hit`` (cache hits) and the view itself.
+    """
+    page_cache_timeout = getattr(settings, 'CACHE_MIDDLEWARE_SECONDS', 600)
+    # Query parameters the view reads; any others are dropped from the key
+    page_cache_params = ()
+
+    def page_cache_scopes(self):
+        return ['products', 'categories']
+
+    def page_cache_validators(self):
+        """Extra key parts, e.g. the date for time-dependent sections"""
+        return []
+
+    def page_cache_meta(self):
+        """Data stored with the page and handed back to ``page_cache_hit``"""
+        return {}
+
+    def page_cache_hit(self, meta):
+        pass
+
+    def page_cache_url(self):
+        """Absolute URL of the page, reduced to the query parameters it reads"""
+        query = sorted(
+            (name, value)
+            for name in self.page_cache_params
+            for value in self.request.GET.getlist(name)
+        )
+        path = self.request.path + (f'?{urlencode(query)}' if query else '')
+        return self.request.build_absolute_uri(path)
+
+    def page_cache_key(self):
+        generations = get_generations(*self.page_cache_scopes())
+        raw = '|'.join([
+            self.page_cache_url(),
+            *(f'{scope}={stamp}' for scope, stamp in sorted(generations.items())),
+            *(str(value) for value in self.page_cache_validators()),
+        ])
+        name = self.request.resolver_match.view_name if self.request.resolver_match else type(self).__name__
+        return f'{PAGE_CACHE_KEY_PREFIX}{name}:{hashlib.md5(raw.encode()).hexdigest()}'
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['page_cache_holes'] = True
+        # The cached HTML is shared by every URL with this key
+        context['page_url'] = self.page_cache_url()
+        return context
+
+    def get(self, request, *args, **kwargs):
+        if not getattr(settings, 'PAGE_CACHE_ENABLED', True):
+            return super().get(request, *args, **kwargs)
+
+        key = self.page_cache_key()
+        entry = cache.get(key)
+        if entry is not None:
+            self.page_cache_hit(entry['meta'])
+            return HttpResponse(fill_holes(entry['html'], request))
+
+        response = super().get(request, *args, **kwargs)
+        if response.status_code != 200 or not hasattr(response, 'add_post_render_callback'):
+            return response
+
+        def store_and_fill(response):
+            html = response.content.decode(response.charset)
+            cache.set(key, {'html': html, 'meta': self.page_cache_meta()}, self.page_cache_timeout)
+            response.content = fill_holes(html, request)
+
+        response.add_post_render_callback(store_and_fill)
+        return response
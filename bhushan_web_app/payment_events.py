@@ -0,0 +1,201 @@
+# payment_events.py
+# Payment event inbox.
+#
+# The gateway webhook (views.PaymentCallbackView) checks the HMAC signature
+# of the body, appends the event to the payment_events table and answers
+# straight away: one INSERT, no lookups, no order updates. A Celery task
+# (tasks.process_payment_events) then applies pending events in arrival
+# order - one consumer at a time, each event in its own transaction with
+# the payment row locked - and updates Payment and, through
+# order_status.transition(), the Order. Redelivered webhooks hit the
+# (source, transaction_id, event_type) unique constraint and are dropped at
+# insert. Client reports (VerifyPaymentView) are not trusted: they only move
+# a pending payment to processing until the gateway's event arrives.
+#
+# Webhook body:
+#   {"event": "payment.captured", "payment_id": "<Payment uuid>",
+#    "transaction_id": "<gateway id>", "amount": "236.00"}
+# signed as hex HMAC-SHA256 of the raw body with PAYMENT_WEBHOOK_SECRET in
+# the X-Payment-Signature header.
+
+from decimal import Decimal, InvalidOperation
+import hashlib
+import hmac
+import logging
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from . import order_status
+
+logger = logging.getLogger(__name__)
+
+SIGNATURE_HEADER = 'HTTP_X_PAYMENT_SIGNATURE'
+EVENT_TYPES = {'payment.captured', 'payment.failed', 'payment.refunded'}
+QUEUE_LOCK_KEY = 'payments:queued'
+CONSUMER_LOCK_KEY = 'payments:consumer'
+QUEUE_DELAY = 1            # seconds; a burst of webhooks shares one task run
+CONSUMER_LOCK_TIMEOUT = 5 * 60
+BATCH_SIZE = 100
+
+
+class InvalidEvent(ValueError):
+    """The callback body is not a usable payment event"""
+
+
+def sign(body, secret=None):
+    """Hex HMAC-SHA256 of ``body`` (bytes)"""
+    secret = settings.PAYMENT_WEBHOOK_SECRET if secret is None else secret
+    return hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+
+
+def verify_signature(body, signature):
+    if not settings.PAYMENT_WEBHOOK_SECRET:
+        logger.warning("PAYMENT_WEBHOOK_SECRET is not set; rejecting payment webhook")
+        return False
+    return bool(signature) and hmac.compare_digest(sign(body), signature)
+
+
+def parse(data):
+    """PaymentEvent field values from a webhook body; raises InvalidEvent"""
+    if not isinstance(data, dict):
+        raise InvalidEvent("Expected a JSON object")
+    event_type = data.get('event')
+    if event_type not in EVENT_TYPES:
+        raise InvalidEvent(f"Unknown event: {event_type}")
+    transaction_id = str(data.get('transaction_id') or '')
+    if not transaction_id or len(transaction_id) > 100:
+        raise InvalidEvent("Missing or invalid transaction_id")
+    try:
+        payment_ref = uuid.UUID(str(data.get('payment_id')))
+        amount = Decimal(str(data.get('amount')))
+    except (ValueError, InvalidOperation):
+        raise InvalidEvent("Missing or invalid payment_id or amount")
+    return {
+        'event_type': event_type, 'transaction_id': transaction_id,
+        'payment_ref': payment_ref, 'amount': amount,
+    }
+
+
+# ==========================================
+# Inbox
+# ==========================================
+
+def record(data, source='gateway'):
+    """
+    Append the event in ``data`` to the inbox and queue the consumer;
+    duplicates of an event already received are ignored
+    """
+    from .models import PaymentEvent
+
+    event = PaymentEvent(payload=data, source=source, **parse(data))
+    PaymentEvent.objects.bulk_create([event], ignore_conflicts=True)
+    transaction.on_commit(schedule_processing)
+
+
+def schedule_processing():
+    # The first event of a burst queues the task; it drains the whole inbox
+    if not cache.add(QUEUE_LOCK_KEY, 1, QUEUE_DELAY):
+        return
+    from .tasks import process_payment_events
+
+    process_payment_events.apply_async(countdown=QUEUE_DELAY)
+
+
+# ==========================================
+# Consumer
+# ==========================================
+
+def _apply(event):
+    """Apply one event; returns its new status"""
+    from .models import Payment
+
+    payment = Payment.objects.select_for_update().select_related('order').filter(pk=event.payment_ref).first()
+    if payment is None:
+        raise InvalidEvent(f"Unknown payment {event.payment_ref}")
+    if event.amount != payment.amount:
+        raise InvalidEvent(f"Amount {event.amount} does not match payment amount {payment.amount}")
+
+    if event.source == 'client':
+        # Unverified: only flags the payment as awaiting the gateway's event
+        if event.event_type != 'payment.captured':
+            raise InvalidEvent(f"Clients cannot report {event.event_type}")
+        if payment.status != 'pending':
+            return 'ignored'
+        payment.status = 'processing'
+        payment.save(update_fields=['status', 'updated_at'])
+        return 'processed'
+
+    if event.event_type == 'payment.captured':
+        # Refunds are final
+        if payment.status in ('completed', 'refunded'):
+            return 'ignored'
+        payment.status = 'completed'
+        order_target, message = 'confirmed', 'Payment successful - Order confirmed'
+    elif event.event_type == 'payment.failed':
+        if payment.status in ('completed', 'refunded'):
+            return 'ignored'
+        payment.status = 'failed'
+        order_target, message = None, ''
+    else:
+        if payment.status == 'refunded':
+            return 'ignored'
+        payment.status = 'refunded'
+        order_target, message = 'refunded', 'Payment refunded'
+
+    payment.transaction_id = event.transaction_id
+    payment.gateway_response = event.payload
+    payment.save(update_fields=['status', 'transaction_id', 'gateway_response', 'updated_at'])
+
+    order = payment.order
+    if order_target and order_status.can_transition(order.status, order_target):
+        order_status.transition(order, order_target, message=message)
+    elif order_target and order.status != order_target:
+        logger.warning(
+            f"Payment {payment.pk} {event.event_type} but order {order.order_number} is {order.status}"
+        )
+    return 'processed'
+
+
+def process_event(event):
+    """Apply ``event`` in its own transaction and record the outcome"""
+    from .models import PaymentEvent
+
+    try:
+        with transaction.atomic():
+            outcome, error = _apply(event), ''
+    except (InvalidEvent, order_status.InvalidTransition) as e:
+        outcome, error = 'failed', str(e)
+        logger.error(f"Payment event {event.pk} failed: {e}")
+    except Exception as e:
+        # Not retried: a stuck event would block every event behind it
+        outcome, error = 'failed', f"{type(e).__name__}: {e}"
+        logger.exception(f"Payment event {event.pk} failed unexpectedly")
+    PaymentEvent.objects.filter(pk=event.pk).update(
+        status=outcome, error=error, processed_at=timezone.now(),
+    )
+    return outcome
+
+
+def process_pending(batch_size=BATCH_SIZE):
+    """Apply pending events in arrival order; returns the number handled"""
+    from .models import PaymentEvent
+
+    # One consumer at a time keeps each payment's events in order
+    if not cache.add(CONSUMER_LOCK_KEY, 1, CONSUMER_LOCK_TIMEOUT):
+        return 0
+    handled = 0
+    try:
+        while True:
+            events = list(PaymentEvent.objects.filter(status='pending').order_by('id')[:batch_size])
+            for event in events:
+                process_event(event)
+            handled += len(events)
+            if len(events) < batch_size:
+                break
+    finally:
+        cache.delete(CONSUMER_LOCK_KEY)
+    return handled
@@ -0,0 +1,199 @@
+# recommendations.py
+# Precomputed "related products" and "frequently bought together" lists.
+#
+# A periodic Celery task (tasks.build_recommendations) scores product pairs
+#   * bought in the same order (OrderItem, recent non-cancelled orders),
+#   * viewed by the same user (RecentlyViewed, each user's latest views),
+# and tops the list up with best sellers from the same category, same brand
+# first. The result is stored as a short list of ids per product
+# (ProductRecommendations), so the PDP and /api/products/<id>/related/ need
+# one lookup plus one query for the products themselves.
+
+from collections import Counter, defaultdict
+from datetime import timedelta
+from itertools import combinations
+import logging
+
+from django.db.models import Avg, Count, Prefetch, Q
+from django.utils import timezone
+
+from .invalidation import coalesce_invalidations, mark_changed
+
+logger = logging.getLogger(__name__)
+
+MAX_NEIGHBORS = 12           # ids stored per list
+ORDER_WINDOW_DAYS = 365
+VIEW_WINDOW_DAYS = 90
+VIEW_SESSION_SIZE = 20       # latest views per user that count as co-viewed
+MAX_BASKET_SIZE = 50         # larger orders (bulk buys) say little about pairs
+CO_PURCHASE_WEIGHT = 3
+CO_VIEW_WEIGHT = 1
+EXCLUDED_ORDER_STATUSES = ['cancelled', 'refunded']
+
+
+# ==========================================
+# Scoring
+# ==========================================
+
+def _add_pairs(scores, groups, weight):
+    for product_ids in groups:
+        for a, b in combinations(sorted(set(product_ids)), 2):
+            scores[a][b] += weight
+            scores[b][a] += weight
+
+
+def _baskets(since):
+    """Product ids per order, one query"""
+    from .models import OrderItem
+
+    rows = (
+        OrderItem.objects.filter(order__created_at__gte=since)
+        .exclude(order__status__in=EXCLUDED_ORDER_STATUSES)
+        .values_list('order_id', 'product_id')
+    )
+    baskets = defaultdict(list)
+    for order_id, product_id in rows.iterator(chunk_size=5000):
+        baskets[order_id].append(product_id)
+    return [ids for ids in baskets.values() if len(ids) <= MAX_BASKET_SIZE]
+
+
+def _view_sessions(since):
+    """Each user's latest viewed product ids, one query"""
+    from .models import RecentlyViewed
+
+    rows = (
+        RecentlyViewed.objects.filter(viewed_at__gte=since)
+        .order_by('user_id', '-viewed_at')
+        .values_list('user_id', 'product_id')
+    )
+    sessions = defaultdict(list)
+    for user_id, product_id in rows.iterator(chunk_size=5000):
+        if len(sessions[user_id]) < VIEW_SESSION_SIZE:
+            sessions[user_id].append(product_id)
+    return sessions.values()
+
+
+def _top(counter, active, exclude, limit=MAX_NEIGHBORS):
+    ranked = sorted(
+        (pid for pid in counter if pid in active and pid != exclude),
+        key=lambda pid: (-counter[pid], -active[pid]['sales_count']),
+    )
+    return ranked[:limit]
+
+
+def _fill(ids, candidates, exclude):
+    for pid in candidates:
+        if len(ids) >= MAX_NEIGHBORS:
+            break
+        if pid != exclude and pid not in ids:
+            ids.append(pid)
+    return ids
+
+
+def compute_recommendations():
+    """{product_id: (related_ids, bought_together_ids)} for every active product"""
+    from .models import Product
+
+    now = timezone.now()
+    active = {
+        row['id']: row for row in Product.objects.filter(is_active=True)
+        .order_by('-sales_count', '-created_at')
+        .values('id', 'category_id', 'brand_id', 'sales_count')
+    }
+
+    bought = defaultdict(Counter)
+    _add_pairs(bought, _baskets(now - timedelta(days=ORDER_WINDOW_DAYS)), CO_PURCHASE_WEIGHT)
+    viewed = defaultdict(Counter)
+    _add_pairs(viewed, _view_sessions(now - timedelta(days=VIEW_WINDOW_DAYS)), CO_VIEW_WEIGHT)
+
+    # Best sellers first (``active`` is ordered by sales)
+    by_category = defaultdict(list)
+    by_category_brand = defaultdict(list)
+    for pid, row in active.items():
+        by_category[row['category_id']].append(pid)
+        if row['brand_id']:
+            by_category_brand[(row['category_id'], row['brand_id'])].append(pid)
+
+    result = {}
+    for pid, row in active.items():
+        together = _top(bought[pid], active, pid)
+        related = _top(bought[pid] + viewed[pid], active, pid)
+        if len(related) < MAX_NEIGHBORS:
+            _fill(related, by_category_brand.get((row['category_id'], row['brand_id']), []), pid)
+            _fill(related, by_category[row['category_id']], pid)
+        result[pid] = (related, together)
+    return result
+
+
+# ==========================================
+# Storage
+# ==========================================
+
+def build_recommendations():
+    """Recompute and store every product's lists; returns the row count"""
+    from .models import ProductRecommendations
+
+    lists = compute_recommendations()
+    objs = [
+        ProductRecommendations(
+            product_id=pid,
+            related_ids=[str(i) for i in related],
+            bought_together_ids=[str(i) for i in together],
+        )
+        for pid, (related, together) in lists.items()
+    ]
+    with coalesce_invalidations():
+        ProductRecommendations.objects.bulk_create(
+            objs, batch_size=1000, update_conflicts=True, unique_fields=['product'],
+            update_fields=['related_ids', 'bought_together_ids', 'updated_at'],
+        )
+        ProductRecommendations.objects.filter(product__is_active=False).delete()
+        mark_changed('recommendations')
+    return len(objs)
+
+
+# ==========================================
+# Read
+# ==========================================
+
+def _with_images(queryset):
+    """Primary images and approved review stats for cards / ProductSerializer"""
+    from .models import ProductImage
+
+    approved = Q(reviews__is_approved=True)
+    return queryset.select_related('category', 'brand').prefetch_related(
+        Prefetch('images', queryset=ProductImage.objects.filter(is_primary=True),
+                 to_attr='primary_images')
+    ).annotate(
+        approved_rating=Avg('reviews__rating', filter=approved),
+        approved_review_count=Count('reviews', filter=approved),
+    )
+
+
+def get_recommendations(product, limit=4):
+    """
+    (related, bought_together) product lists for ``product``. Products the
+    batch job has not seen yet fall back to best sellers of their category.
+    """
+    from .models import Product, ProductRecommendations
+
+    row = (
+        ProductRecommendations.objects.filter(product_id=product.pk)
+        .values_list('related_ids', 'bought_together_ids')
+        .first()
+    )
+    if row is None:
+        related = _with_images(
+            Product.objects.filter(category_id=product.category_id, is_active=True)
+            .exclude(pk=product.pk)
+            .order_by('-sales_count', '-created_at')
+        )[:limit]
+        return list(related), []
+
+    # Lists are stored longer than shown so deactivated products can be skipped
+    related_ids, together_ids = ([Product._meta.pk.to_python(i) for i in ids] for ids in row)
+    wanted = list(dict.fromkeys(related_ids + together_ids))
+    products = _with_images(Product.objects.filter(is_active=True)).in_bulk(wanted) if wanted else {}
+    related = [products[pid] for pid in related_ids if pid in products][:limit]
+    together = [products[pid] for pid in together_ids if pid in products][:limit]
+    return related, together
@@ -0,0 +1,283 @@
+# reconciliation.py
+# Payment reconciliation against the gateway's settlement report.
+#
+# reconcile() walks the payments table in primary-key order, one keyset
+# chunk (pk > last seen) at a time, and compares each payment with its row
+# in the gateway report, with its own gateway_response and with its order.
+# Every discrepancy is written to a CSV report as it is found. Safe fixes
+# are applied per chunk in bulk:
+#   - pending/processing payments the gateway captured or failed,
+#   - completed payments the gateway refunded,
+#   - pending orders with a completed payment (confirmed),
+#   - cancelled orders with a refunded payment (refunded).
+# Anything else (amount or transaction id mismatches, captured payments
+# missing from the report) is only reported. Report rows for payments of
+# archived orders (order_archive.py) are checked against the archive and
+# only reported; they are never "unknown".
+#
+# Memory is bounded by the chunk size and the report, however large the
+# payments table grows. Report formats are looked up in READERS: CSV or
+# JSON lines with payment_id, transaction_id, status and amount.
+
+from collections import Counter, defaultdict
+from decimal import Decimal, InvalidOperation
+import csv
+import json
+import logging
+import os
+import uuid
+
+from django.db import transaction
+from django.utils import timezone
+
+from . import order_status
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1000
+
+# Gateway report statuses -> Payment.status
+GATEWAY_STATUSES = {
+    'captured': 'completed',
+    'success': 'completed',
+    'completed': 'completed',
+    'paid': 'completed',
+    'failed': 'failed',
+    'refunded': 'refunded',
+    'created': 'pending',
+    'authorized': 'pending',
+    'pending': 'pending',
+}
+
+# payment_events.py webhook events stored in gateway_response
+EVENT_STATUSES = {
+    'payment.captured': 'completed',
+    'payment.failed': 'failed',
+    'payment.refunded': 'refunded',
+}
+
+# (payment status, gateway status) pairs reconciled automatically
+SAFE_PAYMENT_FIXES = {
+    ('pending', 'completed'), ('processing', 'completed'),
+    ('pending', 'failed'), ('processing', 'failed'),
+    ('completed', 'refunded'),
+}
+
+REPORT_COLUMNS = ['kind', 'payment_id', 'order_id', 'detail', 'fixed']
+
+
+# ==========================================
+# Gateway reports
+# ==========================================
+
+def read_csv(path):
+    with open(path, newline='') as f:
+        yield from csv.DictReader(f)
+
+
+def read_jsonl(path):
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+READERS = {
+    'csv': read_csv,
+    'jsonl': read_jsonl,
+}
+
+
+def load_report(path, fmt=None):
+    """
+    {payment_id: {'transaction_id', 'status', 'amount'}} from a gateway
+    report; ``fmt`` defaults to the file extension. Unusable rows are
+    logged and skipped.
+    """
+    fmt = fmt or os.path.splitext(path)[1].lstrip('.').lower()
+    if fmt not in READERS:
+        raise ValueError(f"Unknown report format: {fmt}")
+
+    entries = {}
+    for line, row in enumerate(READERS[fmt](path), start=1):
+        status = GATEWAY_STATUSES.get(str(row.get('status', '')).strip().lower())
+        try:
+            payment_id = str(uuid.UUID(str(row.get('payment_id')).strip()))
+            amount = Decimal(str(row['amount'])) if row.get('amount') not in (None, '') else None
+        except (ValueError, InvalidOperation):
+            status = None
+        if status is None:
+            logger.warning(f"Skipping gateway report row {line}: {row}")
+            continue
+        entries[payment_id] = {
+            'transaction_id': str(row.get('transaction_id') or '').strip(),
+            'status': status,
+            'amount': amount,
+        }
+    return entries
+
+
+# ==========================================
+# Comparison
+# ==========================================
+
+PAYMENT_FIELDS = ['id', 'order_id', 'order__status', 'status', 'amount', 'payment_method',
+                  'transaction_id', 'gateway_response']
+
+
+class Reconciliation:
+    """State of one run: report entries, counters and pending fixes"""
+
+    def __init__(self, report, writer, apply_fixes=True, check_missing=False):
+        self.report = report
+        self.writer = writer
+        self.apply_fixes = apply_fixes
+        self.check_missing = check_missing
+        self.counts = Counter()
+        self.payments = 0
+        self._payment_fixes = defaultdict(list)   # (from, to) -> payment ids
+        self._order_fixes = defaultdict(list)     # order status -> order ids
+
+    def discrepancy(self, kind, payment, detail='', fixed=False):
+        self.counts[kind] += 1
+        self.writer.writerow([kind, payment['id'], payment['order_id'], detail,
+                              'yes' if fixed and self.apply_fixes else 'no'])
+
+    def compare(self, payment):
+        self.payments += 1
+        entry = self.report.pop(str(payment['id']), None)
+        status = payment['status']
+
+        if entry is not None:
+            if entry['amount'] is not None and entry['amount'] != payment['amount']:
+                # Money disagrees; leave it to a person
+                self.discrepancy('amount_mismatch', payment,
+                                 f"gateway {entry['amount']}, payment {payment['amount']}")
+                return
+            if entry['transaction_id'] and payment['transaction_id'] \
+                    and entry['transaction_id'] != payment['transaction_id']:
+                self.discrepancy('transaction_id_mismatch', payment,
+                                 f"gateway {entry['transaction_id']}, payment {payment['transaction_id']}")
+                return
+            if entry['status'] != status:
+                safe = (status, entry['status']) in SAFE_PAYMENT_FIXES
+                self.discrepancy('status_mismatch', payment,
+                                 f"gateway {entry['status']}, payment {status}", fixed=safe)
+                if safe:
+                    self._payment_fixes[(status, entry['status'])].append(payment['id'])
+                    status = entry['status']
+        else:
+            if self.check_missing and status == 'completed' and payment['payment_method'] != 'cod':
+                self.discrepancy('missing_from_report', payment)
+            response = payment['gateway_response']
+            event = response.get('event') if isinstance(response, dict) else None
+            if event in EVENT_STATUSES and EVENT_STATUSES[event] != status:
+                self.discrepancy('gateway_response_mismatch', payment,
+                                 f"last event {event}, payment {status}")
+
+        order_state = payment['order__status']
+        if status == 'completed' and order_state == 'pending':
+            self.discrepancy('order_not_confirmed', payment, 'payment completed, order pending', fixed=True)
+            self._order_fixes['confirmed'].append(payment['order_id'])
+        elif status == 'refunded' and order_state == 'cancelled':
+            self.discrepancy('order_not_refunded', payment, 'payment refunded, order cancelled', fixed=True)
+            self._order_fixes['refunded'].append(payment['order_id'])
+
+    def flush(self):
+        """Apply the fixes collected since the last flush"""
+        from .models import Order, Payment
+
+        payment_fixes, self._payment_fixes = self._payment_fixes, defaultdict(list)
+        order_fixes, self._order_fixes = self._order_fixes, defaultdict(list)
+        if not self.apply_fixes:
+            return
+
+        now = timezone.now()
+        with transaction.atomic():
+            # Conditional on the status read, so concurrent updates win
+            for (current, target), ids in payment_fixes.items():
+                self.counts['payments_fixed'] += Payment.objects.filter(
+                    pk__in=ids, status=current,
+                ).update(status=target, updated_at=now)
+            for target, ids in order_fixes.items():
+                moved = order_status.bulk_transition(
+                    Order.objects.filter(pk__in=ids), target,
+                    message=f'Payment reconciled - Order {target}',
+                )
+                self.counts['orders_fixed'] += len(moved)
+
+    def compare_archived(self, payment):
+        """Report-only check of a payment whose order was archived"""
+        self.counts['archived'] += 1
+        entry = self.report.pop(str(payment['id']))
+        problems = []
+        if entry['amount'] is not None and entry['amount'] != payment['amount']:
+            problems.append(f"gateway {entry['amount']}, payment {payment['amount']}")
+        if entry['status'] != payment['status']:
+            problems.append(f"gateway {entry['status']}, payment {payment['status']}")
+        if problems:
+            self.discrepancy('archived_payment_mismatch', payment, f"archived; {'; '.join(problems)}")
+
+    def report_unknown(self):
+        """Report rows for payments that do not exist"""
+        for payment_id in self.report:
+            self.counts['unknown_payment'] += 1
+            self.writer.writerow(['unknown_payment', payment_id, '', 'in gateway report only', 'no'])
+
+
+def _chunks(queryset, chunk_size):
+    """Rows of ``queryset`` in pk order, fetched one keyset chunk at a time"""
+    last = None
+    while True:
+        page = queryset if last is None else queryset.filter(pk__gt=last)
+        rows = list(page.order_by('pk')[:chunk_size])
+        if not rows:
+            return
+        yield rows
+        last = rows[-1]['id']
+
+
+def reconcile(report_path, output, fmt=None, since=None, until=None,
+              apply_fixes=True, chunk_size=CHUNK_SIZE):
+    """
+    Reconcile payments created in [since, until) (all when unset) with the
+    gateway report at ``report_path``, writing discrepancies as CSV to the
+    file-like ``output``. Captured payments absent from the report are only
+    flagged when ``since`` is given, i.e. when the report covers the window.
+    Returns the counters of the run.
+    """
+    from .models import ArchivedPayment, Payment
+
+    writer = csv.writer(output)
+    writer.writerow(REPORT_COLUMNS)
+    run = Reconciliation(load_report(report_path, fmt), writer,
+                         apply_fixes=apply_fixes, check_missing=since is not None)
+
+    payments = Payment.objects.values(*PAYMENT_FIELDS)
+    window = payments
+    if since:
+        window = window.filter(created_at__gte=since)
+    if until:
+        window = window.filter(created_at__lt=until)
+
+    for rows in _chunks(window, chunk_size):
+        for payment in rows:
+            run.compare(payment)
+        run.flush()
+
+    # Report rows for payments outside the window
+    leftover = list(run.report)
+    for start in range(0, len(leftover), chunk_size):
+        for payment in payments.filter(pk__in=leftover[start:start + chunk_size]):
+            run.compare(payment)
+        run.flush()
+    leftover = list(run.report)
+    archived = ArchivedPayment.objects.values('id', 'order_id', 'status', 'amount')
+    for start in range(0, len(leftover), chunk_size):
+        for payment in archived.filter(pk__in=leftover[start:start + chunk_size]):
+            run.compare_archived(payment)
+    run.report_unknown()
+
+    summary = {'payments': run.payments, **run.counts}
+    logger.info(f"Payment reconciliation: {summary}")
+    return summary
@@ -0,0 +1,297 @@
+# sales_rollups.py
+# Hourly and daily sales rollups (HourlySales / DailySales / DailyCategorySales).
+#
+# Orders are bucketed by the local hour/day they were placed in. Order
+# creation, status transitions, new order items and sign-ups queue the day
+# they fall on; a Celery task (tasks.refresh_sales_rollups) rebuilds each
+# queued day once per REFRESH_DELAY from GROUP BY queries over the
+# created_at indexes of the live and archived orders.
+# backfill() rebuilds ranges of days: recent days periodically
+# (tasks.backfill_sales_rollups) to catch queryset.update() or raw SQL.
+# Migration 0013 filled all history with a frozen copy of these queries.
+# The admin dashboard and the sales report API sum rollup rows instead of
+# scanning orders, so multi-year ranges read a few thousand rows at most.
+
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+import logging
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncHour, TruncMonth, TruncYear
+from django.utils import timezone
+
+from .invalidation import mark_for_refresh, register_refresher
+
+logger = logging.getLogger(__name__)
+
+REVENUE_STATUSES = ['delivered']   # revenue and units count delivered orders
+REFRESH_LOCK_PREFIX = 'sales:queued:'
+REFRESH_DELAY = 10                 # seconds; bursts of orders share one rebuild
+BACKFILL_CHUNK_DAYS = 31
+MAX_HOURLY_DAYS = 31               # longest range served hour by hour
+INTERVALS = ('hour', 'day', 'month', 'year')
+
+TOTAL_FIELDS = ['orders', 'revenue', 'units']
+
+
+def _empty(**extra):
+    return {'orders': 0, 'revenue': Decimal('0'), 'units': 0, **extra}
+
+
+def local_date(value):
+    return timezone.localtime(value).date()
+
+
+def local_midnight(day):
+    """Aware start of the local ``day``"""
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+# ==========================================
+# Rebuild
+# ==========================================
+
+def _collect(since, until):
+    """({hour: totals}, {(date, category_id): totals}) for orders placed in [since, until)"""
+    from .models import ArchivedOrder, ArchivedOrderItem, Order, OrderItem, User
+
+    revenue = Q(status__in=REVENUE_STATUSES)
+    item_revenue = Q(order__status__in=REVENUE_STATUSES)
+    hours = defaultdict(lambda: _empty(new_users=0))
+    categories = defaultdict(_empty)
+
+    # Old orders live in the archive (order_archive.py); an order is in
+    # exactly one of the two tables
+    for order_model, item_model in ((Order, OrderItem), (ArchivedOrder, ArchivedOrderItem)):
+        orders = (
+            order_model.objects.filter(created_at__gte=since, created_at__lt=until)
+            .annotate(bucket=TruncHour('created_at'))
+            .values('bucket')
+            .annotate(orders=Count('id'), revenue=Sum('total_amount', filter=revenue))
+            .order_by()
+        )
+        for row in orders:
+            bucket = hours[row['bucket']]
+            bucket['orders'] += row['orders']
+            bucket['revenue'] += row['revenue'] or Decimal('0')
+
+        items = (
+            item_model.objects.filter(order__created_at__gte=since, order__created_at__lt=until)
+            .annotate(bucket=TruncHour('order__created_at'))
+            .values('bucket', 'product__category_id')
+            .annotate(
+                orders=Count('order_id', distinct=True),
+                units=Sum('quantity', filter=item_revenue),
+                revenue=Sum('total_price', filter=item_revenue),
+            )
+            .order_by()
+        )
+        for row in items:
+            units = row['units'] or 0
+            hours[row['bucket']]['units'] += units
+            # An order lies in exactly one hour, so per-hour distinct counts add up
+            category = categories[(local_date(row['bucket']), row['product__category_id'])]
+            category['orders'] += row['orders']
+            category['units'] += units
+            category['revenue'] += row['revenue'] or Decimal('0')
+
+    users = (
+        User.objects.filter(created_at__gte=since, created_at__lt=until)
+        .annotate(bucket=TruncHour('created_at'))
+        .values('bucket')
+        .annotate(new_users=Count('id'))
+        .order_by()
+    )
+    for row in users:
+        hours[row['bucket']]['new_users'] = row['new_users']
+
+    return hours, categories
+
+
+def rebuild_range(start, end):
+    """Recompute every rollup row for local days ``start`` <= day < ``end``"""
+    from .models import DailyCategorySales, DailySales, HourlySales
+
+    since, until = local_midnight(start), local_midnight(end)
+    hours, categories = _collect(since, until)
+
+    days = defaultdict(lambda: _empty(new_users=0))
+    for hour, totals in hours.items():
+        day = days[local_date(hour)]
+        for field, value in totals.items():
+            day[field] += value
+
+    update_fields = TOTAL_FIELDS + ['new_users', 'updated_at']
+    with transaction.atomic():
+        # Upsert, then drop buckets that no longer have activity
+        HourlySales.objects.bulk_create(
+            [HourlySales(hour=hour, **totals) for hour, totals in hours.items()],
+            batch_size=1000, update_conflicts=True, unique_fields=['hour'],
+            update_fields=update_fields,
+        )
+        HourlySales.objects.filter(hour__gte=since, hour__lt=until).exclude(hour__in=list(hours)).delete()
+
+        DailySales.objects.bulk_create(
+            [DailySales(date=day, **totals) for day, totals in days.items()],
+            batch_size=1000, update_conflicts=True, unique_fields=['date'],
+            update_fields=update_fields,
+        )
+        DailySales.objects.filter(date__gte=start, date__lt=end).exclude(date__in=list(days)).delete()
+
+        DailyCategorySales.objects.bulk_create(
+            [DailyCategorySales(date=day, category_id=category_id, **totals)
+             for (day, category_id), totals in categories.items()],
+            batch_size=1000, update_conflicts=True, unique_fields=['category', 'date'],
+            update_fields=TOTAL_FIELDS + ['updated_at'],
+        )
+        existing = DailyCategorySales.objects.filter(
+            date__gte=start, date__lt=end,
+        ).values_list('id', 'date', 'category_id')
+        stale = [pk for pk, day, category_id in existing if (day, category_id) not in categories]
+        if stale:
+            DailyCategorySales.objects.filter(id__in=stale).delete()
+
+    return len(days)
+
+
+def rebuild_days(days):
+    """Rebuild each of ``days`` (dates); returns the number of days with sales"""
+    return sum(rebuild_range(day, day + timedelta(days=1)) for day in sorted(set(days)))
+
+
+def backfill(start=None, end=None, chunk_days=BACKFILL_CHUNK_DAYS):
+    """
+    Rebuild local days ``start`` <= day <= ``end`` in chunks; defaults to
+    the day of the first order or sign-up through today. Returns the number
+    of days rebuilt.
+    """
+    from .models import ArchivedOrder, Order, User
+
+    end = end or timezone.localdate()
+    if start is None:
+        firsts = [
+            model.objects.order_by('created_at').values_list('created_at', flat=True).first()
+            for model in (ArchivedOrder, Order, User)
+        ]
+        firsts = [local_date(first) for first in firsts if first]
+        if not firsts:
+            return 0
+        start = min(firsts)
+
+    day = start
+    while day <= end:
+        chunk_end = min(day + timedelta(days=chunk_days), end + timedelta(days=1))
+        rebuild_range(day, chunk_end)
+        day = chunk_end
+    return (end - start).days + 1
+
+
+# ==========================================
+# Triggers
+# ==========================================
+
+def queue_sales_day(value):
+    """Queue the local day of ``value`` (an aware datetime) for a rebuild"""
+    if value is not None:
+        mark_for_refresh('sales_rollups', local_date(value))
+
+
+def schedule_rebuild(days):
+    """Refresher: one delayed rebuild task per day and REFRESH_DELAY"""
+    # cache.add() lets the first change of a burst queue the task; the task
+    # runs after the burst, so it sees all of it
+    fresh = [day for day in sorted(days) if cache.add(f'{REFRESH_LOCK_PREFIX}{day}', 1, REFRESH_DELAY)]
+    if not fresh:
+        return
+    from .tasks import refresh_sales_rollups
+
+    refresh_sales_rollups.apply_async(
+        kwargs={'days': [day.isoformat() for day in fresh]}, countdown=REFRESH_DELAY,
+    )
+
+
+register_refresher('sales_rollups', schedule_rebuild)
+
+
+# ==========================================
+# Reads
+# ==========================================
+
+def _category_filter(category_id):
+    from .category_tree import get_descendant_ids
+
+    return Q(category_id__in=get_descendant_ids(category_id) or [category_id])
+
+
+def _rollups(start, end, category_id=None):
+    """Daily rows (overall or for a category subtree) for start <= date <= end"""
+    from .models import DailyCategorySales, DailySales
+
+    if category_id:
+        queryset = DailyCategorySales.objects.filter(_category_filter(category_id))
+    else:
+        queryset = DailySales.objects.all()
+    return queryset.filter(date__gte=start, date__lte=end)
+
+
+def sales_totals(start, end, category_id=None):
+    """Summed orders/revenue/units (and new_users overall) for local days start..end"""
+    fields = TOTAL_FIELDS if category_id else TOTAL_FIELDS + ['new_users']
+    totals = _rollups(start, end, category_id).aggregate(**{field: Sum(field) for field in fields})
+    return {field: totals[field] or 0 for field in fields}
+
+
+def sales_series(start, end, interval='day', category_id=None):
+    """
+    [{'period', 'orders', 'revenue', 'units'[, 'new_users']}] for local days
+    start..end, one entry per hour/day/month/year with sales
+    """
+    from .models import HourlySales
+
+    if interval not in INTERVALS:
+        raise ValueError(f"Unknown interval: {interval}")
+    fields = TOTAL_FIELDS if category_id else TOTAL_FIELDS + ['new_users']
+
+    if interval == 'hour':
+        if category_id:
+            raise ValueError("Hourly sales are not kept per category")
+        if (end - start).days >= MAX_HOURLY_DAYS:
+            raise ValueError(f"Hourly sales are limited to {MAX_HOURLY_DAYS} days")
+        rows = HourlySales.objects.filter(
+            hour__gte=local_midnight(start), hour__lt=local_midnight(end + timedelta(days=1)),
+        ).order_by('hour').values('hour', *fields)
+        return [{'period': timezone.localtime(row.pop('hour')).isoformat(), **row} for row in rows]
+
+    trunc = {'day': F('date'), 'month': TruncMonth('date'), 'year': TruncYear('date')}[interval]
+    rows = (
+        _rollups(start, end, category_id).annotate(period=trunc).values('period')
+        .annotate(**{f'{field}_total': Sum(field) for field in fields})
+        .order_by('period')
+    )
+    return [
+        {'period': row['period'].isoformat(), **{field: row[f'{field}_total'] for field in fields}}
+        for row in rows
+    ]
+
+
+def dashboard_stats(today=None):
+    """Admin home numbers: order totals from DailySales, users counted live"""
+    from .models import DailySales, User
+
+    today = today or timezone.localdate()
+    week_ago = today - timedelta(days=7)
+    month_ago = today - timedelta(days=30)
+
+    stats = DailySales.objects.aggregate(
+        total_orders=Sum('orders'),
+        orders_today=Sum('orders', filter=Q(date=today)),
+        orders_this_week=Sum('orders', filter=Q(date__gte=week_ago)),
+        revenue_today=Sum('revenue', filter=Q(date=today)),
+        revenue_this_month=Sum('revenue', filter=Q(date__gte=month_ago)),
+    )
+    # Not Sum('new_users'): deleted accounts stay in the rollups
+    stats['total_users'] = User.objects.count()
+    return {name: value or 0 for name, value in stats.items()}
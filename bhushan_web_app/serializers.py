@@ -1,6 +1,11 @@
 
 from rest_framework import serializers
-from django.db.models import Avg
+from django.core.files.storage import default_storage
+from django.db.models import Avg, Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from . import catalog
+from .category_tree import category_row
+from .images import rendition_url, rendition_urls
 from .models import (
     User, OTP, Address, Category, Brand, Product, ProductImage,
     ProductVariation, Cart, CartItem, Order, OrderItem, Payment,
@@ -42,43 +47,104 @@ class AddressSerializer(serializers.ModelSerializer):
 
 # ==================== Category Serializers ====================
 class CategorySerializer(serializers.ModelSerializer):
-    children = serializers.SerializerMethodField()
-    product_count = serializers.SerializerMethodField()
+    """Read-only; same output as category_node_data, which the category views call directly"""
+    children = serializers.ReadOnlyField()
+    product_count = serializers.ReadOnlyField()
+    in_stock_count = serializers.ReadOnlyField()
+    min_price = serializers.ReadOnlyField()
+    max_price = serializers.ReadOnlyField()
+    image_renditions = serializers.ReadOnlyField()
 
     class Meta:
         model = Category
-        fields = ['id', 'name', 'slug', 'description', 'image', 'parent',
-                 'children', 'product_count', 'is_active', 'display_order']
+        fields = ['id', 'name', 'slug', 'description', 'image', 'image_renditions', 'parent',
+                 'children', 'product_count', 'in_stock_count', 'min_price',
+                 'max_price', 'is_active', 'display_order']
         read_only_fields = ['id']
 
-    def get_children(self, obj):
-        if obj.children.exists():
-            return CategorySerializer(obj.children.filter(is_active=True), many=True).data
-        return []
-
-    def get_product_count(self, obj):
-        return obj.products.filter(is_active=True).count()
+    def to_representation(self, obj):
+        # Children and stats come from the cached category index - no query per node
+        return category_node_data(category_row(obj), catalog.category_index(), self.context.get('request'))
+
+
+def category_node_data(node, index, request=None, stats=None):
+    """CategorySerializer output for a category index row, children included"""
+    if stats is None:
+        stats = catalog.category_stats()
+    node_stats = stats.get(node['id'], catalog.EMPTY_STATS)
+    image = node['image']
+    if image:
+        image = default_storage.url(image)
+        if request is not None:
+            image = request.build_absolute_uri(image)
+    return {
+        'id': str(node['id']),
+        'name': node['name'],
+        'slug': node['slug'],
+        'description': node['description'],
+        'image': image or None,
+        'image_renditions': rendition_urls(node['image'], node['image_renditions'], request),
+        'parent': str(node['parent']) if node['parent'] else None,
+        'children': [
+            category_node_data(child, index, request, stats)
+            for child in index.children(node['id'])
+        ],
+        'product_count': node_stats['product_count'],
+        'in_stock_count': node_stats['in_stock_count'],
+        'min_price': _price(node_stats['min_price']),
+        'max_price': _price(node_stats['max_price']),
+        'is_active': node['is_active'],
+        'display_order': node['display_order'],
+    }
 
 
 # ==================== Brand Serializers ====================
 class BrandSerializer(serializers.ModelSerializer):
+    """Counts and prices come from BrandStats - select_related('stats')"""
     product_count = serializers.SerializerMethodField()
+    in_stock_count = serializers.SerializerMethodField()
+    min_price = serializers.SerializerMethodField()
+    max_price = serializers.SerializerMethodField()
+    logo_renditions = serializers.SerializerMethodField()
 
     class Meta:
         model = Brand
-        fields = ['id', 'name', 'slug', 'logo', 'is_active', 'product_count']
+        fields = ['id', 'name', 'slug', 'logo', 'logo_renditions', 'is_active', 'product_count',
+                 'in_stock_count', 'min_price', 'max_price']
         read_only_fields = ['id']
 
+    def get_logo_renditions(self, obj):
+        return rendition_urls(obj.logo, obj.logo_renditions, self.context.get('request'))
+
     def get_product_count(self, obj):
-        return obj.products.filter(is_active=True).count()
+        return catalog.brand_stats(obj)['product_count']
+
+    def get_in_stock_count(self, obj):
+        return catalog.brand_stats(obj)['in_stock_count']
+
+    def get_min_price(self, obj):
+        return _price(catalog.brand_stats(obj)['min_price'])
+
+    def get_max_price(self, obj):
+        return _price(catalog.brand_stats(obj)['max_price'])
+
+
+def _price(value):
+    return str(value) if value is not None else None
 
 
 # ==================== Product Serializers ====================
 class ProductImageSerializer(serializers.ModelSerializer):
+    renditions = serializers.SerializerMethodField()
+
     class Meta:
         model = ProductImage
-        fields = ['id', 'image', 'alt_text', 'is_primary', 'display_order']
-        read_only_fields = ['id']
+        fields = ['id', 'image', 'renditions', 'placeholder', 'dominant_color',
+                 'alt_text', 'is_primary', 'display_order']
+        read_only_fields = ['id', 'placeholder', 'dominant_color']
+
+    def get_renditions(self, obj):
+        return rendition_urls(obj.image, obj.renditions, self.context.get('request'))
 
 
 class ProductVariationSerializer(serializers.ModelSerializer):
@@ -93,6 +159,9 @@ class ProductSerializer(serializers.ModelSerializer):
     category_name = serializers.CharField(source='category.name', read_only=True)
     brand_name = serializers.CharField(source='brand.name', read_only=True)
     primary_image = serializers.SerializerMethodField()
+    primary_image_renditions = serializers.SerializerMethodField()
+    primary_image_placeholder = serializers.SerializerMethodField()
+    primary_image_color = serializers.SerializerMethodField()
     discount_percentage = serializers.ReadOnlyField()
     average_rating = serializers.SerializerMethodField()
     review_count = serializers.SerializerMethodField()
@@ -102,22 +171,48 @@ class ProductSerializer(serializers.ModelSerializer):
         fields = ['id', 'name', 'slug', 'sku', 'category', 'category_name',
                  'brand', 'brand_name', 'short_description', 'price',
                  'compare_price', 'discount_percentage', 'stock', 'is_active',
-                 'is_featured', 'primary_image', 'average_rating', 'review_count',
+                 'is_featured', 'primary_image', 'primary_image_renditions',
+                 'primary_image_placeholder', 'primary_image_color',
+                 'average_rating', 'review_count',
                  'sales_count', 'views_count', 'created_at']
         read_only_fields = ['id', 'sales_count', 'views_count', 'created_at']
 
+    def _primary(self, obj):
+        if not hasattr(obj, '_primary_image'):
+            if hasattr(obj, 'primary_images'):  # Prefetch(..., to_attr='primary_images')
+                obj._primary_image = obj.primary_images[0] if obj.primary_images else None
+            else:
+                obj._primary_image = obj.images.filter(is_primary=True).first() or obj.images.first()
+        return obj._primary_image
+
     def get_primary_image(self, obj):
-        primary = obj.images.filter(is_primary=True).first()
-        if primary:
-            return primary.image.url if primary.image else None
-        first_image = obj.images.first()
-        return first_image.image.url if first_image and first_image.image else None
+        primary = self._primary(obj)
+        return primary.image.url if primary and primary.image else None
+
+    def get_primary_image_renditions(self, obj):
+        primary = self._primary(obj)
+        if not primary:
+            return None
+        return rendition_urls(primary.image, primary.renditions, self.context.get('request'))
+
+    def get_primary_image_placeholder(self, obj):
+        primary = self._primary(obj)
+        return (primary.placeholder or None) if primary else None
+
+    def get_primary_image_color(self, obj):
+        primary = self._primary(obj)
+        return (primary.dominant_color or None) if primary else None
 
     def get_average_rating(self, obj):
-        avg = obj.reviews.filter(is_approved=True).aggregate(Avg('rating'))['rating__avg']
+        if hasattr(obj, 'approved_rating'):  # annotated, see recommendations.py
+            avg = obj.approved_rating
+        else:
+            avg = obj.reviews.filter(is_approved=True).aggregate(Avg('rating'))['rating__avg']
         return round(avg, 1) if avg else 0
 
     def get_review_count(self, obj):
+        if hasattr(obj, 'approved_review_count'):
+            return obj.approved_review_count
         return obj.reviews.filter(is_approved=True).count()
 
 
@@ -149,11 +244,8 @@ class CartItemSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'created_at']
 
     def get_product_image(self, obj):
-        primary = obj.product.images.filter(is_primary=True).first()
-        if primary and primary.image:
-            return primary.image.url
-        first_image = obj.product.images.first()
-        return first_image.image.url if first_image and first_image.image else None
+        primary = obj.product.images.filter(is_primary=True).first() or obj.product.images.first()
+        return (rendition_url(primary.image, primary.renditions, 'thumb') or None) if primary else None
 
 
 class CartSerializer(serializers.ModelSerializer):
@@ -192,6 +284,32 @@ class OrderTrackingSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'created_at']
 
 
+def with_order_summary(queryset):
+    """
+    Annotate what OrderSerializer shows per order - item count and latest
+    payment status - as subqueries, so a page of orders is one query.
+    Works on live and archived orders (order_archive.py).
+    """
+    meta = queryset.model._meta
+    items, payments = (meta.get_field(name).related_model for name in ('items', 'payments'))
+    items_count = (
+        items.objects.filter(order=OuterRef('pk')).order_by()
+        .values('order').annotate(count=Count('id')).values('count')
+    )
+    latest_payment = payments.objects.filter(order=OuterRef('pk')).order_by('-created_at').values('status')[:1]
+    return queryset.annotate(
+        annotated_items_count=Coalesce(Subquery(items_count), Value(0), output_field=IntegerField()),
+        latest_payment_status=Subquery(latest_payment),
+    )
+
+
+def with_order_details(queryset):
+    """with_order_summary() plus what OrderDetailSerializer nests: addresses, items, payments, tracking"""
+    return with_order_summary(queryset).select_related(
+        'shipping_address', 'billing_address'
+    ).prefetch_related('items', 'payments', 'tracking')
+
+
 class OrderSerializer(serializers.ModelSerializer):
     items_count = serializers.SerializerMethodField()
     payment_status = serializers.SerializerMethodField()
@@ -204,9 +322,14 @@ class OrderSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'order_number', 'created_at', 'updated_at']
 
     def get_items_count(self, obj):
+        # Annotated by with_order_summary()
+        if hasattr(obj, 'annotated_items_count'):
+            return obj.annotated_items_count
         return obj.items.count()
 
     def get_payment_status(self, obj):
+        if hasattr(obj, 'latest_payment_status'):
+            return obj.latest_payment_status or 'pending'
         payment = obj.payments.first()
         return payment.status if payment else 'pending'
 
@@ -1,13 +1,26 @@
 # signals.py
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
-from .models import OrderItem, Product,Product, Category, Brand,ProductImage
-
-from django.db.models.signals import post_save, post_delete, pre_delete
-from django.dispatch import receiver
-from django.core.cache import cache
-from django.db.models import Q
 import logging
 
+from .catalog_stats import (
+    ancestor_ids, product_category_ids, queue_category_stats, queue_product_stats,
+)
+from .catalog_version import category_scope, product_scopes
+from .images import queue_renditions
+from .invalidation import INVALIDATION_MAP, coalesce_invalidations, mark_changed, mark_dirty
+from .metrics import cache_invalidations
+from .order_status import order_status_changed
+from .sales_rollups import queue_sales_day
+from .trending import record_sale
+from .user_stats import invalidate_cart_stats, invalidate_user_stats
+from .models import (
+    Address, CartItem, Order, OrderItem, Product, Category, Brand, ProductImage,
+    ProductVariation, Review, User, Wishlist,
+)
+
 
 logger = logging.getLogger(__name__)
 
@@ -15,233 +28,198 @@ logger = logging.getLogger(__name__)
 @receiver(post_save, sender=OrderItem)
 def update_inventory(sender, instance, created, **kwargs):
     if created:
+        # F() so concurrent orders cannot overwrite each other's counts; the
+        # instances hold expressions afterwards and are not reused
         product = instance.product
-        product.stock -= instance.quantity
-        product.sales_count += instance.quantity
-        product.save()
-        
+        product.stock = F('stock') - instance.quantity
+        product.sales_count = F('sales_count') + instance.quantity
+        product.save(update_fields=['stock', 'sales_count', 'updated_at'])
+        record_sale(product.pk, instance.quantity)
+
         if instance.variation:
-            instance.variation.stock -= instance.quantity
-            instance.variation.save()
+            instance.variation.stock = F('stock') - instance.quantity
+            instance.variation.save(update_fields=['stock'])
+
 
+# ==========================================
+# Sales Rollup Signals
+# ==========================================
+# The day an order was placed on is rebuilt when the order is created, its
+# status changes (revenue counts delivered orders) or items are added.
 
+@receiver(post_save, sender=Order)
+def update_sales_on_order_save(sender, instance=None, created=False, raw=False, **kwargs):
+    if raw:
+        return
+    if created or instance.status != getattr(instance, '_loaded_status', instance.status):
+        queue_sales_day(instance.created_at)
+    instance._loaded_status = instance.status
 
 
-@receiver(post_save, sender=Product)
-def invalidate_product_cache_on_save(sender, instance=None, created=False, **kwargs):
-    """Invalidate caches when product is saved"""
-    invalidate_product_cache()
-    if created:
-        invalidate_category_cache()
+@receiver(post_delete, sender=Order)
+def update_sales_on_order_delete(sender, instance=None, **kwargs):
+    queue_sales_day(instance.created_at)
 
 
-@receiver(post_delete, sender=Product)
-def invalidate_product_cache_on_delete(sender, instance=None, **kwargs):
-    """Invalidate caches when product is deleted"""
-    invalidate_product_cache()
+@receiver(post_save, sender=OrderItem)
+def update_sales_on_order_item(sender, instance=None, created=False, raw=False, **kwargs):
+    if created and not raw:
+        queue_sales_day(instance.order.created_at)
 
 
-@receiver(post_save, sender=Category)
-@receiver(post_delete, sender=Category)
-def invalidate_category_cache_signals(sender, **kwargs):
-    """Invalidate category caches"""
-    invalidate_category_cache()
+@receiver(post_save, sender=User)
+def update_sales_on_signup(sender, instance=None, created=False, raw=False, **kwargs):
+    if created and not raw:
+        queue_sales_day(instance.created_at)
 
 
-@receiver(post_save, sender=Brand)
-@receiver(post_delete, sender=Brand)
-def invalidate_brand_cache_signals(sender, **kwargs):
-    """Invalidate brand caches"""
-    invalidate_brand_cache()
+# ==========================================
+# Order Status Events
+# ==========================================
+# order_status.transition() updates the row without Order.save(); the
+# rollups, stats and emails follow its events instead.
 
+@receiver(order_status_changed)
+def update_sales_on_status_change(sender, order=None, previous=None, **kwargs):
+    if previous is not None:
+        queue_sales_day(order.created_at)
+        invalidate_user_stats(order.user_id)
 
-def invalidate_product_cache():
-    """Clear all product-related caches"""
-    cache.delete('all_products')
-    cache.delete('featured_products_home')
-    cache.delete('new_arrivals_home')
-    cache.delete('top_selling_home')
-    cache.delete('product_price_range')
-    
-    # Clear all filter caches
-    keys = cache.keys('filtered_products_*')
-    if keys:
-        cache.delete_many(keys)
 
+@receiver(order_status_changed)
+def send_status_emails(sender, order=None, status=None, **kwargs):
+    if status == 'confirmed':
+        from .tasks import send_order_confirmation_email
 
-def invalidate_category_cache():
-    """Clear category caches"""
-    cache.delete('active_categories')
-    cache.delete('categories_mega_menu')
-    invalidate_product_cache()
+        order_id = order.pk
+        transaction.on_commit(lambda: send_order_confirmation_email.delay(order_id))
 
 
-def invalidate_brand_cache():
-    """Clear brand caches"""
-    cache.delete('active_brands')
-    invalidate_product_cache()
+# ==========================================
+# User Stats Signals
+# ==========================================
+# Dashboard counters are cached per user (user_stats.py)
 
+@receiver(post_save, sender=Order)
+@receiver(post_delete, sender=Order)
+@receiver(post_save, sender=Wishlist)
+@receiver(post_delete, sender=Wishlist)
+@receiver(post_save, sender=Address)
+@receiver(post_delete, sender=Address)
+def invalidate_user_stats_on_change(sender, instance=None, **kwargs):
+    invalidate_user_stats(instance.user_id)
 
 
+@receiver(post_save, sender=CartItem)
+@receiver(post_delete, sender=CartItem)
+def invalidate_user_stats_on_cart_change(sender, instance=None, **kwargs):
+    invalidate_cart_stats(instance)
 
-CACHE_KEYS = {
-    'all_products': 'all_products',
-    'featured_products_home': 'featured_products_home',
-    'new_arrivals_home': 'new_arrivals_home',
-    'top_selling_home': 'top_selling_home',
-    'product_price_range': 'product_price_range',
-    'active_categories': 'active_categories',
-    'categories_mega_menu': 'categories_mega_menu',
-    'active_brands': 'active_brands',
-    'filtered_products': 'filtered_products_*',
-}
 
 # ==========================================
-# Product Signals
+# Cache Invalidation Signals
 # ==========================================
+# Handlers only mark tags dirty (see invalidation.py); the keys are deleted
+# once per request / transaction, however many rows were saved. The catalog
+# generations behind conditional GET (catalog_version.py) are bumped in the
+# same batch.
+
+def parent_product(instance):
+    """``instance.product``, or None once a cascade has deleted it"""
+    try:
+        return instance.product
+    except Product.DoesNotExist:
+        return None
+
+
+def mark_product_changed(product):
+    """Bump the product's own generation and those of its categories"""
+    mark_changed(
+        *product_scopes(product),
+        *(category_scope(pk) for pk in product_category_ids(product)),
+    )
+
 
 @receiver(post_save, sender=Product)
 def invalidate_product_cache_on_save(sender, instance=None, created=False, **kwargs):
-    """
-    Invalidate product-related caches when a product is saved.
-    This includes both new product creation and product updates.
-    """
-    try:
-        logger.info(f"Product saved: {instance.name} (ID: {instance.id})")
-        
-        # Invalidate all product caches
-        invalidate_all_product_caches()
-        
-        # If product is new and active, also invalidate category cache
-        if created and instance.is_active:
-            invalidate_category_cache()
-            
-            logger.info(f"New active product created: {instance.name}")
-        
-        # If product featured status changed, invalidate featured products cache
-        if instance.is_featured:
-            cache.delete(CACHE_KEYS['featured_products_home'])
-            logger.info(f"Featured status changed for: {instance.name}")
-            
-    except Exception as e:
-        logger.error(f"Error invalidating product cache on save: {str(e)}")
+    """Listings, brand/category stats and the brand list may all change"""
+    cache_invalidations.inc(signal='product_saved')
+    queue_product_stats(instance)
+    mark_product_changed(instance)
+    mark_dirty('products', 'brands')
 
 
 @receiver(post_delete, sender=Product)
 def invalidate_product_cache_on_delete(sender, instance=None, **kwargs):
-    """
-    Invalidate product-related caches when a product is deleted.
-    """
-    try:
-        logger.info(f"Product deleted: {instance.name} (ID: {instance.id})")
-        invalidate_all_product_caches()
-        
-        # Also invalidate category cache
-        invalidate_category_cache()
-        
-    except Exception as e:
-        logger.error(f"Error invalidating product cache on delete: {str(e)}")
+    cache_invalidations.inc(signal='product_deleted')
+    queue_product_stats(instance)
+    mark_product_changed(instance)
+    mark_dirty('products', 'brands')
 
 
-# ==========================================
-# ProductImage Signals
-# ==========================================
-
 @receiver(post_save, sender=ProductImage)
-def invalidate_cache_on_image_save(sender, instance=None, created=False, **kwargs):
-    """
-    Invalidate product cache when product images are updated.
-    This ensures the product display is updated with new images.
-    """
-    try:
-        if instance and instance.product:
-            logger.info(f"Product image saved for: {instance.product.name}")
-            invalidate_all_product_caches()
-            
-    except Exception as e:
-        logger.error(f"Error invalidating cache on image save: {str(e)}")
-
-
 @receiver(post_delete, sender=ProductImage)
-def invalidate_cache_on_image_delete(sender, instance=None, **kwargs):
-    """
-    Invalidate product cache when product images are deleted.
-    """
-    try:
-        if instance and instance.product:
-            logger.info(f"Product image deleted for: {instance.product.name}")
-            invalidate_all_product_caches()
-            
-    except Exception as e:
-        logger.error(f"Error invalidating cache on image delete: {str(e)}")
+def invalidate_cache_on_image_change(sender, instance=None, **kwargs):
+    """Listings embed the primary image"""
+    cache_invalidations.inc(signal='product_image_changed')
+    product = parent_product(instance)
+    if product is not None:
+        mark_product_changed(product)
+    mark_dirty('products')
+
+
+@receiver(post_save, sender=ProductVariation)
+@receiver(post_delete, sender=ProductVariation)
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def bump_product_generation(sender, instance=None, **kwargs):
+    """Variations show on the product page; ratings also in product lists"""
+    product = parent_product(instance)
+    if product is not None:
+        mark_changed(*product_scopes(product), 'reviews' if sender is Review else None)
 
 
-# ==========================================
-# Category Signals
-# ==========================================
+@receiver(post_save, sender=ProductImage)
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Brand)
+def generate_renditions_on_upload(sender, instance=None, raw=False, **kwargs):
+    """Queue thumbnails / WebP / AVIF for a new or replaced upload"""
+    if not raw:
+        queue_renditions(instance)
+
 
 @receiver(post_save, sender=Category)
-def invalidate_category_cache_on_save(sender, instance=None, created=False, **kwargs):
-    """
-    Invalidate category-related caches when a category is saved.
-    """
-    try:
-        logger.info(f"Category saved: {instance.name} (ID: {instance.id})")
-        invalidate_category_cache()
-        
-        # Also invalidate product caches since categories affect product listings
-        invalidate_all_product_caches()
-        
-    except Exception as e:
-        logger.error(f"Error invalidating category cache on save: {str(e)}")
+def update_category_tree_on_save(sender, instance=None, **kwargs):
+    """The 'categories' generation outdates the cached tree; listings show the category name"""
+    cache_invalidations.inc(signal='category_saved')
+    queue_category_stats(instance)
+    mark_category_changed(instance)
+    mark_dirty('products')
 
 
 @receiver(post_delete, sender=Category)
-def invalidate_category_cache_on_delete(sender, instance=None, **kwargs):
-    """
-    Invalidate category-related caches when a category is deleted.
-    """
-    try:
-        logger.info(f"Category deleted: {instance.name} (ID: {instance.id})")
-        invalidate_category_cache()
-        invalidate_all_product_caches()
-        
-    except Exception as e:
-        logger.error(f"Error invalidating category cache on delete: {str(e)}")
-
+def update_category_tree_on_delete(sender, instance=None, **kwargs):
+    cache_invalidations.inc(signal='category_deleted')
+    queue_category_stats(instance)
+    mark_category_changed(instance)
+    mark_dirty('products')
 
-# ==========================================
-# Brand Signals
-# ==========================================
 
-@receiver(post_save, sender=Brand)
-def invalidate_brand_cache_on_save(sender, instance=None, created=False, **kwargs):
-    """
-    Invalidate brand-related caches when a brand is saved.
-    """
-    try:
-        logger.info(f"Brand saved: {instance.name} (ID: {instance.id})")
-        invalidate_brand_cache()
-        
-        # Also invalidate product caches
-        invalidate_all_product_caches()
-        
-    except Exception as e:
-        logger.error(f"Error invalidating brand cache on save: {str(e)}")
+def mark_category_changed(category):
+    """The tree changed, and so did the listings of every ancestor"""
+    paths = {category.path, getattr(category, '_previous_path', '')}
+    mark_changed(
+        'categories',
+        *(category_scope(pk) for path in paths if path for pk in ancestor_ids(path)),
+    )
 
 
+@receiver(post_save, sender=Brand)
 @receiver(post_delete, sender=Brand)
-def invalidate_brand_cache_on_delete(sender, instance=None, **kwargs):
-    """
-    Invalidate brand-related caches when a brand is deleted.
-    """
-    try:
-        logger.info(f"Brand deleted: {instance.name} (ID: {instance.id})")
-        invalidate_brand_cache()
-        invalidate_all_product_caches()
-        
-    except Exception as e:
-        logger.error(f"Error invalidating brand cache on delete: {str(e)}")
+def invalidate_brand_cache_on_change(sender, **kwargs):
+    cache_invalidations.inc(signal='brand_changed')
+    mark_changed('brand_details')
+    mark_dirty('brands', 'products')
 
 
 # ==========================================
@@ -249,61 +227,18 @@ def invalidate_brand_cache_on_delete(sender, instance=None, **kwargs):
 # ==========================================
 
 def invalidate_all_product_caches():
-    """
-    Clear all product-related cache keys.
-    This includes home page product caches and filtered product caches.
-    """
-    cache_keys_to_delete = [
-        CACHE_KEYS['all_products'],
-        CACHE_KEYS['featured_products_home'],
-        CACHE_KEYS['new_arrivals_home'],
-        CACHE_KEYS['top_selling_home'],
-        CACHE_KEYS['product_price_range'],
-    ]
-    
-    for key in cache_keys_to_delete:
-        try:
-            cache.delete(key)
-            logger.debug(f"Cache deleted: {key}")
-        except Exception as e:
-            logger.warning(f"Failed to delete cache key {key}: {str(e)}")
-    
-    # Clear all filtered products cache (pattern-based deletion)
-    try:
-        filtered_keys = cache.keys(CACHE_KEYS['filtered_products'])
-        if filtered_keys:
-            cache.delete_many(filtered_keys)
-            logger.debug(f"Deleted {len(filtered_keys)} filtered product cache entries")
-    except Exception as e:
-        logger.warning(f"Failed to delete filtered products cache: {str(e)}")
+    """Clear home page, listing and filtered product caches"""
+    mark_dirty('products')
 
 
 def invalidate_category_cache():
-    """
-    Clear all category-related cache keys.
-    """
-    cache_keys_to_delete = [
-        CACHE_KEYS['active_categories'],
-        CACHE_KEYS['categories_mega_menu'],
-    ]
-    
-    for key in cache_keys_to_delete:
-        try:
-            cache.delete(key)
-            logger.debug(f"Cache deleted: {key}")
-        except Exception as e:
-            logger.warning(f"Failed to delete cache key {key}: {str(e)}")
+    """Drop the whole category tree, e.g. after queryset.update() on categories"""
+    mark_dirty('categories')
 
 
 def invalidate_brand_cache():
-    """
-    Clear all brand-related cache keys.
-    """
-    try:
-        cache.delete(CACHE_KEYS['active_brands'])
-        logger.debug(f"Cache deleted: {CACHE_KEYS['active_brands']}")
-    except Exception as e:
-        logger.warning(f"Failed to delete cache key {CACHE_KEYS['active_brands']}: {str(e)}")
+    """Clear brand caches"""
+    mark_dirty('brands')
 
 
 def clear_all_caches():
@@ -311,45 +246,9 @@ def clear_all_caches():
     Clear all application caches.
     Use this for bulk operations or manual cache clearing.
     """
-    try:
-        invalidate_all_product_caches()
-        invalidate_category_cache()
-        invalidate_brand_cache()
-        logger.info("All caches cleared successfully")
-    except Exception as e:
-        logger.error(f"Error clearing all caches: {str(e)}")
-
-
-# ==========================================
-# Optional: Bulk Operation Cache Clearing
-# ==========================================
-
-def invalidate_product_by_category(category_id):
-    """
-    Invalidate caches for a specific category's products.
-    Useful if you have category-specific product caches.
-    """
-    try:
-        # Check if any products belong to this category
-        product_count = Product.objects.filter(category_id=category_id).count()
-        if product_count > 0:
-            invalidate_all_product_caches()
-            logger.info(f"Invalidated cache for {product_count} products in category {category_id}")
-    except Exception as e:
-        logger.error(f"Error invalidating products by category: {str(e)}")
-
-
-def invalidate_product_by_brand(brand_id):
-    """
-    Invalidate caches for a specific brand's products.
-    """
-    try:
-        product_count = Product.objects.filter(brand_id=brand_id).count()
-        if product_count > 0:
-            invalidate_all_product_caches()
-            logger.info(f"Invalidated cache for {product_count} products in brand {brand_id}")
-    except Exception as e:
-        logger.error(f"Error invalidating products by brand: {str(e)}")
+    with coalesce_invalidations():
+        mark_dirty(*INVALIDATION_MAP)
+    logger.info("All caches cleared successfully")
 
 
 # ==========================================
@@ -358,21 +257,11 @@ def invalidate_product_by_brand(brand_id):
 
 def get_cache_statistics():
     """
-    Get statistics about cached items.
+    Which of the fixed cache keys are currently populated.
     Useful for monitoring cache performance.
     """
-    try:
-        stats = {
-            'all_products': cache.get(CACHE_KEYS['all_products']) is not None,
-            'featured_products_home': cache.get(CACHE_KEYS['featured_products_home']) is not None,
-            'new_arrivals_home': cache.get(CACHE_KEYS['new_arrivals_home']) is not None,
-            'top_selling_home': cache.get(CACHE_KEYS['top_selling_home']) is not None,
-            'product_price_range': cache.get(CACHE_KEYS['product_price_range']) is not None,
-            'active_categories': cache.get(CACHE_KEYS['active_categories']) is not None,
-            'categories_mega_menu': cache.get(CACHE_KEYS['categories_mega_menu']) is not None,
-            'active_brands': cache.get(CACHE_KEYS['active_brands']) is not None,
-        }
-        return stats
-    except Exception as e:
-        logger.error(f"Error getting cache statistics: {str(e)}")
-        return {}
\ No newline at end of file
+    from .cache_utils import CacheManager
+    from .invalidation import tag_targets
+
+    keys, _ = tag_targets(INVALIDATION_MAP)
+    return CacheManager.exists_many(sorted(keys))
@@ -81,14 +81,16 @@ def send_order_confirmation_email(order_id):
     try:
         from .models import Order
         order = Order.objects.select_related('user').get(id=order_id)
+        if not order.user.email:
+            return
         
         subject = f'Order Confirmation - {order.order_number}'
         message = f'''
-        Hello {order.user.full_name},
+        Hello {order.user.get_full_name() or order.user.mobile},
         
-        Your order {order.order_number} has been placed successfully!
+        Your order {order.order_number} has been confirmed!
         
-        Order Total: ₹{order.total}
+        Order Total: ₹{order.total_amount}
         
         Thank you for shopping with us!
         '''
@@ -109,19 +111,16 @@ def send_order_confirmation_email(order_id):
 
 # ==================== Cache Warming Tasks ====================
 @shared_task
-def warm_product_cache():
-    """Warm up product cache"""
+def warm_caches(names=None, tags=()):
+    """Recompute the cached computations the storefront reads (all if names is None)"""
     try:
-        from .models import Product
-        from django.core.cache import cache
-        
-        products = Product.objects.filter(available=True).select_related('category')[:50]
-        
-        for product in products:
-            cache_key = f'product_{product.id}'
-            cache.set(cache_key, product, 3600)
-        
-        logger.info(f'Warmed cache for {products.count()} products')
+        from .warming import release_rewarm, warm
+
+        # Flushes from here on queue their own re-warm
+        release_rewarm(tags)
+        warmed = warm(names)
+        logger.info(f'Warmed caches: {warmed}')
+        return warmed
         
     except Exception as e:
         logger.error(f'Cache warming failed: {e}')
@@ -145,6 +144,166 @@ def update_popular_searches():
         logger.error(f'Popular searches update failed: {e}')
 
 
+@shared_task
+def refresh_catalog_stats():
+    """Rebuild BrandStats / CategoryStats from scratch"""
+    try:
+        from .catalog_stats import refresh_all_stats
+
+        result = refresh_all_stats()
+        logger.info(f"Refreshed catalog stats: {result}")
+        return result
+
+    except Exception as e:
+        logger.error(f'Catalog stats refresh failed: {e}')
+
+
+@shared_task
+def build_recommendations():
+    """Recompute related / frequently-bought-together lists for every product"""
+    try:
+        from .recommendations import build_recommendations as build
+
+        count = build()
+        logger.info(f"Built recommendations for {count} products")
+        return count
+
+    except Exception as e:
+        logger.error(f'Recommendation build failed: {e}')
+
+
+@shared_task
+def materialize_trending():
+    """Rebuild the trending top lists from the decayed hourly buckets"""
+    try:
+        from .trending import materialize_trending as materialize
+
+        count = materialize()
+        logger.info(f"Materialized {count} trending lists")
+        return count
+
+    except Exception as e:
+        logger.error(f'Trending materialization failed: {e}')
+
+
+@shared_task
+def refresh_sales_rollups(days):
+    """Rebuild the sales rollups of the given local days (ISO dates)"""
+    try:
+        from datetime import date
+        from .sales_rollups import rebuild_days
+
+        return rebuild_days(date.fromisoformat(day) for day in days)
+
+    except Exception as e:
+        logger.error(f'Sales rollup refresh failed for {days}: {e}')
+
+
+@shared_task
+def backfill_sales_rollups(days=None):
+    """Rebuild the sales rollups of the last ``days`` days, or all history if None"""
+    try:
+        from datetime import timedelta
+        from django.utils import timezone
+        from .sales_rollups import backfill
+
+        start = timezone.localdate() - timedelta(days=days - 1) if days else None
+        count = backfill(start=start)
+        logger.info(f"Rebuilt sales rollups for {count} days")
+        return count
+
+    except Exception as e:
+        logger.error(f'Sales rollup backfill failed: {e}')
+
+
+@shared_task
+def archive_orders():
+    """Move finished orders older than ORDER_ARCHIVE_AFTER_MONTHS to the archive tables"""
+    try:
+        from .order_archive import archive_orders as archive
+
+        count = archive()
+        logger.info(f"Archived {count} orders")
+        return count
+
+    except Exception as e:
+        logger.error(f'Order archiving failed: {e}')
+
+
+@shared_task
+def process_payment_events():
+    """Apply payment webhook events waiting in the inbox"""
+    try:
+        from .payment_events import process_pending
+
+        count = process_pending()
+        if count:
+            logger.info(f"Processed {count} payment events")
+        return count
+
+    except Exception as e:
+        logger.error(f'Payment event processing failed: {e}')
+
+
+@shared_task
+def reconcile_payments(report_path, output_path, fmt=None, since=None, until=None):
+    """Reconcile payments with a gateway report file (reconciliation.py)"""
+    try:
+        from datetime import datetime
+        from .invalidation import coalesce_invalidations
+        from .reconciliation import reconcile
+
+        with open(output_path, 'w', newline='') as output, coalesce_invalidations():
+            return reconcile(
+                report_path, output, fmt=fmt,
+                since=datetime.fromisoformat(since) if since else None,
+                until=datetime.fromisoformat(until) if until else None,
+            )
+
+    except Exception as e:
+        logger.error(f'Payment reconciliation failed for {report_path}: {e}')
+
+
+@shared_task
+def purge_idempotency_keys():
+    """Delete idempotency keys past their TTL"""
+    try:
+        from .idempotency import purge_expired
+
+        count = purge_expired()
+        logger.info(f"Purged {count} idempotency keys")
+        return count
+
+    except Exception as e:
+        logger.error(f'Idempotency key purge failed: {e}')
+
+
+@shared_task(bind=True, max_retries=3)
+def generate_image_renditions(self, model_label, pk, force=False):
+    """Resize an uploaded image into thumbnails and WebP/AVIF variants"""
+    try:
+        from .images import process_image
+
+        manifest = process_image(model_label, pk, force=force, debounce=True)
+        return {'status': 'success', 'widths': manifest.get('widths', []) if manifest else []}
+
+    except Exception as e:
+        logger.error(f'Rendition generation failed for {model_label} {pk}: {e}')
+        raise self.retry(exc=e, countdown=60)
+
+
+@shared_task
+def invalidate_image_caches(tag):
+    """Invalidate ``tag`` once for a burst of finished renditions"""
+    try:
+        from .images import flush_invalidation
+
+        flush_invalidation(tag)
+
+    except Exception as e:
+        logger.error(f'Invalidating {tag} after renditions failed: {e}')
+
+
 # ==================== Inventory Tasks ====================
 @shared_task
 def check_low_stock():
@@ -0,0 +1,23 @@
+# page_holes.py
+# {% hole %}: a user-specific fragment inside a page-cached template.
+#
+#   {% load page_holes %}
+#   <i class="{% hole "wishlist_icon" product.id %} fa-heart"></i>
+#
+# On CachedPageMixin views the tag leaves a marker that page_cache.py fills
+# per request; elsewhere the fragment is rendered in place.
+
+from django import template
+from django.utils.safestring import mark_safe
+
+from ..page_cache import hole_marker, render_hole
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def hole(context, name, *args):
+    if context.get('page_cache_holes'):
+        return mark_safe(hole_marker(name, args))
+    request = context.get('request')
+    return mark_safe(render_hole(name, request, args)) if request is not None else ''
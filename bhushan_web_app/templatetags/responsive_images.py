@@ -0,0 +1,39 @@
+# responsive_images.py
+# Template helpers for image renditions (see images.py).
+#
+#   {% load responsive_images %}
+#   {% picture img.image img.renditions "card" alt=product.name css_class="card-img-top"
+#              placeholder=img.placeholder color=img.dominant_color %}
+#   <img src="{% rendition_url img.image img.renditions "thumb" %}">
+
+from django import template
+
+from .. import images
+
+register = template.Library()
+
+
+@register.simple_tag
+def picture(image, renditions, size='card', alt='', css_class='', style='', sizes=None,
+            loading='lazy', placeholder='', color=''):
+    """
+    <picture> with AVIF/WebP sources; a plain <img> until renditions exist.
+    ``placeholder``/``color`` (ProductImage LQIP) are painted behind it.
+    """
+    return images.picture_html(image, renditions, size=size, alt=alt, css_class=css_class,
+                               style=style, sizes=sizes, loading=loading,
+                               placeholder=placeholder, color=color)
+
+
+@register.simple_tag(name='rendition_url')
+def rendition_url_tag(image, renditions, size='card'):
+    """Single URL (WebP) of the rendition closest to ``size``"""
+    return images.rendition_url(image, renditions, size)
+
+
+@register.simple_tag(name='srcset')
+def srcset_tag(renditions, fmt=images.URL_FORMAT):
+    """``srcset`` attribute value for one format, empty until renditions exist"""
+    if not renditions or fmt not in renditions.get('formats', []):
+        return ''
+    return images.srcset(renditions, fmt)
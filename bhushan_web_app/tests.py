@@ -1,3 +1,860 @@
-from django.test import TestCase
+from datetime import timedelta
+from decimal import Decimal
+from types import SimpleNamespace
+from unittest import mock
+import csv
+import importlib
+import io
+import json
+import os
+import tempfile
+import uuid
 
-# Create your tests here.
+from django.apps import apps as django_apps
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import DatabaseError, connection
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+
+from . import (
+    catalog, catalog_stats, category_tree, exports, idempotency, images, metrics, order_archive,
+    order_status, payment_events, reconciliation, sales_rollups, tasks, trending, views, warming,
+)
+from .catalog_import import import_catalog
+from .models import (
+    Address, ArchivedOrder, ArchivedOrderItem, ArchivedOrderTracking, ArchivedPayment, Brand,
+    BrandStats, Cart, CartItem, Category, CategoryStats, ContactMessage, DailyCategorySales,
+    DailySales, HourlySales, IdempotencyKey, Order, OrderItem, OrderTracking, Payment, PaymentEvent,
+    Product, ProductImage, ProductVariation, User,
+)
+from .serializers import CategorySerializer, category_node_data
+
+
+class OrderQueryBudgetTests(TestCase):
+    """Order APIs run a fixed number of queries, however many orders they show"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(mobile='9000000001', username='9000000001')
+        cls.address = Address.objects.create(
+            user=cls.user, full_name='Test User', mobile='9000000001', pincode='411001',
+            address_line1='1 Test Road', city='Pune', state='Maharashtra',
+        )
+        category = Category.objects.create(name='Test Category')
+        cls.product = Product.objects.create(
+            name='Test Product', sku='TEST-0001', category=category,
+            description='Test product', price=Decimal('100.00'), stock=1000,
+        )
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def create_orders(self, count):
+        for _ in range(count):
+            order = Order.objects.create(
+                user=self.user, shipping_address=self.address, billing_address=self.address,
+                subtotal=Decimal('200.00'), tax_amount=Decimal('36.00'), total_amount=Decimal('236.00'),
+            )
+            OrderItem.objects.create(
+                order=order, product=self.product, product_name=self.product.name,
+                sku=self.product.sku, quantity=2, unit_price=Decimal('100.00'),
+                total_price=Decimal('200.00'),
+            )
+            Payment.objects.create(order=order, payment_method='upi', amount=order.total_amount,
+                                   status='completed')
+            OrderTracking.objects.create(order=order, status='pending', message='Order placed')
+        return order
+
+    def get(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response, len(queries)
+
+    def test_order_list_queries_do_not_grow_with_page_size(self):
+        self.create_orders(1)
+        budgets = {url: self.get(url)[1] for url in ['/orders/', '/api/orders/']}
+
+        self.create_orders(19)
+        for url, budget in budgets.items():
+            response, count = self.get(url)
+            self.assertEqual(len(response.json()['results']), 20)
+            self.assertEqual(count, budget, url)
+
+        results = response.json()['results']
+        self.assertEqual({row['items_count'] for row in results}, {1})
+        self.assertEqual({row['payment_status'] for row in results}, {'completed'})
+
+    def test_order_detail_queries(self):
+        order = self.create_orders(1)
+        for url in [f'/orders/{order.pk}/', f'/api/orders/{order.pk}/']:
+            # session + user, order with addresses, items, payments, tracking
+            response, count = self.get(url)
+            self.assertEqual(count, 6, url)
+            self.assertEqual(response.json()['shipping_address_detail']['city'], 'Pune')
+            self.assertEqual(response.json()['payment_status'], 'completed')
+
+
+class CheckoutTestCase(TestCase):
+    """A customer with an address and a cart holding one product"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(mobile='9000000004', username='9000000004')
+        cls.address = Address.objects.create(
+            user=cls.user, full_name='Test User', mobile='9000000004', pincode='411001',
+            address_line1='1 Test Road', city='Pune', state='Maharashtra',
+        )
+        category = Category.objects.create(name='Checkout Category')
+        cls.product = Product.objects.create(
+            name='Checkout Product', sku='CHK-0001', category=category,
+            description='Test product', price=Decimal('100.00'), stock=10,
+        )
+        cls.variation = ProductVariation.objects.create(
+            product=cls.product, variation_type='size', variation_value='M', stock=5,
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+        cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=cart, product=self.product, variation=self.variation,
+                                quantity=2, price=Decimal('100.00'))
+
+    def checkout(self, address=None, **headers):
+        body = {'shipping_address_id': str((address or self.address).pk)}
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post('/orders/create/', body, content_type='application/json', **headers)
+
+
+class CheckoutTests(CheckoutTestCase):
+    """Placing an order is all or nothing"""
+
+    def test_order_takes_stock(self):
+        self.assertEqual(self.checkout().status_code, 201)
+        self.product.refresh_from_db()
+        self.variation.refresh_from_db()
+        self.assertEqual((self.product.stock, self.product.sales_count), (8, 2))
+        self.assertEqual(self.variation.stock, 3)
+        self.assertEqual(Order.objects.get().tracking.get().status, 'pending')
+        self.assertFalse(CartItem.objects.exists())
+
+    def test_failure_leaves_nothing_behind(self):
+        with mock.patch.object(order_status, 'place', side_effect=RuntimeError('boom')), \
+                self.assertRaises(RuntimeError), self.assertLogs('django.request', 'ERROR'):
+            self.checkout()
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 10)
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(CartItem.objects.count(), 1)
+
+
+class IdempotencyTests(CheckoutTestCase):
+    """Retries with the same Idempotency-Key get the first response back"""
+
+    KEY = {'HTTP_IDEMPOTENCY_KEY': 'attempt-1'}
+
+    def in_flight(self, **fields):
+        """The key row of a first attempt that is still running"""
+        request = SimpleNamespace(user=self.user, path='/orders/create/')
+        body = SimpleNamespace(data={'shipping_address_id': str(self.address.pk)})
+        return IdempotencyKey.objects.create(
+            key=idempotency.scoped_key(request, 'attempt-1'), user=self.user,
+            request_hash=idempotency.fingerprint(body),
+            expires_at=timezone.now() + timedelta(days=1), **fields,
+        )
+
+    def test_retry_replays_the_first_order(self):
+        first = self.checkout(**self.KEY)
+        cache.clear()   # replayed from the table as well as from Redis
+        for _ in range(2):
+            retry = self.checkout(**self.KEY)
+            self.assertEqual(retry.status_code, 201)
+            self.assertEqual(retry[idempotency.REPLAY_HEADER], 'true')
+            self.assertEqual(retry.json()['order']['id'], first.json()['order']['id'])
+        self.assertEqual(Order.objects.count(), 1)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 8)
+
+    def test_key_reused_for_another_body_is_rejected(self):
+        other = Address.objects.create(
+            user=self.user, full_name='Test User', mobile='9000000004', pincode='411002',
+            address_line1='2 Test Road', city='Pune', state='Maharashtra',
+        )
+        self.assertEqual(self.checkout(**self.KEY).status_code, 201)
+        self.assertEqual(self.checkout(address=other, **self.KEY).status_code, 422)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_failed_attempt_releases_the_key(self):
+        with mock.patch.object(order_status, 'place', side_effect=RuntimeError('boom')), \
+                self.assertRaises(RuntimeError), self.assertLogs('django.request', 'ERROR'):
+            self.checkout(**self.KEY)
+        self.assertFalse(IdempotencyKey.objects.exists())
+        self.assertEqual(self.checkout(**self.KEY).status_code, 201)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_duplicate_waits_for_the_attempt_in_flight(self):
+        row = self.in_flight()
+
+        def first_attempt_finishes(seconds):
+            IdempotencyKey.objects.filter(pk=row.pk).update(
+                status_code=201, response={'order': {'id': 'first'}},
+            )
+
+        with mock.patch.object(idempotency.time, 'sleep', side_effect=first_attempt_finishes):
+            response = self.checkout(**self.KEY)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json(), {'order': {'id': 'first'}})
+        self.assertFalse(Order.objects.exists())
+
+    def test_duplicate_gets_409_while_the_attempt_runs(self):
+        self.in_flight()
+        with mock.patch.object(idempotency, 'WAIT_TIMEOUT', 0.05):
+            response = self.checkout(**self.KEY)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertFalse(Order.objects.exists())
+
+    def test_abandoned_attempt_is_taken_over(self):
+        row = self.in_flight()
+        IdempotencyKey.objects.filter(pk=row.pk).update(
+            created_at=timezone.now() - timedelta(seconds=idempotency.LOCK_TIMEOUT + 1),
+        )
+        self.assertEqual(self.checkout(**self.KEY).status_code, 201)
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(IdempotencyKey.objects.get().status_code, 201)
+
+
+class OrderStatusTests(TestCase):
+    """Order status only moves through order_status"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(mobile='9000000005', username='9000000005')
+        cls.address = Address.objects.create(
+            user=cls.user, full_name='Test User', mobile='9000000005', pincode='411001',
+            address_line1='1 Test Road', city='Pune', state='Maharashtra',
+        )
+
+    def create_order(self, status='pending'):
+        return Order.objects.create(
+            user=self.user, shipping_address=self.address, status=status,
+            subtotal=Decimal('100.00'), total_amount=Decimal('118.00'),
+        )
+
+    def test_allowed_transition_updates_and_tracks(self):
+        order = self.create_order()
+        published = mock.Mock()
+        order_status.order_status_changed.connect(published, weak=False)
+        self.addCleanup(order_status.order_status_changed.disconnect, published)
+
+        order_status.transition(order, 'confirmed', message='Confirmed')
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'confirmed')
+        self.assertIsNotNone(order.confirmed_at)
+        self.assertEqual(list(order.tracking.values_list('status', 'message')), [('confirmed', 'Confirmed')])
+        self.assertEqual((published.call_args.kwargs['previous'], published.call_args.kwargs['status']),
+                         ('pending', 'confirmed'))
+
+    def test_disallowed_transition_changes_nothing(self):
+        order = self.create_order()
+        for status in ('shipped', 'delivered', 'refunded', 'pending'):
+            with self.assertRaises(order_status.InvalidTransition):
+                order_status.transition(order, status)
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'pending')
+        self.assertFalse(order.tracking.exists())
+
+    def test_concurrent_change_wins_over_stale_copy(self):
+        order = self.create_order()
+        stale = Order.objects.get(pk=order.pk)
+        order_status.transition(order, 'cancelled', cancellation_reason='Changed my mind')
+
+        # Still 'pending' in memory, so the move looks allowed; the
+        # UPDATE ... WHERE status = 'pending' matches no row
+        with self.assertRaisesMessage(order_status.InvalidTransition, 'no longer pending'):
+            order_status.transition(stale, 'confirmed')
+        order.refresh_from_db()
+        self.assertEqual((order.status, order.cancellation_reason), ('cancelled', 'Changed my mind'))
+        self.assertEqual(list(order.tracking.values_list('status', flat=True)), ['cancelled'])
+
+    def test_admin_action_moves_only_allowed_orders(self):
+        admin_user = User.objects.create_superuser(username='admin', mobile='9000000006',
+                                                   email='admin@example.com', password='x')
+        self.client.force_login(admin_user)
+        confirmed, delivered = self.create_order('confirmed'), self.create_order('delivered')
+        response = self.client.post('/admin/bhushan_web_app/order/', {
+            'action': 'mark_processing', '_selected_action': [confirmed.pk, delivered.pk],
+        })
+        self.assertEqual(response.status_code, 302)
+        confirmed.refresh_from_db()
+        delivered.refresh_from_db()
+        self.assertEqual((confirmed.status, delivered.status), ('processing', 'delivered'))
+        self.assertEqual(list(confirmed.tracking.values_list('status', flat=True)), ['processing'])
+
+        response = self.client.get(f'/admin/bhushan_web_app/order/{confirmed.pk}/change/')
+        self.assertNotContains(response, 'name="status"')
+
+
+
+class SalesRollupTests(TestCase):
+    """Rollups written by the migration and by sales_rollups agree"""
+
+    def rollups(self):
+        return [
+            sorted(model.objects.values_list(*fields))
+            for model, fields in (
+                (HourlySales, ['hour', 'orders', 'revenue', 'units', 'new_users']),
+                (DailySales, ['date', 'orders', 'revenue', 'units', 'new_users']),
+                (DailyCategorySales, ['date', 'category_id', 'orders', 'revenue', 'units']),
+            )
+        ]
+
+    def test_migration_backfill_matches_live_rebuild(self):
+        user = User.objects.create(mobile='9000000007', username='9000000007')
+        address = Address.objects.create(
+            user=user, full_name='Test User', mobile='9000000007', pincode='411001',
+            address_line1='1 Test Road', city='Pune', state='Maharashtra',
+        )
+        product = Product.objects.create(name='Rolled Up', sku='ROLL-1', description='Test product',
+                                         category=Category.objects.create(name='Rollups'),
+                                         price=Decimal('50.00'))
+        for status in ('pending', 'delivered'):
+            order = Order.objects.create(user=user, shipping_address=address, status=status,
+                                         subtotal=Decimal('100.00'), total_amount=Decimal('118.00'))
+            OrderItem.objects.create(order=order, product=product, product_name=product.name,
+                                     sku=product.sku, quantity=2, unit_price=Decimal('50.00'),
+                                     total_price=Decimal('100.00'))
+
+        sales_rollups.backfill()
+        live = self.rollups()
+        self.assertEqual(live[1][0][1:], (2, Decimal('118.00'), 2, 1))
+
+        migration = importlib.import_module('bhushan_web_app.migrations.0013_backfill_sales_rollups')
+        migration.backfill_rollups(django_apps, None)
+        self.assertEqual(self.rollups(), live)
+
+    def test_dashboard_counts_current_users(self):
+        users = [User.objects.create(mobile=f'900000001{i}', username=f'900000001{i}') for i in range(2)]
+        sales_rollups.backfill()
+        users[0].delete()
+        self.assertEqual(sales_rollups.dashboard_stats()['total_users'], 1)
+
+class FakeGateway:
+    """Signs and delivers webhooks the way the payment gateway does"""
+
+    secret = 'test-webhook-secret'
+
+    def __init__(self, client):
+        self.client = client
+        self.counter = 0
+
+    def event(self, event, payment, amount=None, transaction_id=None):
+        self.counter += 1
+        return {
+            'event': event,
+            'payment_id': str(payment.pk),
+            'transaction_id': transaction_id or f'txn_{self.counter}',
+            'amount': str(payment.amount if amount is None else amount),
+        }
+
+    def deliver(self, data, signature=None):
+        body = json.dumps(data).encode()
+        return self.client.post(
+            '/payments/callback/', body, content_type='application/json',
+            HTTP_X_PAYMENT_SIGNATURE=signature or payment_events.sign(body, self.secret),
+        )
+
+
+@override_settings(PAYMENT_WEBHOOK_SECRET=FakeGateway.secret)
+class PaymentWebhookTests(TestCase):
+    """Callbacks land in the inbox and the consumer applies them"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(mobile='9000000002', username='9000000002')
+        cls.address = Address.objects.create(
+            user=cls.user, full_name='Test User', mobile='9000000002', pincode='411001',
+            address_line1='1 Test Road', city='Pune', state='Maharashtra',
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.gateway = FakeGateway(self.client)
+        self.order = Order.objects.create(
+            user=self.user, shipping_address=self.address,
+            subtotal=Decimal('200.00'), total_amount=Decimal('236.00'),
+        )
+        self.payment = Payment.objects.create(order=self.order, payment_method='upi',
+                                              amount=self.order.total_amount)
+
+    def deliver(self, data, **kwargs):
+        # on_commit runs the (eager) consumer task
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.gateway.deliver(data, **kwargs)
+        self.payment.refresh_from_db()
+        self.order.refresh_from_db()
+        return response
+
+    def test_webhook_only_appends_to_inbox(self):
+        data = self.gateway.event('payment.captured', self.payment)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.gateway.deliver(data)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(PaymentEvent.objects.get().status, 'pending')
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, 'pending')
+
+    def test_captured_payment_confirms_order(self):
+        response = self.deliver(self.gateway.event('payment.captured', self.payment, transaction_id='txn_1'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.payment.status, 'completed')
+        self.assertEqual(self.payment.transaction_id, 'txn_1')
+        self.assertEqual(self.order.status, 'confirmed')
+        self.assertEqual(PaymentEvent.objects.get().status, 'processed')
+
+    def test_redelivered_event_is_applied_once(self):
+        data = self.gateway.event('payment.captured', self.payment)
+        for _ in range(3):
+            self.assertEqual(self.deliver(data).status_code, 200)
+        self.assertEqual(PaymentEvent.objects.count(), 1)
+        self.assertEqual(self.order.tracking.filter(status='confirmed').count(), 1)
+
+    def test_events_apply_in_arrival_order(self):
+        with self.captureOnCommitCallbacks(execute=False):
+            self.gateway.deliver(self.gateway.event('payment.failed', self.payment))
+            self.gateway.deliver(self.gateway.event('payment.captured', self.payment))
+        self.assertEqual(payment_events.process_pending(), 2)
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, 'completed')
+        self.assertEqual(list(PaymentEvent.objects.values_list('status', flat=True)),
+                         ['processed', 'processed'])
+
+    def test_capture_after_refund_is_ignored(self):
+        self.deliver(self.gateway.event('payment.captured', self.payment))
+        order_status.transition(self.order, 'cancelled')
+        self.gateway.deliver(self.gateway.event('payment.refunded', self.payment))
+        payment_events.process_pending()
+
+        # A customer reporting a capture, then a stray gateway capture
+        self.client.force_login(self.user)
+        response = self.client.post('/payments/verify/', {
+            'payment_id': str(self.payment.pk), 'transaction_id': 'txn_client',
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 202)
+        self.gateway.deliver(self.gateway.event('payment.captured', self.payment))
+        payment_events.process_pending()
+
+        self.payment.refresh_from_db()
+        self.order.refresh_from_db()
+        self.assertEqual(self.payment.status, 'refunded')
+        self.assertEqual(self.order.status, 'refunded')
+        self.assertEqual(list(PaymentEvent.objects.filter(event_type='payment.captured')
+                              .order_by('id').values_list('source', 'status')),
+                         [('gateway', 'processed'), ('client', 'ignored'), ('gateway', 'ignored')])
+
+    def verify_as_customer(self, transaction_id):
+        self.client.force_login(self.user)
+        response = self.client.post('/payments/verify/', {
+            'payment_id': str(self.payment.pk), 'transaction_id': transaction_id,
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 202)
+        payment_events.process_pending()
+        self.payment.refresh_from_db()
+        self.order.refresh_from_db()
+
+    def test_client_capture_only_awaits_the_gateway(self):
+        self.verify_as_customer('txn_claimed')
+        self.assertEqual(self.payment.status, 'processing')
+        self.assertEqual(self.order.status, 'pending')
+
+        self.gateway.deliver(self.gateway.event('payment.failed', self.payment))
+        payment_events.process_pending()
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, 'failed')
+
+    def test_client_cannot_shadow_the_gateway_event(self):
+        # The customer reports the gateway's own transaction id first
+        self.verify_as_customer('txn_gateway')
+        self.gateway.deliver(self.gateway.event('payment.captured', self.payment,
+                                                transaction_id='txn_gateway'))
+        payment_events.process_pending()
+        self.payment.refresh_from_db()
+        self.order.refresh_from_db()
+        self.assertEqual(self.payment.status, 'completed')
+        self.assertEqual(self.order.status, 'confirmed')
+        self.assertEqual(PaymentEvent.objects.filter(transaction_id='txn_gateway').count(), 2)
+
+    def test_unexpected_error_does_not_block_the_queue(self):
+        with self.captureOnCommitCallbacks(execute=False):
+            self.gateway.deliver(self.gateway.event('payment.failed', self.payment))
+            self.gateway.deliver(self.gateway.event('payment.captured', self.payment))
+        apply, calls = payment_events._apply, []
+
+        def flaky(event):
+            calls.append(event)
+            if len(calls) == 1:
+                raise RuntimeError('boom')
+            return apply(event)
+
+        with mock.patch.object(payment_events, '_apply', side_effect=flaky), \
+                self.assertLogs('bhushan_web_app.payment_events', 'ERROR'):
+            self.assertEqual(payment_events.process_pending(), 2)
+        self.assertEqual(list(PaymentEvent.objects.values_list('status', flat=True)),
+                         ['failed', 'processed'])
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, 'completed')
+
+    def test_rejects_bad_signature_and_body(self):
+        data = self.gateway.event('payment.captured', self.payment)
+        self.assertEqual(self.gateway.deliver(data, signature='0' * 64).status_code, 403)
+        self.assertEqual(self.gateway.deliver({**data, 'event': 'payment.unknown'}).status_code, 400)
+        self.assertFalse(PaymentEvent.objects.exists())
+
+    def test_amount_mismatch_fails_event(self):
+        self.deliver(self.gateway.event('payment.captured', self.payment, amount='1.00'))
+        event = PaymentEvent.objects.get()
+        self.assertEqual(event.status, 'failed')
+        self.assertIn('does not match', event.error)
+        self.assertEqual(self.payment.status, 'pending')
+        self.assertEqual(self.order.status, 'pending')
+
+
+
+class CategoryIndexTests(TestCase):
+    """The cached category index follows the committed tree"""
+
+    def setUp(self):
+        cache.clear()
+        self.root = Category.objects.create(name='Index Root')
+
+    def test_index_built_before_a_change_is_not_served_after_it(self):
+        category_tree.get_category_index()
+        # A cold read that queried the tree just before the commit below...
+        stale = category_tree.stamped_category_index.func()
+        with self.captureOnCommitCallbacks(execute=True):
+            child = Category.objects.create(name='Index Child', parent=self.root)
+        # ...and stored its result just after it
+        cache.set(category_tree.stamped_category_index.key, stale)
+
+        self.assertEqual(category_tree.get_category_index().descendant_ids(self.root.id),
+                         [self.root.id, child.id])
+
+    def test_serializer_matches_the_index_views(self):
+        Category.objects.create(name='Index Leaf', parent=self.root)
+        index = category_tree.get_category_index()
+        self.assertEqual(CategorySerializer(self.root).data,
+                         category_node_data(index.get(self.root.id), index))
+
+
+
+class CatalogStatsTests(TestCase):
+    """Stats refreshes skip rows deleted after they were queued"""
+
+    def test_deleted_ids_are_skipped(self):
+        brands = [Brand.objects.create(name=name) for name in ('Kept Brand', 'Gone Brand')]
+        categories = [Category.objects.create(name=name) for name in ('Kept Category', 'Gone Category')]
+        brand_ids, category_ids = [brand.pk for brand in brands], [category.pk for category in categories]
+        brands[1].delete()
+        categories[1].delete()
+
+        self.assertEqual(catalog_stats.refresh_brand_stats(brand_ids), 1)
+        self.assertEqual(catalog_stats.refresh_category_stats(category_ids), 1)
+        self.assertEqual(list(BrandStats.objects.values_list('brand_id', flat=True)), brand_ids[:1])
+        self.assertEqual(list(CategoryStats.objects.values_list('category_id', flat=True)), category_ids[:1])
+
+class TopSellingTabTests(TestCase):
+    """The top selling tab is ordered by trending rank"""
+
+    def test_trending_rank_unless_another_order_is_chosen(self):
+        category = Category.objects.create(name='Trending Category')
+        featured, rising = [
+            Product.objects.create(name=name, sku=sku, category=category, description='Test product',
+                                   price=Decimal(price), is_featured=is_featured, sales_count=sales)
+            for name, sku, price, is_featured, sales in (
+                ('Featured', 'TOP-1', '20.00', True, 10), ('Rising', 'TOP-2', '30.00', False, 1),
+            )
+        ]
+        with mock.patch.object(catalog, 'trending_ids', return_value=[str(rising.id), str(featured.id)]):
+            def listed(**params):
+                return [row['name'] for row in catalog.filtered_products.func(tab='top_selling', **params)]
+
+            self.assertEqual(listed(), ['Rising', 'Featured'])
+            self.assertEqual(listed(sort='-sales_count'), ['Rising', 'Featured'])
+            self.assertEqual(listed(sort='price'), ['Featured', 'Rising'])
+
+
+class SharedStoreTests(TestCase):
+    """Trending, metrics and warming pick their store through SharedStore"""
+
+    def test_local_store_without_redis(self):
+        for module, local_class in ((trending, trending.LocalTrendingStore),
+                                    (metrics, metrics.LocalMetricsStore),
+                                    (warming, warming.LocalUsageStore)):
+            module.reset_store()
+            self.assertIsInstance(module.get_store(), local_class)
+            self.assertIs(module.get_store(), module.get_store())
+
+    def test_decayed_scores_use_a_private_expiring_key(self):
+        client = mock.MagicMock()
+        pipe = client.pipeline.return_value
+        pipe.execute.return_value = [1, True, [(b'product-1', 3.0)], 1]
+        store = trending.RedisTrendingStore(client)
+
+        self.assertEqual(store.decayed_scores({100: 1.0}, 10), [('product-1', 3.0)])
+        store.decayed_scores({100: 1.0}, 10)
+        first, second = [call.args[0] for call in pipe.zunionstore.call_args_list]
+        self.assertNotEqual(first, second)
+        pipe.expire.assert_called_with(second, trending.SCORES_TIMEOUT)
+        pipe.delete.assert_called_with(second)
+
+
+class RewarmQueueTests(TestCase):
+    """A burst of flushes queues one re-warm until that re-warm starts"""
+
+    def test_lock_is_held_until_the_task_starts(self):
+        cache.clear()
+        with mock.patch.object(tasks.warm_caches, 'apply_async') as queued:
+            warming.queue_rewarm({'products'})
+            warming.queue_rewarm({'products'})
+            self.assertEqual(queued.call_count, 1)
+            kwargs = queued.call_args.kwargs['kwargs']
+            self.assertEqual(kwargs['tags'], ['products'])
+            self.assertLess(warming.REWARM_DELAY, warming.REWARM_LOCK_TIMEOUT)
+
+            with mock.patch.object(warming, 'warm', return_value={}):
+                tasks.warm_caches(**kwargs)
+            warming.queue_rewarm({'products'})
+            self.assertEqual(queued.call_count, 2)
+
+@override_settings(CACHE_WARMING_ENABLED=False)
+class CatalogImportTests(TestCase):
+    """import_catalog upserts on sku and reports bad rows without failing the batch"""
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        self.men = Category.objects.create(name='Men')
+        self.shoes = Category.objects.create(name='Shoes', parent=self.men)
+
+    def run_import(self, rows, **options):
+        path = os.path.join(self.dir.name, 'catalog.jsonl')
+        with open(path, 'w') as f:
+            for row in rows:
+                f.write(json.dumps(row) + '\n')
+        with self.captureOnCommitCallbacks(execute=True):
+            return import_catalog(path, renditions=False, **options)
+
+    def test_upsert_keeps_fields_left_out(self):
+        Product.objects.create(name='Runner', sku='SH-1', category=self.shoes,
+                               description='Light', price=Decimal('50.00'))
+        run = self.run_import([
+            {'sku': 'SH-1', 'price': '55.5', 'variations': [{'type': 'size', 'value': '9', 'stock': 3}]},
+            {'sku': 'SH-2', 'name': 'Runner', 'price': '60', 'category': 'Men > Shoes', 'brand': 'Acme'},
+        ])
+        self.assertEqual(run.errors, [])
+        self.assertEqual((run.counts['created'], run.counts['updated']), (1, 1))
+        updated = Product.objects.get(sku='SH-1')
+        self.assertEqual((updated.description, updated.price), ('Light', Decimal('55.50')))
+        self.assertEqual(updated.variations.get().stock, 3)
+        created = Product.objects.get(sku='SH-2')
+        self.assertEqual((created.category, created.brand.name), (self.shoes, 'Acme'))
+        self.assertNotEqual(created.slug, updated.slug)
+
+    def test_bad_values_only_fail_their_row(self):
+        run = self.run_import([
+            {'sku': 'BAD-1', 'name': 'A', 'price': 'NaN', 'category': 'Men'},
+            {'sku': 'BAD-2', 'name': 'A', 'price': '1e12', 'category': 'Men'},
+            {'sku': 'X' * 51, 'name': 'A', 'price': '1', 'category': 'Men'},
+            {'sku': 'BAD-3', 'name': 'A' * 256, 'price': '1', 'category': 'Men'},
+            {'sku': 'BAD-4', 'name': 'A', 'price': '-1', 'category': 'Men'},
+            {'sku': 'BAD-5', 'name': 'A', 'price': '1', 'category': 'Men',
+             'variations': [{'type': 'size', 'value': 'M', 'price_adjustment': 'Infinity'}]},
+            {'sku': 'OK-1', 'name': 'A', 'price': '1', 'category': 'Men'},
+        ])
+        self.assertEqual([line for line, _, _ in run.errors], [1, 2, 3, 4, 5, 6])
+        self.assertEqual(list(Product.objects.values_list('sku', flat=True)), ['OK-1'])
+
+    def test_category_levels_resolve_under_their_parent(self):
+        run = self.run_import([
+            {'sku': 'W-1', 'name': 'Heel', 'price': '10', 'category': 'Women > Shoes'},
+            {'sku': 'W-2', 'name': 'Bag', 'price': '10', 'category': 'Women > Bags'},
+        ])
+        self.assertEqual(len(run.errors), 1)
+        self.assertIn("'Shoes' already exists", run.errors[0][2])
+        bag = Product.objects.get(sku='W-2')
+        self.assertEqual(bag.category.parent.name, 'Women')
+        self.assertEqual(bag.category.path, f'/{bag.category.parent_id.hex}/{bag.category_id.hex}/')
+        self.assertFalse(Product.objects.filter(sku='W-1').exists())
+        self.assertEqual(Category.objects.filter(name='Women').count(), 1)
+
+
+class ExportTests(TestCase):
+    """CSV exports cannot run formulas from user-supplied text"""
+
+    def test_formula_cells_are_quoted(self):
+        ContactMessage.objects.create(name='=HYPERLINK("http://x")', email='a@example.com',
+                                      phone='+911234567890', subject='@SUM(A1)', message='-2+3')
+        lines = list(exports.stream('contact_messages', exports.export_queryset('contact_messages')))
+        row = next(csv.reader(lines[1:]))
+        self.assertEqual(row[:5], ["'=HYPERLINK(\"http://x\")", 'a@example.com', "'+911234567890",
+                                   "'@SUM(A1)", "'-2+3"])
+        jsonl = list(exports.stream('contact_messages', exports.export_queryset('contact_messages'), 'jsonl'))
+        self.assertEqual(json.loads(jsonl[0])['name'], '=HYPERLINK("http://x")')
+
+
+
+class OrderArchiveTests(TestCase):
+    """Finished orders are copied to the archive, then deleted, in one transaction"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(mobile='9000000008', username='9000000008')
+        cls.address = Address.objects.create(
+            user=cls.user, full_name='Test User', mobile='9000000008', pincode='411001',
+            address_line1='1 Test Road', city='Pune', state='Maharashtra',
+        )
+        cls.product = Product.objects.create(
+            name='Archived Product', sku='ARC-1', description='Test product', price=Decimal('100.00'),
+            category=Category.objects.create(name='Archive Category'),
+        )
+
+    def create_order(self, status):
+        order = Order.objects.create(user=self.user, shipping_address=self.address, status=status,
+                                     subtotal=Decimal('100.00'), total_amount=Decimal('118.00'))
+        OrderItem.objects.create(order=order, product=self.product, product_name=self.product.name,
+                                 sku=self.product.sku, quantity=1, unit_price=Decimal('100.00'),
+                                 total_price=Decimal('100.00'))
+        Payment.objects.create(order=order, payment_method='upi', status='completed',
+                               amount=order.total_amount)
+        OrderTracking.objects.create(order=order, status=status, message='Test')
+        return order
+
+    def test_final_orders_move_with_their_rows(self):
+        delivered, pending = self.create_order('delivered'), self.create_order('pending')
+
+        self.assertEqual(order_archive.archive_orders(months=0), 1)
+        self.assertEqual(list(Order.objects.values_list('pk', flat=True)), [pending.pk])
+        archived = ArchivedOrder.objects.get()
+        self.assertEqual((archived.pk, archived.order_number, archived.total_amount, archived.created_at),
+                         (delivered.pk, delivered.order_number, delivered.total_amount, delivered.created_at))
+        for archive_model, live_model in ((ArchivedOrderItem, OrderItem), (ArchivedPayment, Payment),
+                                          (ArchivedOrderTracking, OrderTracking)):
+            self.assertEqual(list(archive_model.objects.values_list('order_id', flat=True)), [delivered.pk])
+            self.assertEqual(list(live_model.objects.values_list('order_id', flat=True)), [pending.pk])
+        self.assertEqual(order_archive.get_order_or_404(self.user, delivered.pk).pk, delivered.pk)
+
+    def test_failed_copy_deletes_nothing(self):
+        order = self.create_order('cancelled')
+        with mock.patch.object(ArchivedOrderTracking.objects, 'bulk_create', side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                order_archive.archive_orders(months=0)
+        self.assertTrue(Order.objects.filter(pk=order.pk).exists())
+        self.assertEqual(Payment.objects.filter(order=order).count(), 1)
+        self.assertFalse(ArchivedOrder.objects.exists())
+        self.assertFalse(ArchivedPayment.objects.exists())
+
+class ReconciliationTests(TestCase):
+    """Gateway report rows are matched against live and archived payments"""
+
+    def test_archived_payments_are_not_unknown(self):
+        user = User.objects.create(mobile='9000000003', username='9000000003')
+        address = Address.objects.create(
+            user=user, full_name='Test User', mobile='9000000003', pincode='411001',
+            address_line1='1 Test Road', city='Pune', state='Maharashtra',
+        )
+        orders = [
+            Order.objects.create(user=user, shipping_address=address, status='delivered',
+                                 subtotal=Decimal('100.00'), total_amount=Decimal('118.00'))
+            for _ in range(2)
+        ]
+        payments = [Payment.objects.create(order=order, payment_method='upi', status='completed',
+                                           amount=order.total_amount) for order in orders]
+        self.assertEqual(order_archive.archive_orders(months=0), 2)
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        report = os.path.join(directory.name, 'report.csv')
+        unknown = uuid.uuid4()
+        with open(report, 'w') as f:
+            f.write('payment_id,transaction_id,status,amount\n')
+            f.write(f'{payments[0].pk},txn_1,captured,118.00\n')
+            f.write(f'{payments[1].pk},txn_2,refunded,118.00\n')
+            f.write(f'{unknown},txn_3,captured,10.00\n')
+        output = io.StringIO()
+        summary = reconciliation.reconcile(report, output)
+
+        self.assertEqual((summary['archived'], summary['unknown_payment']), (2, 1))
+        rows = list(csv.reader(output.getvalue().splitlines()))[1:]
+        self.assertEqual([(row[0], row[1]) for row in rows], [
+            ('archived_payment_mismatch', str(payments[1].pk)), ('unknown_payment', str(unknown)),
+        ])
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), CACHE_WARMING_ENABLED=False)
+class RenditionInvalidationTests(TestCase):
+    """A burst of finished renditions invalidates the listings once"""
+
+    def test_renditions_share_one_invalidation(self):
+        cache.clear()
+        category = Category.objects.create(name='Image Category')
+        product = Product.objects.create(name='Pictured', sku='IMG-1', category=category,
+                                         description='Test product', price=Decimal('1.00'))
+        image_pks = []
+        for color in ('red', 'green', 'blue'):
+            data = io.BytesIO()
+            Image.new('RGB', (40, 40), color).save(data, 'PNG')
+            image_pks.append(ProductImage.objects.create(
+                product=product, image=SimpleUploadedFile(f'{color}.png', data.getvalue()),
+            ).pk)
+
+        label = 'bhushan_web_app.productimage'
+        with mock.patch.object(tasks.invalidate_image_caches, 'apply_async') as queued:
+            for pk in image_pks:
+                images.process_image(label, pk, debounce=True)
+            self.assertEqual(queued.call_count, 1)
+            self.assertEqual(queued.call_args.kwargs['kwargs'], {'tag': 'products'})
+
+            # Once the queued run starts, the next rendition queues another
+            images.flush_invalidation('products')
+            images.process_image(label, image_pks[0], debounce=True, force=True)
+            self.assertEqual(queued.call_count, 2)
+        self.assertTrue(all(ProductImage.objects.values_list('renditions', flat=True)))
+
+
+@override_settings(ALLOWED_HOSTS=['testserver', 'shop.example'], COMPRESS_ENABLED=False, COMPRESS_OFFLINE=False)
+class PageCacheKeyTests(TestCase):
+    """Cached pages are keyed by absolute URL and the parameters they read"""
+
+    def page_cache_key(self, path, **extra):
+        view = views.CategoryProductsView()
+        view.setup(RequestFactory().get(path, **extra), slug='phones')
+        return view.page_cache_key()
+
+    def test_key_ignores_unread_parameters(self):
+        self.assertEqual(self.page_cache_key('/category/phones/products/?page=2&utm_source=mail'),
+                         self.page_cache_key('/category/phones/products/?page=2'))
+        self.assertNotEqual(self.page_cache_key('/category/phones/products/?page=2'),
+                            self.page_cache_key('/category/phones/products/'))
+
+    def test_key_includes_scheme_and_host(self):
+        path = '/category/phones/products/'
+        keys = {
+            self.page_cache_key(path),
+            self.page_cache_key(path, secure=True),
+            self.page_cache_key(path, HTTP_HOST='shop.example'),
+        }
+        self.assertEqual(len(keys), 3)
+
+    def test_cached_page_carries_its_own_absolute_urls(self):
+        cache.clear()
+        response = self.client.get('/?utm_source=mail')
+        self.assertContains(response, '<link rel="canonical" href="http://testserver/">')
+
+        response = self.client.get('/', secure=True, headers={'host': 'shop.example'})
+        self.assertContains(response, '<link rel="canonical" href="https://shop.example/">')
+        self.assertContains(response, '<meta property="og:url" content="https://shop.example/">')
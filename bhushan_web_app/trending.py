@@ -0,0 +1,239 @@
+# trending.py
+# Time-decayed trending scores.
+#
+# Order items and product views are counted into hourly Redis sorted sets
+# (trending:h:<hour>, member = product id). Buckets expire after the
+# trending window. A periodic Celery task (tasks.materialize_trending)
+# merges the buckets with ZUNIONSTORE, weighting each hour by
+# 0.5 ** (age / half-life), and stores the top products overall and per
+# category (rolled up to ancestor categories) in trending:top:<scope>.
+# Readers take a ranked slice of one of those sets (ZREVRANGE); when nothing
+# has been materialized yet they fall back to the all-time sales_count.
+# Without a Redis cache (tests, benchmarks) an in-process store is used.
+
+from collections import defaultdict
+import logging
+import threading
+import time
+import uuid
+
+from django.db import transaction
+from django.db.models import Prefetch
+
+from .cache_utils import SharedStore
+from .invalidation import coalesce_invalidations, mark_dirty
+
+logger = logging.getLogger(__name__)
+
+TRENDING_KEY_PREFIX = 'trending:'
+HALF_LIFE_HOURS = 24
+WINDOW_HOURS = 7 * 24        # buckets older than this are dropped
+TOP_N = 50                   # products kept per materialized list
+SCORED_LIMIT = 5000          # products ranked before the per-category split
+TOP_LIST_TIMEOUT = 6 * 3600  # lists outlive a few missed materializations
+SCORES_TIMEOUT = 60          # scratch set of one materialization
+ALL_SCOPE = 'all'
+
+# Event weights: a sale says more than a view
+SALE_WEIGHT = 5
+VIEW_WEIGHT = 1
+
+
+def current_hour():
+    return int(time.time() // 3600)
+
+
+# ==========================================
+# Stores
+# ==========================================
+
+class LocalTrendingStore:
+    """In-process store; used when no Redis cache is configured"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = defaultdict(lambda: defaultdict(float))
+        self._top = {}
+
+    def increment(self, hour, product_id, amount):
+        with self._lock:
+            self._buckets[hour][product_id] += amount
+
+    def decayed_scores(self, weights, limit):
+        totals = defaultdict(float)
+        with self._lock:
+            for hour, weight in weights.items():
+                for product_id, score in self._buckets.get(hour, {}).items():
+                    totals[product_id] += score * weight
+        return sorted(totals.items(), key=lambda item: -item[1])[:limit]
+
+    def replace_top(self, lists):
+        with self._lock:
+            self._top = {scope: [pid for pid, _ in ranked] for scope, ranked in lists.items()}
+
+    def top(self, scope, limit):
+        with self._lock:
+            return self._top.get(scope, [])[:limit]
+
+    def reset(self):
+        with self._lock:
+            self._buckets.clear()
+            self._top = {}
+
+
+class RedisTrendingStore:
+    """Hourly buckets and top lists as Redis sorted sets"""
+
+    def __init__(self, client):
+        self.client = client
+
+    def _bucket(self, hour):
+        return f'{TRENDING_KEY_PREFIX}h:{hour}'
+
+    def _top_key(self, scope):
+        return f'{TRENDING_KEY_PREFIX}top:{scope}'
+
+    def increment(self, hour, product_id, amount):
+        key = self._bucket(hour)
+        pipe = self.client.pipeline(transaction=False)
+        pipe.zincrby(key, amount, product_id)
+        pipe.expire(key, (WINDOW_HOURS + 1) * 3600)
+        pipe.execute()
+
+    def decayed_scores(self, weights, limit):
+        # Private scratch set, so concurrent materializations cannot clash;
+        # the expiry covers a worker dying between the commands
+        key = f'{TRENDING_KEY_PREFIX}scores:{uuid.uuid4().hex}'
+        pipe = self.client.pipeline(transaction=True)
+        pipe.zunionstore(key, {self._bucket(hour): weight for hour, weight in weights.items()})
+        pipe.expire(key, SCORES_TIMEOUT)
+        pipe.zrevrange(key, 0, limit - 1, withscores=True)
+        pipe.delete(key)
+        rows = pipe.execute()[2]
+        return [(pid.decode() if isinstance(pid, bytes) else pid, score) for pid, score in rows]
+
+    def replace_top(self, lists):
+        # One MULTI so readers never see a half-written list
+        pipe = self.client.pipeline(transaction=True)
+        for scope, ranked in lists.items():
+            key = self._top_key(scope)
+            pipe.delete(key)
+            if ranked:
+                pipe.zadd(key, dict(ranked))
+                pipe.expire(key, TOP_LIST_TIMEOUT)
+        pipe.execute()
+
+    def top(self, scope, limit):
+        ids = self.client.zrevrange(self._top_key(scope), 0, limit - 1)
+        return [pid.decode() if isinstance(pid, bytes) else pid for pid in ids]
+
+    def reset(self):
+        for key in self.client.scan_iter(match=TRENDING_KEY_PREFIX + '*'):
+            self.client.delete(key)
+
+
+_stores = SharedStore('Trending', RedisTrendingStore, LocalTrendingStore)
+# Redis store when the default cache is django-redis, otherwise local
+get_store = _stores.get
+reset_store = _stores.reset
+
+
+# ==========================================
+# Events
+# ==========================================
+
+def record_event(product_id, weight):
+    """Add ``weight`` to the product's score in the current hour"""
+    try:
+        get_store().increment(current_hour(), str(product_id), weight)
+    except Exception as e:
+        # Trending is best effort; never fail a checkout or page view over it
+        logger.warning(f"Could not record trending event for {product_id}: {e}")
+
+
+def record_view(product_id):
+    record_event(product_id, VIEW_WEIGHT)
+
+
+def record_sale(product_id, quantity=1):
+    """Count a sale once the order is committed"""
+    transaction.on_commit(lambda: record_event(product_id, SALE_WEIGHT * quantity))
+
+
+# ==========================================
+# Materialization
+# ==========================================
+
+def decay_weights(hour=None):
+    """{hour: weight} for every bucket in the window"""
+    hour = current_hour() if hour is None else hour
+    return {hour - age: 0.5 ** (age / HALF_LIFE_HOURS) for age in range(WINDOW_HOURS)}
+
+
+def materialize_trending():
+    """Rebuild the overall and per-category top lists; returns their count"""
+    from .catalog_stats import ancestor_ids
+    from .category_tree import get_category_index
+    from .models import Product
+
+    store = get_store()
+    scored = store.decayed_scores(decay_weights(), SCORED_LIMIT)
+
+    ids = [pid for pid, _ in scored]
+    categories = dict(
+        Product.objects.filter(id__in=ids, is_active=True).values_list('id', 'category_id')
+    ) if ids else {}
+    index = get_category_index()
+
+    lists = defaultdict(list)
+    for pid, score in scored:
+        category_id = categories.get(Product._meta.pk.to_python(pid))
+        if category_id is None:
+            continue  # inactive or deleted
+        scopes = [ALL_SCOPE]
+        row = index.rows.get(category_id)
+        scopes += ancestor_ids(row['path']) if row and row['path'] else [category_id]
+        for scope in scopes:
+            if len(lists[scope]) < TOP_N:
+                lists[scope].append((pid, score))
+
+    lists = {str(scope): ranked for scope, ranked in lists.items()}
+    lists.setdefault(ALL_SCOPE, [])
+    store.replace_top(lists)
+    with coalesce_invalidations():
+        mark_dirty('trending')
+    return len(lists)
+
+
+# ==========================================
+# Read
+# ==========================================
+
+def trending_ids(category_id=None, limit=20):
+    """Ranked product ids (strings), or [] before the first materialization"""
+    try:
+        return get_store().top(str(category_id) if category_id else ALL_SCOPE, limit)
+    except Exception as e:
+        logger.warning(f"Could not read trending list: {e}")
+        return []
+
+
+def trending_products(category_id=None, limit=20):
+    """
+    Trending products in rank order, with primary images; the all-time best
+    sellers when no trending list exists yet.
+    """
+    from .models import Product, ProductImage
+
+    queryset = Product.objects.filter(is_active=True).select_related('category', 'brand').prefetch_related(
+        Prefetch('images', queryset=ProductImage.objects.filter(is_primary=True), to_attr='primary_images')
+    )
+    ids = trending_ids(category_id, limit)
+    if ids:
+        products = queryset.in_bulk(ids)
+        return [products[pid] for pid in map(Product._meta.pk.to_python, ids) if pid in products]
+
+    if category_id:
+        from .category_tree import get_descendant_ids
+        queryset = queryset.filter(category_id__in=get_descendant_ids(category_id) or [category_id])
+    return list(queryset.filter(sales_count__gt=0).order_by('-sales_count', '-created_at')[:limit])
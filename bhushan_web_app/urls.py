@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from . import views
@@ -39,13 +40,16 @@ urlpatterns = [
     path('privacy-policy/', views.privacy_policy_view, name='privacy-policy'),
     path('terms-conditions/', views.terms_conditions_view, name='terms-conditions'),
     path('return-policy/', views.return_policy_view, name='return-policy'),
+    path('metrics', views.metrics_view, name='metrics'),
+    path(f"{settings.MEDIA_URL.strip('/')}/renditions/<path:name>", views.rendition_view, name='image-rendition'),
 
     # ==================== Product Pages ====================
     path('products/', ProductsView.as_view(), name='products'),
-    path('products/<slug:slug>/', ProductDetailView.as_view(), name='product-detail'),
+    # Fixed paths first; products/<slug>/ would swallow them
     path('products/featured/', views.FeaturedProductsView.as_view(), name='featured-products'),
     path('products/trending/', views.TrendingProductsView.as_view(), name='trending-products'),
     path('products/search/', views.ProductSearchView.as_view(), name='product-search'),
+    path('products/<slug:slug>/', ProductDetailView.as_view(), name='product-detail'),
     path('products/<uuid:pk>/track-view/', views.TrackProductViewView.as_view(), name='track-view'),
     path('api/products/filtered/', get_filtered_products, name='api-filtered-products'),
 
@@ -119,6 +123,9 @@ urlpatterns = [
     path('brands/', views.BrandListView.as_view(), name='brand-list'),
     path('brands/<slug:slug>/products/', views.BrandProductsView.as_view(), name='brand-products'),
 
+    # ==================== Reports ====================
+    path('api/reports/sales/', views.SalesReportView.as_view(), name='sales-report'),
+
     # ==================== API Router ====================
     path('api/', include(router.urls)),
 ]
\ No newline at end of file
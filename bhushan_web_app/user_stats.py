@@ -0,0 +1,131 @@
+# user_stats.py
+# Per-user account counters for the dashboard API and the profile page.
+#
+# Every counter comes from one query on the users table: conditional
+# aggregates over the user's orders, plus scalar subqueries for archived
+# orders and the wishlist, cart and address counts (subqueries, so those
+# joins do not multiply the order rows). The result is cached per user and
+# dropped after the user's orders, wishlist, cart items or addresses change
+# (signals.py).
+
+import logging
+import threading
+
+from django.db import transaction
+from django.db.models import Count, DecimalField, IntegerField, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from .cache_utils import CACHE_TIMEOUT, CacheKeys, CacheManager
+
+logger = logging.getLogger(__name__)
+
+EMPTY_USER_STATS = {
+    'total_orders': 0,
+    'pending_orders': 0,
+    'completed_orders': 0,
+    'cancelled_orders': 0,
+    'total_spent': 0,
+    'wishlist_count': 0,
+    'cart_items': 0,
+    'address_count': 0,
+}
+
+
+def _scalar(queryset, aggregate, output_field=None):
+    """Correlated ``aggregate`` over ``queryset`` (filtered on OuterRef), 0 when empty"""
+    output_field = output_field or IntegerField()
+    subquery = queryset.order_by().annotate(total=aggregate).values('total')[:1]
+    return Coalesce(Subquery(subquery, output_field=output_field), Value(0), output_field=output_field)
+
+
+def _archived(aggregate, output_field=None):
+    """``aggregate`` over the user's archived orders (order_archive.py)"""
+    from .models import ArchivedOrder
+
+    return _scalar(ArchivedOrder.objects.filter(user=OuterRef('pk')).values('user'), aggregate, output_field)
+
+
+def compute_user_stats(user_id):
+    """EMPTY_USER_STATS keys for ``user_id``, one query"""
+    from .models import Address, CartItem, User, Wishlist
+
+    delivered = Q(orders__status='delivered')
+    money = DecimalField(max_digits=12, decimal_places=2)
+    row = (
+        User.objects.filter(pk=user_id)
+        .annotate(
+            # Archived orders are final, so never pending
+            total_orders=Count('orders') + _archived(Count('id')),
+            pending_orders=Count('orders', filter=Q(orders__status='pending')),
+            completed_orders=(
+                Count('orders', filter=delivered)
+                + _archived(Count('id', filter=Q(status='delivered')))
+            ),
+            cancelled_orders=(
+                Count('orders', filter=Q(orders__status='cancelled'))
+                + _archived(Count('id', filter=Q(status='cancelled')))
+            ),
+            total_spent=(
+                Coalesce(Sum('orders__total_amount', filter=delivered), Value(0), output_field=money)
+                + _archived(Sum('total_amount', filter=Q(status='delivered')), money)
+            ),
+            wishlist_count=_scalar(
+                Wishlist.objects.filter(user=OuterRef('pk')).values('user'), Count('id'),
+            ),
+            cart_items=_scalar(
+                CartItem.objects.filter(cart__user=OuterRef('pk')).values('cart'), Sum('quantity'),
+            ),
+            address_count=_scalar(
+                Address.objects.filter(user=OuterRef('pk')).values('user'), Count('id'),
+            ),
+        )
+        .values(*EMPTY_USER_STATS)
+        .first()
+    )
+    return row or dict(EMPTY_USER_STATS)
+
+
+def get_user_stats(user_id):
+    """Cached compute_user_stats()"""
+    key = CacheKeys.user_stats(user_id)
+    stats = CacheManager.get(key)
+    if stats is None:
+        stats = compute_user_stats(user_id)
+        CacheManager.set(key, stats, CACHE_TIMEOUT)
+    return stats
+
+
+def invalidate_user_stats(user_id):
+    """Drop the user's cached counters once the current transaction commits"""
+    if user_id is not None:
+        transaction.on_commit(lambda: CacheManager.delete(CacheKeys.user_stats(user_id)))
+
+
+_pending_carts = threading.local()
+
+
+def invalidate_cart_stats(cart_item):
+    """
+    invalidate_user_stats() for the owner of ``cart_item``'s cart. Carts that
+    are not loaded already are looked up after commit, in one query for all
+    of them, so clearing a cart item by item does not load it once per item.
+    """
+    if type(cart_item).cart.is_cached(cart_item):
+        invalidate_user_stats(cart_item.cart.user_id)
+        return
+    if not hasattr(_pending_carts, 'ids'):
+        _pending_carts.ids = set()
+    _pending_carts.ids.add(cart_item.cart_id)
+    # Every registration flushes whatever is pending; the later ones find an
+    # empty set, and ids left by a rollback go with the next flush
+    transaction.on_commit(_flush_cart_stats)
+
+
+def _flush_cart_stats():
+    from .models import Cart
+
+    cart_ids, _pending_carts.ids = getattr(_pending_carts, 'ids', set()), set()
+    if not cart_ids:
+        return
+    user_ids = Cart.objects.filter(pk__in=cart_ids).values_list('user_id', flat=True)
+    CacheManager.delete_many([CacheKeys.user_stats(user_id) for user_id in user_ids])
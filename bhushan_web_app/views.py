@@ -2,13 +2,14 @@ from django.shortcuts import render
 import random
 from datetime import timedelta
 from django.utils import timezone
+from django.db import transaction
 from django.db.models import Q, Count, Avg, Sum, F, Prefetch,Case,When,Value,DecimalField
 from django.shortcuts import get_object_or_404,render,redirect
 from rest_framework import viewsets, generics, status, filters
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.permissions import IsAuthenticated, IsAdminUser, AllowAny
 from rest_framework.pagination import PageNumberPagination
 from rest_framework_simplejwt.tokens import RefreshToken
 from django_filters.rest_framework import DjangoFilterBackend
@@ -17,10 +18,15 @@ from rest_framework.decorators import api_view
 from django.core.cache import cache
 from .pagination import StandardResultsSetPagination
 import json
+from decimal import Decimal
 import hashlib
+import uuid
 from django.contrib.auth import get_user_model,login,logout
 
 from django.contrib import messages
+from django.core.files.storage import default_storage
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseForbidden
+from django.utils.decorators import method_decorator
 from django.db.models.signals import post_save, post_delete
 
 
@@ -28,14 +34,23 @@ from django.db.models.signals import post_save, post_delete
 
 from .tasks import send_otp_sms_task
 
-from django.utils.functional import cached_property
 
+from . import catalog, order_status, payment_events
 from .cache_utils import CacheManager, CacheKeys
+from .catalog_version import catalog_condition, category_scope
+from .page_cache import CachedPageMixin
+from .recommendations import MAX_NEIGHBORS
+from .trending import TOP_N as TRENDING_TOP_N, record_view
+from .idempotency import idempotent
+from .order_archive import get_order_or_404, has_purchased
+from .user_stats import get_user_stats
+from .warming import record_usage
+from .images import FORMATS, RENDITION_CACHE_CONTROL, RENDITION_DIR, RENDITION_NAME_RE
 
 from .models import (
     User, OTP, Address, Category, Brand, Product, ProductImage,
     ProductVariation, Cart, CartItem, Order, OrderItem, Payment,
-    OrderTracking, Wishlist, RecentlyViewed, Review,ContactMessage
+    OrderTracking, Wishlist, RecentlyViewed, Review,ContactMessage, ArchivedOrder
 )
 
 from .forms import(
@@ -44,26 +59,14 @@ OTPVerifyForm,ContactForm,AddressForm, UserProfileForm, ProfileCompletionForm
 )
     
 from .serializers import (
-    UserSerializer, OTPSerializer, AddressSerializer, CategorySerializer,
+    UserSerializer, OTPSerializer, AddressSerializer, CategorySerializer, category_node_data,
+    with_order_details, with_order_summary,
     BrandSerializer, ProductSerializer, ProductDetailSerializer, CartSerializer,
     CartItemSerializer, OrderSerializer, OrderDetailSerializer, PaymentSerializer,
     WishlistSerializer, ReviewSerializer, RecentlyViewedSerializer
 )
 from .filters import ProductFilter
 
-from .cache_utils import (
-    get_all_products_cached,
-    get_featured_products_cached,
-    get_new_arrivals_cached,
-    get_top_selling_products_cached,
-    get_active_categories_cached,
-    get_active_brands_cached,
-    get_price_range_cached,
-    get_mega_menu_categories_cached,
-    CacheKeys,
-    CacheManager,
-    NEW_PRODUCT_DAYS,
-)
 
 
 from django.conf import settings
@@ -127,39 +130,56 @@ def return_policy_view(request):
     return render(request, 'pages/return_policy.html')
 
 
+def metrics_view(request):
+    """
+    Prometheus scrape endpoint. Access is limited to METRICS_ALLOWED_IPS
+    and/or a bearer token matching METRICS_TOKEN.
+    """
+    from .metrics import REGISTRY
 
+    allowed_ips = getattr(settings, 'METRICS_ALLOWED_IPS', [])
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    ip_ok = request.META.get('REMOTE_ADDR') in allowed_ips
+    token_ok = bool(token) and request.headers.get('Authorization') == f'Bearer {token}'
+    if not (ip_ok or token_ok):
+        return HttpResponseForbidden()
 
-class ProductsView(TemplateView):
-    template_name = "pages/sample.html"
-    CACHE_TIMEOUT = 3600
+    return HttpResponse(REGISTRY.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
 
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
 
-        # Cache key
-        cache_key = "all_products_with_primary_images"
-        products = cache.get(cache_key)
+def rendition_view(request, name):
+    """
+    Serve a content-addressed image rendition with far-future caching.
+    Renditions never change under a name, so browsers and CDNs may keep
+    them forever. (A front proxy serving MEDIA_ROOT should send the same
+    Cache-Control for /media/renditions/.)
+    """
+    if not RENDITION_NAME_RE.match(name):
+        raise Http404
+    path = f'{RENDITION_DIR}/{name}'
+    if not default_storage.exists(path):
+        raise Http404
+    response = FileResponse(default_storage.open(path, 'rb'), content_type=FORMATS[name.rsplit('.', 1)[1]][1])
+    response['Cache-Control'] = RENDITION_CACHE_CONTROL
+    return response
 
-        if products is None:
-            primary_image_qs = ProductImage.objects.filter(is_primary=True)
 
-            products = (
-                Product.objects.filter(is_active=True)
-                .select_related("category", "brand")
-                .prefetch_related(
-                    Prefetch("images", queryset=primary_image_qs, to_attr="primary_images")
-                )
-            )
 
-            # Cache product queryset as list to avoid QuerySet re-evaluation
-            cache.set(cache_key, list(products), self.CACHE_TIMEOUT)
 
-        context['products'] = products
+class ProductsView(CachedPageMixin, TemplateView):
+    template_name = "pages/sample.html"
+    # Read by the template's filter form
+    page_cache_params = ("q", "category", "sort")
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+
+        context['products'] = catalog.storefront_products()
 
         # Other cached filters
-        context['categories'] = get_active_categories_cached()
-        context['brands'] = get_active_brands_cached()
-        context['price_range'] = get_price_range_cached()
+        context['categories'] = catalog.category_tree()
+        context['brands'] = catalog.active_brands()
+        context['price_range'] = catalog.price_range()
 
         return context
 
@@ -279,124 +299,35 @@ class ProductsView(TemplateView):
 #     return Response({'products': products_list})
 
 
+def filtered_products_scopes(request):
+    # A category filter only depends on that category's listings
+    scope = category_scope(request.GET['category']) if request.GET.get('category') else None
+    scopes = [scope, 'brand_details'] if scope else ['products']
+    if request.GET.get('tab') == 'top_selling':
+        scopes.append('trending')
+    return scopes
+
+
+# "new" tab and is_new flags move with the date, not only with the catalog
+@catalog_condition(filtered_products_scopes, validators=lambda request: [timezone.localdate()])
 @api_view(['GET'])
 def get_filtered_products(request):
     """API endpoint for AJAX product filtering with caching"""
     
     # Get filter parameters
-    category_id = request.GET.get('category')
-    brand_id = request.GET.get('brand')
-    tab = request.GET.get('tab', 'all')
-    search = request.GET.get('search', '')
-    min_price = int(request.GET.get('min_price', 0))
-    max_price = int(request.GET.get('max_price', 999999))
-    sort = request.GET.get('sort', '-is_featured')
-    
-    # Generate cache key from parameters
-    cache_key = CacheKeys.filtered_products_key(
-        category_id, brand_id, tab, search, min_price, max_price, sort
-    )
-    
-    # Check cache first
-    cached_products = CacheManager.get(cache_key)
-    if cached_products is not None:
-        return Response({'products': cached_products})
+    params = {
+        'category': request.GET.get('category'),
+        'brand': request.GET.get('brand'),
+        'tab': request.GET.get('tab', 'all'),
+        'search': request.GET.get('search', ''),
+        'min_price': int(request.GET.get('min_price', 0)),
+        'max_price': int(request.GET.get('max_price', 999999)),
+        'sort': request.GET.get('sort', '-is_featured'),
+    }
+    # Popular combinations are replayed by the cache warmer
+    record_usage('filtered_products', params)
     
-    # Build query
-    queryset = Product.objects.filter(is_active=True)
-    
-    new_date = timezone.now() - timedelta(days=NEW_PRODUCT_DAYS)
-    
-    # Apply filters based on tab
-    if tab == 'new':
-        queryset = queryset.filter(created_at__gte=new_date)
-    elif tab == 'featured':
-        queryset = queryset.filter(is_featured=True)
-    elif tab == 'sale':
-        queryset = queryset.filter(compare_price__gt=F('price'))
-    elif tab == 'top_selling':
-        queryset = queryset.filter(sales_count__gt=0)
-    
-    if category_id:
-        queryset = queryset.filter(category_id=category_id)
-    
-    if brand_id:
-        queryset = queryset.filter(brand_id=brand_id)
-    
-    if search:
-        queryset = queryset.filter(
-            Q(name__icontains=search) | Q(description__icontains=search) |
-            Q(short_description__icontains=search) | Q(sku__icontains=search)
-        )
-    
-    # Price filter with annotations
-    queryset = queryset.annotate(
-        sale_price=Case(
-            When(compare_price__gt=0, then='compare_price'),
-            default='price',
-            output_field=DecimalField()
-        ),
-        is_new=Case(
-            When(created_at__gte=new_date, then=Value(True)),
-            default=Value(False)
-        )
-    ).filter(sale_price__gte=min_price, sale_price__lte=max_price)
-    
-    # Optimize query with prefetch
-    primary_image_qs = ProductImage.objects.filter(is_primary=True)
-    
-    # Determine sort order
-    if sort == '-sales_count':
-        order_by = ['-sales_count', '-created_at']
-    elif sort == 'price':
-        order_by = ['price']
-    elif sort == '-price':
-        order_by = ['-price']
-    elif sort == 'name':
-        order_by = ['name']
-    else:
-        order_by = ['-is_featured', '-sales_count', '-created_at']
-    
-    # Fetch products (as objects, not values)
-    products = queryset.select_related(
-        "category", "brand"
-    ).prefetch_related(
-        Prefetch("images", queryset=primary_image_qs, to_attr="primary_images")
-    ).order_by(*order_by)[:100]
-    
-    # Serialize products manually for API response
-    products_list = []
-    for product in products:
-        # Get primary image URL
-        primary_image = None
-        if hasattr(product, 'primary_images') and product.primary_images:
-            primary_image = product.primary_images[0].image.url
-        
-        # Check if product is new
-        is_new_product = product.created_at >= new_date
-        
-        products_list.append({
-            'id': str(product.id),
-            'name': product.name,
-            'slug': product.slug,
-            'price': str(product.price),
-            'compare_price': str(product.compare_price) if product.compare_price else None,
-            'is_featured': product.is_featured,
-            'is_new': is_new_product,  # Added is_new field
-            'stock': product.stock,
-            'sales_count': product.sales_count,
-            'category__name': product.category.name if product.category else None,
-            'category_name': product.category.name if product.category else None,
-            'brand_name': product.brand.name if product.brand else None,
-            'primary_image': primary_image,
-            'discount_percentage': product.discount_percentage,
-            'is_low_stock': product.is_low_stock,
-        })
-    
-    # Cache the results (cache for 1 hour)
-    CacheManager.set(cache_key, products_list, timeout=3600)
-    
-    return Response({'products': products_list})
+    return Response({'products': catalog.filtered_products(**params)})
 
 
 
@@ -408,94 +339,32 @@ def get_filtered_products(request):
 
 
 
-class HomeView(TemplateView):
+class HomeView(CachedPageMixin, TemplateView):
     template_name = "index.html"
+
+    def page_cache_scopes(self):
+        return ['products', 'categories', 'trending']
+
+    def page_cache_validators(self):
+        # New arrivals are relative to today
+        return [timezone.localdate()]
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         
-        # Featured products with cache
-        context['featured_products'] = self._get_featured_products()
-        
-        # New arrivals with cache
-        context['new_arrivals'] = self._get_new_arrivals()
-        
-        # Top selling with cache
-        context['top_selling'] = self._get_top_selling()
+        # Catalog read service; the same entries are kept warm by warming.py
+        context['featured_products'] = catalog.featured_products()
+        context['new_arrivals'] = catalog.new_arrivals()
+        context['top_selling'] = catalog.top_selling()
         
         # Categories for mega menu
         context['categories'] = self._get_cached_categories()
         
         return context
     
-    def _get_featured_products(self):
-        """Get featured products with caching"""
-        cache_key = 'featured_products_home'
-        featured = cache.get(cache_key)
-        
-        if featured is None:
-            primary_image_qs = ProductImage.objects.filter(is_primary=True)
-            featured = list(
-                Product.objects.filter(is_active=True, is_featured=True)
-                .select_related("category", "brand")
-                .prefetch_related(
-                    Prefetch("images", queryset=primary_image_qs, to_attr="primary_images")
-                ).order_by('-created_at')[:8]
-            )
-            cache.set(cache_key, featured, CACHE_TIMEOUT)
-        
-        return featured
-    
-    def _get_new_arrivals(self):
-        """Get new arrival products with caching"""
-        cache_key = 'new_arrivals_home'
-        new = cache.get(cache_key)
-        
-        if new is None:
-            new_date = timezone.now() - timedelta(days=NEW_PRODUCT_DAYS)
-            primary_image_qs = ProductImage.objects.filter(is_primary=True)
-            new = list(
-                Product.objects.filter(is_active=True, created_at__gte=new_date)
-                .select_related("category", "brand")
-                .prefetch_related(
-                    Prefetch("images", queryset=primary_image_qs, to_attr="primary_images")
-                ).order_by('-created_at')[:8]
-            )
-            cache.set(cache_key, new, CACHE_TIMEOUT)
-        
-        return new
-    
-    def _get_top_selling(self):
-        """Get top selling products with caching"""
-        cache_key = 'top_selling_home'
-        top = cache.get(cache_key)
-        
-        if top is None:
-            primary_image_qs = ProductImage.objects.filter(is_primary=True)
-            top = list(
-                Product.objects.filter(is_active=True, sales_count__gt=0)
-                .select_related("category", "brand")
-                .prefetch_related(
-                    Prefetch("images", queryset=primary_image_qs, to_attr="primary_images")
-                ).order_by('-sales_count', '-created_at')[:8]
-            )
-            cache.set(cache_key, top, CACHE_TIMEOUT)
-        
-        return top
-    
     def _get_cached_categories(self):
-        """Get categories with caching"""
-        cache_key = 'categories_mega_menu'
-        categories = cache.get(cache_key)
-        
-        if categories is None:
-            categories = list(
-                Category.objects.filter(is_active=True, parent=None)
-                .prefetch_related('children')[:4]
-            )
-            cache.set(cache_key, categories, CACHE_TIMEOUT)
-        
-        return categories
+        """Mega menu categories from the category tree service"""
+        return catalog.mega_menu()
 
 
 
@@ -682,6 +551,15 @@ class SetDefaultAddressView(APIView):
 
 
 # ==================== Product Views ====================
+@method_decorator(catalog_condition(lambda request, **kw: ['products', 'reviews']), name='list')
+@method_decorator(
+    catalog_condition(lambda request, pk=None, **kw: [f'product:{pk}', 'categories', 'brand_details']),
+    name='retrieve',
+)
+@method_decorator(
+    catalog_condition(lambda request, pk=None, **kw: [f'product:{pk}', 'products', 'reviews', 'recommendations']),
+    name='related',
+)
 class ProductViewSet(viewsets.ReadOnlyModelViewSet):
     """Product ViewSet"""
     serializer_class = ProductSerializer
@@ -697,11 +575,30 @@ class ProductViewSet(viewsets.ReadOnlyModelViewSet):
             'category', 'brand'
         ).prefetch_related('images', 'variations')
 
-  
+    @action(detail=True, methods=['get'])
+    def related(self, request, pk=None):
+        """Related and frequently-bought-together products"""
+        product = get_object_or_404(Product.objects.only('id', 'category_id'), pk=pk, is_active=True)
+        try:
+            limit = min(max(int(request.query_params.get('limit', 4)), 1), MAX_NEIGHBORS)
+        except ValueError:
+            limit = 4
+        related, together = catalog.recommendations(product, limit=limit)
+        context = self.get_serializer_context()
+        return Response({
+            'related': ProductSerializer(related, many=True, context=context).data,
+            'bought_together': ProductSerializer(together, many=True, context=context).data,
+        })
+
 
 
 
-class ProductDetailView(DetailView):
+def product_detail_scopes(request, slug=None, **kwargs):
+    return ['products', 'categories', 'recommendations', f'product:{slug}']
+
+
+@method_decorator(catalog_condition(product_detail_scopes, anonymous_only=True), name='dispatch')
+class ProductDetailView(CachedPageMixin, DetailView):
     """Product detail page - renders HTML template"""
     model = Product
     template_name = 'product/product_display.html'
@@ -728,7 +625,7 @@ class ProductDetailView(DetailView):
         # Get approved reviews
         context['reviews'] = product.reviews.filter(
             is_approved=True
-        ).select_related('user').prefetch_related('images').order_by('-created_at')[:10]
+        ).select_related('user').order_by('-created_at')[:10]
         
         # Calculate average rating
         reviews = context['reviews']
@@ -743,33 +640,32 @@ class ProductDetailView(DetailView):
         # Get product variations
         context['variations'] = product.variations.filter(is_active=True)
         
-        # Get related products (same category)
-        context['related_products'] = Product.objects.filter(
-            category=product.category,
-            is_active=True
-        ).exclude(id=product.id).select_related('category', 'brand').prefetch_related('images')[:4]
+        # Precomputed neighbors (recommendations.py), one lookup
+        context['related_products'], context['bought_together'] = catalog.recommendations(product)
+        
+        self.track_view(product.id)
+        # The wishlist icon is a page-cache hole (page_cache.wishlist_icon_hole)
         
-        # Track view (only for authenticated users)
+        return context
+
+    def track_view(self, product_id):
+        """Feed trending; count the view and update recently viewed (authenticated users only)"""
+        record_view(product_id)
         if self.request.user.is_authenticated:
-            # Increment view count
-            Product.objects.filter(id=product.id).update(views_count=F('views_count') + 1)
-            
-            # Add to recently viewed
+            Product.objects.filter(id=product_id).update(views_count=F('views_count') + 1)
             RecentlyViewed.objects.update_or_create(
                 user=self.request.user,
-                product=product
+                product_id=product_id
             )
-        
-        # Check if product is in wishlist
-        if self.request.user.is_authenticated:
-            context['in_wishlist'] = Wishlist.objects.filter(
-                user=self.request.user,
-                product=product
-            ).exists()
-        else:
-            context['in_wishlist'] = False
-        
-        return context
+
+    def page_cache_scopes(self):
+        return product_detail_scopes(self.request, **self.kwargs)
+
+    def page_cache_meta(self):
+        return {'product_id': str(self.object.id)}
+
+    def page_cache_hit(self, meta):
+        self.track_view(meta['product_id'])
 
 
 # IMPORTANT: Also add this API view for AJAX requests if needed
@@ -798,13 +694,16 @@ class FeaturedProductsView(generics.ListAPIView):
         ).order_by('-created_at')
 
 
+@method_decorator(catalog_condition(lambda request, **kw: ['trending', 'products', 'reviews']), name='dispatch')
 class TrendingProductsView(generics.ListAPIView):
-    """Trending products based on sales"""
+    """Trending products (time-decayed sales and views), optionally per ?category="""
     serializer_class = ProductSerializer
     pagination_class = StandardResultsSetPagination
 
     def get_queryset(self):
-        return Product.objects.filter(is_active=True).order_by('-sales_count')[:20]
+        category = self.request.query_params.get('category')
+        category_id = uuid.UUID(category) if category and category_scope(category) else None
+        return catalog.trending_products(category_id, limit=TRENDING_TOP_N)
 
 
 class ProductSearchView(generics.ListAPIView):
@@ -839,6 +738,7 @@ class TrackProductViewView(APIView):
             user=request.user,
             product=product
         )
+        record_view(product.pk)
         
         return Response({'message': 'View tracked'}, status=status.HTTP_200_OK)
 
@@ -847,80 +747,41 @@ class TrackProductViewView(APIView):
 
 
 
+@method_decorator(catalog_condition(lambda request, **kw: ['categories'], anonymous_only=True),
+                  name='dispatch')
 class CategoryTreeView(TemplateView):
-    """Render nested categories using cached tree."""
-    template_name = "tree/category_tree.html"  # <-- your template path
+    """Render nested categories from the shared category tree service."""
+    template_name = "pages/tree/category_tree.html"
 
-    # -------------------------
-    # 📌 Core Cache Key
-    # -------------------------
-    CACHE_KEY = "categories:tree:cached"
-
-    # -------------------------
-    # The main request response
-    # -------------------------
     def get_context_data(self, **kwargs):
         ctx = super().get_context_data(**kwargs)
-        ctx["category_tree"] = self.category_tree  # final tree passed to template
+        ctx["category_tree"] = catalog.category_tree()
         return ctx
 
-    # =========================
-    # TREE GENERATOR WITH CACHE
-    # =========================
-    @cached_property
-    def category_tree(self):
-        """
-        Get cached category tree, else build and store into cache.
-        Always returns a list of nested dictionaries with children.
-        """
-
-        cached_tree = CacheManager.get(self.CACHE_KEY)
-        if cached_tree:
-            return cached_tree   # 🔥 FAST RETURN — CACHE HIT
-
-        # =========================
-        # STEP 1 — Fetch DB Items
-        # =========================
-        categories = Category.objects.filter(is_active=True)\
-                                     .select_related('parent')\
-                                     .prefetch_related('children')\
-                                     .order_by('display_order', 'name')
-
-        # =========================
-        # STEP 2 — Convert to dict
-        # =========================
-        nodes = {cat.id: {"id": cat.id,
-                          "name": cat.name,
-                          "slug": cat.slug,
-                          "children": []}
-                 for cat in categories}
-
-        roots = []  # top-level categories
-
-        # =========================
-        # STEP 3 — Attach children
-        # =========================
-        for cat in categories:
-            if cat.parent_id is None:
-                roots.append(nodes[cat.id])      # no parent → root node
-            else:
-                nodes[cat.parent_id]["children"].append(nodes[cat.id])  # attach under parent
-
-        # =========================
-        # STEP 4 — Store in cache
-        # =========================
-        CacheManager.set(self.CACHE_KEY, roots)
-
-        return roots
-
 
+# Rolled-up stats change with products
+@method_decorator(catalog_condition(lambda request, **kw: ['categories', 'products']), name='dispatch')
 class CategoryViewSet(viewsets.ReadOnlyModelViewSet):
-    """Category ViewSet"""
+    """Category ViewSet, served from the cached category index"""
     serializer_class = CategorySerializer
     lookup_field = 'slug'
 
     def get_queryset(self):
-        return Category.objects.filter(is_active=True).prefetch_related('children')
+        return Category.objects.filter(is_active=True)
+
+    def list(self, request, *args, **kwargs):
+        index = catalog.category_index()
+        stats = catalog.category_stats()
+        page = self.paginate_queryset(index.all_nodes())
+        data = [category_node_data(node, index, request, stats) for node in page]
+        return self.get_paginated_response(data)
+
+    def retrieve(self, request, *args, **kwargs):
+        index = catalog.category_index()
+        node = index.get_by_slug(kwargs[self.lookup_field])
+        if node is None:
+            raise Http404
+        return Response(category_node_data(node, index, request))
 
 
 # class CategoryTreeView(APIView):
@@ -933,40 +794,42 @@ class CategoryViewSet(viewsets.ReadOnlyModelViewSet):
 #         return Response(serializer.data)
 
 
-class CategoryProductsView(ListView):
+def category_products_scopes(request, slug=None, **kwargs):
+    row = catalog.category_index().get_by_slug(slug)
+    return [category_scope(row['id']), 'categories'] if row else ['categories']
+
+
+@method_decorator(catalog_condition(category_products_scopes, anonymous_only=True), name='dispatch')
+class CategoryProductsView(CachedPageMixin, ListView):
     template_name = "pages/category_page.html"
     context_object_name = "products"
     paginate_by = 10
+    page_cache_params = ("page",)
+
+    def page_cache_scopes(self):
+        return category_products_scopes(self.request, **self.kwargs)
 
     def get_category(self):
-        slug = self.kwargs["slug"]
-        key = f"category_obj_{slug}"
-
-        category = cache.get(key)
-        if not category:
-            category = get_object_or_404(
-                Category.objects.filter(is_active=True)
-                .prefetch_related("children"),
-                slug=slug
-            )
-            cache.set(key, category, 60 * 60)
-        return category
+        if not hasattr(self, "_category"):
+            index = catalog.category_index()
+            row = index.get_by_slug(self.kwargs["slug"])
+            if row is None:
+                raise Http404("Category not found")
+            self._category = index.node(row["id"])
+        return self._category
 
     def get_queryset(self):
+        # Products of the category and every subcategory below it; the id set
+        # comes from the cached category index, so this is one indexed query
+        # which the paginator slices.
         category = self.get_category()
-        key = f"category-products_{category.slug}"
-
-        products = cache.get(key)
-        if not products:
-            categories = [category] + list(category.children.filter(is_active=True))
-            products = (
-                Product.objects.filter(category__in=categories, is_active=True)
-                .select_related("category", "brand")
-                .prefetch_related("images")
-                .order_by("-created_at")
-            )
-            cache.set(key, products, 60 * 60)
-        return products
+        category_ids = catalog.get_descendant_ids(category.id) or [category.id]
+        return (
+            Product.objects.filter(category_id__in=category_ids, is_active=True)
+            .select_related("category", "brand")
+            .prefetch_related("images")
+            .order_by("-created_at")
+        )
 
     def get_context_data(self, **kwargs):
         ctx = super().get_context_data(**kwargs)
@@ -975,10 +838,12 @@ class CategoryProductsView(ListView):
         return ctx
 
 # ==================== Brand Views ====================
+@method_decorator(catalog_condition(lambda request, **kw: ['brands', 'products']), name='dispatch')
 class BrandListView(generics.ListAPIView):
     """List all brands"""
     serializer_class = BrandSerializer
-    queryset = Brand.objects.filter(is_active=True)
+    pagination_class = StandardResultsSetPagination
+    queryset = Brand.objects.filter(is_active=True).select_related('stats')
 
 
 class BrandProductsView(generics.ListAPIView):
@@ -1150,7 +1015,7 @@ class CartPageView(LoginRequiredMixin, TemplateView):
         # Calculate totals
         if cart_with_items and cart_with_items.items.exists():
             subtotal = cart_with_items.subtotal
-            tax = subtotal * 0.18  # 18% GST
+            tax = subtotal * Decimal('0.18')  # 18% GST
             shipping = 0 if subtotal >= 500 else 50
             total = subtotal + tax + shipping
             
@@ -1188,10 +1053,11 @@ class UserProfilePageView(LoginRequiredMixin, TemplateView):
             user=user
         ).order_by('-is_default', '-created_at')
         
-        # User statistics
-        context['total_orders'] = Order.objects.filter(user=user).count()
-        context['total_addresses'] = context['addresses'].count()
-        context['wishlist_count'] = Wishlist.objects.filter(user=user).count()
+        # User statistics (cached, see user_stats.py)
+        stats = get_user_stats(user.pk)
+        context['total_orders'] = stats['total_orders']
+        context['total_addresses'] = stats['address_count']
+        context['wishlist_count'] = stats['wishlist_count']
         
         return context
     
@@ -1457,13 +1323,25 @@ class RemoveFromWishlistView(APIView):
 
 
 # ==================== Order Views ====================
+def user_orders(request):
+    """The user's live orders, or archived ones with ?archived=true"""
+    model = ArchivedOrder if request.query_params.get('archived') == 'true' else Order
+    return model.objects.filter(user=request.user)
+
+
 class OrderViewSet(viewsets.ReadOnlyModelViewSet):
     """Order ViewSet"""
     serializer_class = OrderSerializer
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        return Order.objects.filter(user=self.request.user).order_by('-created_at')
+        return with_order_summary(user_orders(self.request)).order_by('-created_at')
+
+    def get_object(self):
+        # Old orders are read from the archive (order_archive.py)
+        order = get_order_or_404(self.request.user, self.kwargs['pk'], with_order_details)
+        self.check_object_permissions(self.request, order)
+        return order
 
     def get_serializer_class(self):
         if self.action == 'retrieve':
@@ -1478,7 +1356,7 @@ class OrderListView(generics.ListAPIView):
     pagination_class = StandardResultsSetPagination
 
     def get_queryset(self):
-        return Order.objects.filter(user=self.request.user).order_by('-created_at')
+        return with_order_summary(user_orders(self.request)).order_by('-created_at')
 
 
 class OrderDetailView(generics.RetrieveAPIView):
@@ -1486,16 +1364,17 @@ class OrderDetailView(generics.RetrieveAPIView):
     serializer_class = OrderDetailSerializer
     permission_classes = [IsAuthenticated]
 
-    def get_queryset(self):
-        return Order.objects.filter(user=self.request.user).prefetch_related(
-            'items', 'payments', 'tracking'
-        )
+    def get_object(self):
+        order = get_order_or_404(self.request.user, self.kwargs['pk'], with_order_details)
+        self.check_object_permissions(self.request, order)
+        return order
 
 
 class CreateOrderView(APIView):
     """Create order from cart"""
     permission_classes = [IsAuthenticated]
 
+    @idempotent
     def post(self, request):
         user = request.user
         cart = get_object_or_404(Cart, user=user)
@@ -1512,43 +1391,42 @@ class CreateOrderView(APIView):
 
         # Calculate totals
         subtotal = cart.subtotal
-        tax_amount = subtotal * 0.18  # 18% tax
+        tax_amount = subtotal * Decimal('0.18')  # 18% tax
         shipping_charge = 0 if subtotal > 500 else 50
         total_amount = subtotal + tax_amount + shipping_charge
 
-        # Create order
-        order = Order.objects.create(
-            user=user,
-            shipping_address=shipping_address,
-            billing_address=billing_address,
-            subtotal=subtotal,
-            tax_amount=tax_amount,
-            shipping_charge=shipping_charge,
-            total_amount=total_amount
-        )
-
-        # Create order items
-        for cart_item in cart.items.all():
-            OrderItem.objects.create(
-                order=order,
-                product=cart_item.product,
-                variation=cart_item.variation,
-                product_name=cart_item.product.name,
-                sku=cart_item.product.sku,
-                quantity=cart_item.quantity,
-                unit_price=cart_item.price,
-                total_price=cart_item.total_price
+        # All or nothing: a failure must not leave a partial order with stock
+        # taken (the idempotency key is released and the client retries)
+        with transaction.atomic():
+            # Create order
+            order = Order.objects.create(
+                user=user,
+                shipping_address=shipping_address,
+                billing_address=billing_address,
+                subtotal=subtotal,
+                tax_amount=tax_amount,
+                shipping_charge=shipping_charge,
+                total_amount=total_amount
             )
 
-        # Create order tracking
-        OrderTracking.objects.create(
-            order=order,
-            status='pending',
-            message='Order placed successfully'
-        )
+            # Create order items
+            for cart_item in cart.items.all():
+                OrderItem.objects.create(
+                    order=order,
+                    product=cart_item.product,
+                    variation=cart_item.variation,
+                    product_name=cart_item.product.name,
+                    sku=cart_item.product.sku,
+                    quantity=cart_item.quantity,
+                    unit_price=cart_item.price,
+                    total_price=cart_item.total_price
+                )
 
-        # Clear cart
-        cart.items.all().delete()
+            # Create order tracking
+            order_status.place(order)
+
+            # Clear cart
+            cart.items.all().delete()
 
         return Response({
             'message': 'Order created successfully',
@@ -1562,22 +1440,18 @@ class CancelOrderView(APIView):
 
     def post(self, request, pk):
         order = get_object_or_404(Order, pk=pk, user=request.user)
-        
-        if order.status not in ['pending', 'confirmed']:
+        reason = request.data.get('reason', '')
+
+        try:
+            order_status.transition(
+                order, 'cancelled',
+                message=f'Order cancelled: {reason}',
+                cancellation_reason=reason,
+            )
+        except order_status.InvalidTransition:
             return Response({'error': 'Cannot cancel this order'}, 
                           status=status.HTTP_400_BAD_REQUEST)
 
-        order.status = 'cancelled'
-        order.cancellation_reason = request.data.get('reason', '')
-        order.save()
-
-        # Create tracking entry
-        OrderTracking.objects.create(
-            order=order,
-            status='cancelled',
-            message=f'Order cancelled: {order.cancellation_reason}'
-        )
-
         return Response({'message': 'Order cancelled successfully'}, 
                        status=status.HTTP_200_OK)
 
@@ -1587,7 +1461,7 @@ class OrderTrackingView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request, pk):
-        order = get_object_or_404(Order, pk=pk, user=request.user)
+        order = get_order_or_404(request.user, pk)
         tracking = order.tracking.all().order_by('-created_at')
         
         tracking_data = [{
@@ -1605,32 +1479,30 @@ class InitiatePaymentView(APIView):
     """Initiate payment"""
     permission_classes = [IsAuthenticated]
 
+    @idempotent
     def post(self, request):
         order_id = request.data.get('order_id')
         payment_method = request.data.get('payment_method', 'cod')
         
         order = get_object_or_404(Order, pk=order_id, user=request.user)
 
-        payment = Payment.objects.create(
-            order=order,
-            payment_method=payment_method,
-            amount=order.total_amount,
-            status='pending'
-        )
-
-        if payment_method == 'cod':
-            payment.status = 'completed'
-            payment.save()
-            
-            order.status = 'confirmed'
-            order.confirmed_at = timezone.now()
-            order.save()
-            
-            OrderTracking.objects.create(
-                order=order,
-                status='confirmed',
-                message='Order confirmed - Cash on Delivery'
-            )
+        try:
+            with transaction.atomic():
+                # Cash on delivery confirms the order straight away
+                cod = payment_method == 'cod'
+                payment = Payment.objects.create(
+                    order=order,
+                    payment_method=payment_method,
+                    amount=order.total_amount,
+                    status='completed' if cod else 'pending'
+                )
+                if cod:
+                    order_status.transition(
+                        order, 'confirmed', message='Order confirmed - Cash on Delivery',
+                    )
+        except order_status.InvalidTransition:
+            return Response({'error': 'Order is not awaiting payment'},
+                          status=status.HTTP_400_BAD_REQUEST)
 
         # TODO: Integrate payment gateway (Razorpay, Stripe, etc.)
         
@@ -1644,39 +1516,49 @@ class VerifyPaymentView(APIView):
     """Verify payment"""
     permission_classes = [IsAuthenticated]
 
+    @idempotent
     def post(self, request):
         payment_id = request.data.get('payment_id')
         transaction_id = request.data.get('transaction_id')
         
-        payment = get_object_or_404(Payment, pk=payment_id)
+        payment = get_object_or_404(Payment, pk=payment_id, order__user=request.user)
         
         # TODO: Verify with payment gateway
         
-        payment.status = 'completed'
-        payment.transaction_id = transaction_id
-        payment.save()
-        
-        order = payment.order
-        order.status = 'confirmed'
-        order.confirmed_at = timezone.now()
-        order.save()
-        
-        OrderTracking.objects.create(
-            order=order,
-            status='confirmed',
-            message='Payment successful - Order confirmed'
-        )
+        # Unverified: the consumer only marks the payment processing until
+        # the gateway confirms it
+        try:
+            payment_events.record({
+                'event': 'payment.captured',
+                'payment_id': str(payment.pk),
+                'transaction_id': transaction_id,
+                'amount': str(payment.amount),
+            }, source='client')
+        except payment_events.InvalidEvent as e:
+            return Response({'error': str(e)},
+                          status=status.HTTP_400_BAD_REQUEST)
         
-        return Response({'message': 'Payment verified'}, 
-                       status=status.HTTP_200_OK)
+        return Response({'message': 'Payment verification received'}, 
+                       status=status.HTTP_202_ACCEPTED)
 
 
 class PaymentCallbackView(APIView):
     """Payment gateway callback"""
     permission_classes = [AllowAny]
+    # Signed by the gateway; no session or token lookups
+    authentication_classes = []
 
     def post(self, request):
-        # TODO: Handle payment gateway callback
+        body = request.body
+        if not payment_events.verify_signature(body, request.META.get(payment_events.SIGNATURE_HEADER)):
+            return Response({'error': 'Invalid signature'},
+                          status=status.HTTP_403_FORBIDDEN)
+        try:
+            payment_events.record(json.loads(body))
+        except ValueError as e:  # malformed JSON or payment_events.InvalidEvent
+            return Response({'error': str(e)},
+                          status=status.HTTP_400_BAD_REQUEST)
+
         return Response({'message': 'Callback received'}, 
                        status=status.HTTP_200_OK)
 
@@ -1721,19 +1603,13 @@ class CreateReviewView(APIView):
                           status=status.HTTP_400_BAD_REQUEST)
 
         # Check if purchased
-        has_purchased = OrderItem.objects.filter(
-            order__user=request.user,
-            product=product,
-            order__status='delivered'
-        ).exists()
-
         review = Review.objects.create(
             user=request.user,
             product=product,
             rating=rating,
             title=title,
             comment=comment,
-            is_verified_purchase=has_purchased
+            is_verified_purchase=has_purchased(request.user, product)
         )
 
         return Response({
@@ -1773,23 +1649,53 @@ class UserDashboardView(APIView):
     def get(self, request):
         user = request.user
         
-        orders = Order.objects.filter(user=user)
-        
-        dashboard_data = {
-            'total_orders': orders.count(),
-            'pending_orders': orders.filter(status='pending').count(),
-            'completed_orders': orders.filter(status='delivered').count(),
-            'cancelled_orders': orders.filter(status='cancelled').count(),
-            'total_spent': orders.filter(status='delivered').aggregate(
-                total=Sum('total_amount'))['total'] or 0,
-            'wishlist_count': Wishlist.objects.filter(user=user).count(),
-            'cart_items': Cart.objects.filter(user=user).first().total_items if hasattr(user, 'cart') else 0,
-            'profile_completed': user.profile_completed,
-            'recent_orders': OrderSerializer(
-                orders.order_by('-created_at')[:5], many=True
-            ).data
-        }
+        # Counters: one cached query (user_stats.py)
+        dashboard_data = dict(get_user_stats(user.pk))
+        dashboard_data['profile_completed'] = user.profile_completed
+        dashboard_data['recent_orders'] = OrderSerializer(
+            with_order_summary(Order.objects.filter(user=user)).order_by('-created_at')[:5],
+            many=True
+        ).data
         
         return Response(dashboard_data, status=status.HTTP_200_OK)
-    
 
+
+# ==================== Reports ====================
+class SalesReportView(APIView):
+    """
+    Sales over ?start= .. ?end= (local ISO dates, default the last 30 days)
+    per ?interval= hour|day|month|year, optionally for a ?category= subtree.
+    Served from the sales rollups.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        from datetime import date
+        from .sales_rollups import sales_series, sales_totals
+
+        params = request.query_params
+        try:
+            end = date.fromisoformat(params['end']) if params.get('end') else timezone.localdate()
+            start = date.fromisoformat(params['start']) if params.get('start') else end - timedelta(days=29)
+            category = uuid.UUID(params['category']) if params.get('category') else None
+        except ValueError:
+            return Response({'error': 'Invalid start, end or category'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if start > end:
+            return Response({'error': 'start must not be after end'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        interval = params.get('interval', 'day')
+        try:
+            series = sales_series(start, end, interval, category)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            'start': start,
+            'end': end,
+            'interval': interval,
+            'category': category,
+            'totals': sales_totals(start, end, category),
+            'series': series,
+        }, status=status.HTTP_200_OK)
@@ -0,0 +1,175 @@
+# warming.py
+# Cache warming for the cached computations (cache_utils.COMPUTATIONS).
+#
+# Views read the hot storefront entries through named computations; this
+# module recomputes them ahead of users:
+#   * periodically, every computation (tasks.warm_caches on Celery beat),
+#   * shortly after an invalidation flush, the computations owned by the
+#     flushed tags (a burst shares one task, queued REWARM_DELAY seconds
+#     ahead; the next is queued once it has started).
+# Parameterized computations (the filtered product listing) are replayed
+# for their most requested argument combinations, counted per request in a
+# Redis sorted set (in-process without a Redis cache).
+
+from collections import Counter
+import json
+import logging
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .cache_utils import COMPUTATIONS, SharedStore, load_computations
+from .invalidation import register_flush_hook
+
+logger = logging.getLogger(__name__)
+
+USAGE_KEY_PREFIX = 'warm:usage:'
+REWARM_LOCK_PREFIX = 'warm:queued:'
+REWARM_DELAY = 5         # seconds; bursts of invalidations share one re-warm
+REWARM_LOCK_TIMEOUT = REWARM_DELAY * 6  # released by the task; outlives a busy queue
+POPULAR_LIMIT = 20       # argument combinations replayed per computation
+USAGE_KEEP = 500         # combinations kept in the usage counters
+
+
+# ==========================================
+# Usage Counters
+# ==========================================
+
+class LocalUsageStore:
+    """In-process store; used when no Redis cache is configured"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = {}
+
+    def increment(self, name, member):
+        with self._lock:
+            self._counts.setdefault(name, Counter())[member] += 1
+
+    def top(self, name, limit):
+        with self._lock:
+            return [member for member, _ in self._counts.get(name, Counter()).most_common(limit)]
+
+    def trim(self, name, keep):
+        with self._lock:
+            counts = self._counts.get(name)
+            if counts and len(counts) > keep:
+                self._counts[name] = Counter(dict(counts.most_common(keep)))
+
+    def reset(self):
+        with self._lock:
+            self._counts.clear()
+
+
+class RedisUsageStore:
+    """One sorted set per computation, member = JSON arguments"""
+
+    def __init__(self, client):
+        self.client = client
+
+    def increment(self, name, member):
+        self.client.zincrby(USAGE_KEY_PREFIX + name, 1, member)
+
+    def top(self, name, limit):
+        members = self.client.zrevrange(USAGE_KEY_PREFIX + name, 0, limit - 1)
+        return [m.decode() if isinstance(m, bytes) else m for m in members]
+
+    def trim(self, name, keep):
+        self.client.zremrangebyrank(USAGE_KEY_PREFIX + name, 0, -keep - 1)
+
+    def reset(self):
+        for key in self.client.scan_iter(match=USAGE_KEY_PREFIX + '*'):
+            self.client.delete(key)
+
+
+_stores = SharedStore('Cache warming usage', RedisUsageStore, LocalUsageStore)
+# Redis store when the default cache is django-redis, otherwise local
+get_store = _stores.get
+reset_store = _stores.reset
+
+
+def record_usage(name, params):
+    """Count one request for the ``name`` computation with ``params``"""
+    try:
+        get_store().increment(name, json.dumps(params, sort_keys=True))
+    except Exception as e:
+        logger.warning(f"Could not record usage of {name}: {e}")
+
+
+def popular_params(name, limit=POPULAR_LIMIT):
+    """Most requested argument dicts for ``name``"""
+    try:
+        return [json.loads(member) for member in get_store().top(name, limit)]
+    except Exception as e:
+        logger.warning(f"Could not read usage of {name}: {e}")
+        return []
+
+
+# ==========================================
+# Warming
+# ==========================================
+
+def computations_for_tags(tags):
+    """Names of the computations dropped by any of ``tags``"""
+    load_computations()
+    tags = set(tags)
+    return sorted(name for name, computation in COMPUTATIONS.items() if computation.tags & tags)
+
+
+def warm(names=None, popular_limit=POPULAR_LIMIT):
+    """Recompute ``names`` (all computations if None); returns {name: entries warmed}"""
+    load_computations()
+    names = list(COMPUTATIONS) if names is None else names
+    warmed = {}
+    for name in names:
+        computation = COMPUTATIONS.get(name)
+        if computation is None:
+            logger.warning(f"Unknown cached computation: {name}")
+            continue
+        if computation.parameterized:
+            store = get_store()
+            store.trim(name, USAGE_KEEP)
+            calls = popular_params(name, popular_limit)
+        else:
+            calls = [{}]
+
+        warmed[name] = 0
+        for params in calls:
+            try:
+                computation.warm(**params)
+                warmed[name] += 1
+            except Exception as e:
+                logger.warning(f"Warming {name} {params} failed: {e}")
+    return warmed
+
+
+def queue_rewarm(tags):
+    """Flush hook: queue a re-warm of the computations behind ``tags``"""
+    if not tags or not getattr(settings, 'CACHE_WARMING_ENABLED', True):
+        return
+    # cache.add() lets the first flush of a burst queue the task; the task
+    # runs after the burst, so it sees all of it. The lock is held until the
+    # task starts (release_rewarm), not just for the countdown, so a task
+    # still waiting in the queue is not joined by a duplicate.
+    fresh = [tag for tag in sorted(tags) if cache.add(f'{REWARM_LOCK_PREFIX}{tag}', 1, REWARM_LOCK_TIMEOUT)]
+    names = computations_for_tags(fresh)
+    if not names:
+        release_rewarm(fresh)
+        return
+    from .tasks import warm_caches
+
+    try:
+        warm_caches.apply_async(kwargs={'names': names, 'tags': fresh}, countdown=REWARM_DELAY)
+    except Exception as e:
+        logger.warning(f"Could not queue a re-warm of {names}: {e}")
+        release_rewarm(fresh)
+
+
+def release_rewarm(tags):
+    """Let the next flush of ``tags`` queue a re-warm again"""
+    if tags:
+        cache.delete_many([f'{REWARM_LOCK_PREFIX}{tag}' for tag in tags])
+
+
+register_flush_hook(queue_rewarm)